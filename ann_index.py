@@ -0,0 +1,212 @@
+"""
+SageAlpha.ai Approximate Nearest-Neighbour Index
+Pure-NumPy IVF-flat index used by VectorStore for large corpora
+"""
+
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+class IVFIndex:
+    """
+    Inverted-file (IVF-flat) index over unit-normalized embeddings.
+
+    Vectors are assigned to the nearest of nlist k-means centroids. A query
+    only scores the rows of its nprobe closest lists, trading recall for
+    latency. The index stores row ids only; vectors stay in the VectorStore.
+    """
+
+    def __init__(self, dim: int, nlist: int, nprobe: int = 8) -> None:
+        """
+        Initialize an untrained index.
+
+        Args:
+            dim: Embedding dimension
+            nlist: Number of inverted lists (k-means centroids)
+            nprobe: Default number of lists scanned per query
+        """
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.centroids: Optional[np.ndarray] = None
+        self.ntotal = 0
+        self.trained_rows = 0
+
+        # Per-list row ids, grown geometrically like the store's delta buffer
+        self._lists: List[np.ndarray] = []
+        self._sizes = np.zeros(nlist, dtype=np.int64)
+
+    @property
+    def is_trained(self) -> bool:
+        """Whether centroids have been computed."""
+        return self.centroids is not None
+
+    @staticmethod
+    def default_nlist(rows: int) -> int:
+        """Pick a list count of roughly 4 * sqrt(rows)."""
+        return int(min(65536, max(16, 4 * np.sqrt(max(rows, 1)))))
+
+    def train(
+        self, vectors: np.ndarray, iterations: int = 10, seed: int = 0
+    ) -> None:
+        """
+        Compute centroids with spherical k-means.
+
+        Args:
+            vectors: Training sample (rows are unit-normalized embeddings)
+            iterations: Number of Lloyd iterations
+            seed: Random seed for centroid initialization
+        """
+        rng = np.random.default_rng(seed)
+        x = np.ascontiguousarray(vectors, dtype=np.float32)
+        nlist = min(self.nlist, x.shape[0])
+
+        centroids = x[rng.choice(x.shape[0], nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = self._nearest(x, centroids)
+            order = np.argsort(assign, kind="stable")
+            lists, starts = np.unique(assign[order], return_index=True)
+            sums = np.zeros_like(centroids)
+            sums[lists] = np.add.reduceat(x[order], starts, axis=0)
+            counts = np.bincount(assign, minlength=nlist)
+
+            # Re-seed empty lists from random training rows
+            empty = np.flatnonzero(counts == 0)
+            if empty.size:
+                sums[empty] = x[rng.choice(x.shape[0], empty.size)]
+
+            centroids = sums / (np.linalg.norm(sums, axis=1, keepdims=True) + 1e-10)
+
+        self.nlist = nlist
+        self.centroids = centroids.astype(np.float32)
+        self._lists = [np.empty(16, dtype=np.int64) for _ in range(nlist)]
+        self._sizes = np.zeros(nlist, dtype=np.int64)
+        self.ntotal = 0
+        self.trained_rows = x.shape[0]
+
+    @staticmethod
+    def _nearest(
+        x: np.ndarray, centroids: np.ndarray, batch: int = 8192
+    ) -> np.ndarray:
+        """Return the index of the nearest centroid for each row of x."""
+        out = np.empty(x.shape[0], dtype=np.int64)
+        for start in range(0, x.shape[0], batch):
+            out[start : start + batch] = np.argmax(
+                x[start : start + batch] @ centroids.T, axis=1
+            )
+        return out
+
+    def add(self, vectors: np.ndarray) -> None:
+        """
+        Append vectors; their row ids continue from ntotal.
+
+        Args:
+            vectors: Rows to index, in store order
+        """
+        if not self.is_trained or len(vectors) == 0:
+            return
+
+        assign = self._nearest(np.asarray(vectors, dtype=np.float32), self.centroids)
+        rows = np.arange(self.ntotal, self.ntotal + len(assign), dtype=np.int64)
+        order = np.argsort(assign, kind="stable")
+        lists, starts = np.unique(assign[order], return_index=True)
+        bounds = list(starts[1:]) + [len(order)]
+
+        for list_id, start, end in zip(lists, starts, bounds):
+            self._append_list(int(list_id), rows[order[start:end]])
+
+        self.ntotal += len(assign)
+
+    def _append_list(self, list_id: int, rows: np.ndarray) -> None:
+        """Append row ids to one inverted list."""
+        size = self._sizes[list_id]
+        buf = self._lists[list_id]
+        if size + len(rows) > len(buf):
+            grown = np.empty(max(size + len(rows), 2 * len(buf)), dtype=np.int64)
+            grown[:size] = buf[:size]
+            self._lists[list_id] = buf = grown
+        buf[size : size + len(rows)] = rows
+        self._sizes[list_id] = size + len(rows)
+
+    def candidates(self, query: np.ndarray, nprobe: Optional[int] = None) -> np.ndarray:
+        """
+        Return the row ids stored in the lists closest to the query.
+
+        Args:
+            query: Unit-normalized query vector
+            nprobe: Lists to scan (defaults to the index setting)
+
+        Returns:
+            Array of candidate row ids
+        """
+        if not self.is_trained:
+            return np.empty(0, dtype=np.int64)
+
+        nprobe = max(1, min(nprobe or self.nprobe, self.nlist))
+        scores = self.centroids @ query
+        if nprobe < self.nlist:
+            probes = np.argpartition(-scores, nprobe - 1)[:nprobe]
+        else:
+            probes = np.arange(self.nlist)
+
+        parts = [self._lists[p][: self._sizes[p]] for p in probes]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    def save(self, path: str, **extra: int) -> None:
+        """
+        Persist the index atomically as a .npz file.
+
+        Args:
+            path: Destination file path
+            extra: Additional integer fields stored alongside the index
+        """
+        if not self.is_trained:
+            return
+
+        ids = np.concatenate(
+            [self._lists[i][: self._sizes[i]] for i in range(self.nlist)]
+        )
+        offsets = np.concatenate([[0], np.cumsum(self._sizes)])
+        tmp_path = path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            centroids=self.centroids,
+            ids=ids,
+            offsets=offsets,
+            ntotal=self.ntotal,
+            trained_rows=self.trained_rows,
+            nprobe=self.nprobe,
+            **extra,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Tuple["IVFIndex", Dict[str, int]]:
+        """
+        Load an index saved with save().
+
+        Args:
+            path: Path of the .npz file
+
+        Returns:
+            Tuple of (index, extra integer fields)
+        """
+        with np.load(path) as data:
+            centroids = data["centroids"]
+            index = cls(centroids.shape[1], centroids.shape[0], int(data["nprobe"]))
+            index.centroids = centroids
+            index.ntotal = int(data["ntotal"])
+            index.trained_rows = int(data["trained_rows"])
+
+            ids, offsets = data["ids"], data["offsets"]
+            index._lists = [
+                ids[offsets[i] : offsets[i + 1]].copy() for i in range(index.nlist)
+            ]
+            index._sizes = np.diff(offsets).astype(np.int64)
+
+            known = {"centroids", "ids", "offsets", "ntotal", "trained_rows", "nprobe"}
+            extra = {k: int(data[k]) for k in data.files if k not in known}
+
+        return index, extra
@@ -3,10 +3,11 @@ SageAlpha.ai v3.0 - 2025 Flask Application
 Modern Flask 3.x with Blueprints, SocketIO, and async support
 """
 
-import io
+import json
 import logging
 import os
 import re
+import time
 from datetime import datetime
 from functools import wraps
 from uuid import uuid4
@@ -19,12 +20,14 @@ import pandas as pd
 from dotenv import load_dotenv
 from flask import (
     Flask,
+    Response,
     jsonify,
     make_response,
     redirect,
     render_template,
     request,
     session,
+    stream_with_context,
     url_for,
 )
 from flask_cors import CORS
@@ -47,6 +50,7 @@ from blueprints.chat import (
     extract_topic,
     get_db_session,
     get_current_user_id,
+    get_reply_message,
     save_message,
     update_session_title,
 )
@@ -69,7 +73,29 @@ from db_sqlite import (
 )
 print("[startup] DB backend: SQLite")
 
-from extractor import extract_text_from_pdf_bytes, parse_xbrl_file_to_text
+from chunker import iter_chunks
+from extraction_cache import EXTRACTION_CACHE_ENABLED, ExtractionCache, doc_key, file_key
+from extraction_pool import extraction_pool_stats
+from extractor import (
+    extract_pdf_pages,
+    extract_tables_from_text,
+    extract_text_from_pdf_bytes,
+    iter_pdf_file_pages,
+    parse_xbrl_file_to_text,
+)
+from llm_gateway import LLM_BASE_URL, LLMGateway
+from normalize import strip_markdown
+from response_cache import RESPONSE_CACHE_ENABLED, CachedResponse, ResponseCache
+from retrieval import (
+    RETRIEVAL_AZURE_TIMEOUT,
+    RETRIEVAL_LOCAL_TIMEOUT,
+    RETRIEVAL_SESSION_TIMEOUT,
+    RetrievalSource,
+    Retriever,
+    filter_relevant,
+)
+from search_batcher import SearchBatcher
+from singleflight import SingleFlight, request_key
 from vector_store import VectorStore
 from report_generator import generate_report_pdf, generate_equity_research_html
 
@@ -114,6 +140,15 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 # Mock mode for testing without any API key
 MOCK_LLM = os.getenv("MOCK_LLM", "false").lower() in ("1", "true", "yes")
 
+# Uploads: chunks embedded and appended per batch (each batch is searchable at once)
+UPLOAD_INDEX_BATCH = int(os.getenv("UPLOAD_INDEX_BATCH", "64"))
+
+# Mock mode: seconds between streamed words (simulates model latency)
+MOCK_STREAM_DELAY = float(os.getenv("MOCK_STREAM_DELAY", "0.02"))
+
+# Completion parameters for chat answers (temperature 0, so answers can be cached)
+ANSWER_PARAMS = {"max_tokens": 800, "temperature": 0.0, "top_p": 0.95}
+
 # ==================== LLM Client with Fallback ====================
 LLM_MODE = "none"  # Will be set during initialization: "azure", "openai", "mock", "none"
 _llm_client = None
@@ -131,10 +166,23 @@ class MockLLMClient:
         def __init__(self, content: str):
             self.choices = [MockLLMClient.MockCompletion(content)]
     
+    class MockChunk:
+        """Streaming chunk shaped like the OpenAI SDK's ChatCompletionChunk."""
+        def __init__(self, delta: str):
+            choice = type("Choice", (), {"delta": type("Delta", (), {"content": delta})()})()
+            self.choices = [choice]
+    
+    @staticmethod
+    def stream_chunks(content: str):
+        """Yield a response word by word, paced like a real model."""
+        for token in re.findall(r"\S+\s*|\s+", content):
+            time.sleep(MOCK_STREAM_DELAY)
+            yield MockLLMClient.MockChunk(token)
+    
     class MockChat:
         class Completions:
             @staticmethod
-            def create(model: str, messages: list, **kwargs) -> "MockLLMClient.MockResponse":
+            def create(model: str, messages: list, **kwargs):
                 # Extract the user's last message
                 user_msg = ""
                 for msg in reversed(messages):
@@ -160,6 +208,8 @@ To enable full AI analysis:
 
 This is a demo response for testing the UI flow."""
                 
+                if kwargs.get("stream"):
+                    return MockLLMClient.stream_chunks(response)
                 return MockLLMClient.MockResponse(response)
         
         completions = Completions()
@@ -171,13 +221,14 @@ def init_llm_client():
     """Initialize LLM client with fallback: Azure OpenAI → OpenAI → Mock → None."""
     global _llm_client, LLM_MODE
     
+    # Real backends go through the gateway (pooling, rate limits, retries, hedging)
     # Priority 1: Azure OpenAI (production)
     if AZURE_OPENAI_ENDPOINT and AZURE_OPENAI_API_KEY:
         try:
-            from openai import AzureOpenAI
-            _llm_client = AzureOpenAI(
-                azure_endpoint=AZURE_OPENAI_ENDPOINT,
+            _llm_client = LLMGateway(
+                "azure",
                 api_key=AZURE_OPENAI_API_KEY,
+                endpoint=AZURE_OPENAI_ENDPOINT,
                 api_version=AZURE_OPENAI_API_VERSION,
             )
             LLM_MODE = "azure"
@@ -189,10 +240,9 @@ def init_llm_client():
     # Priority 2: Standard OpenAI (local dev with API key)
     if OPENAI_API_KEY:
         try:
-            from openai import OpenAI
-            _llm_client = OpenAI(api_key=OPENAI_API_KEY)
+            _llm_client = LLMGateway("openai", api_key=OPENAI_API_KEY, endpoint=LLM_BASE_URL)
             LLM_MODE = "openai"
-            print("[startup] ✓ LLM: OpenAI initialized")
+            print(f"[startup] ✓ LLM: OpenAI initialized{f' ({LLM_BASE_URL})' if LLM_BASE_URL else ''}")
             return _llm_client
         except Exception as e:
             print(f"[startup] ✗ OpenAI failed: {e}")
@@ -393,6 +443,38 @@ VECTOR_STORE_DIR = "vector_store_data"
 os.makedirs(VECTOR_STORE_DIR, exist_ok=True)
 vs = VectorStore(store_dir=VECTOR_STORE_DIR)
 
+# Extracted PDF pages keyed by content hash (skips re-download and re-parse)
+extraction_cache = None
+if EXTRACTION_CACHE_ENABLED:
+    try:
+        extraction_cache = ExtractionCache(
+            os.getenv("EXTRACTION_CACHE_PATH")
+            or os.path.join(VECTOR_STORE_DIR, "extraction_cache.sqlite3")
+        )
+    except Exception as e:
+        print(f"[startup][WARN] Extraction cache disabled: {e!r}")
+
+# Answers to repeated questions (skips retrieval and the LLM on a hit)
+response_cache = None
+if RESPONSE_CACHE_ENABLED:
+    try:
+        response_cache = ResponseCache(
+            os.getenv("RESPONSE_CACHE_PATH")
+            or os.path.join(VECTOR_STORE_DIR, "response_cache.sqlite3")
+        )
+    except Exception as e:
+        print(f"[startup][WARN] Response cache disabled: {e!r}")
+
+# Identical concurrent searches and report generations share one call
+search_flight = SingleFlight("search")
+report_flight = SingleFlight("report")
+
+# Azure Search, the local vector store and session uploads are queried in parallel
+retriever = Retriever()
+
+# Concurrent local vector searches are scored together via vs.search_many
+search_batcher = SearchBatcher(vs)
+
 # Upload directory
 UPLOAD_DIR = os.path.join(os.path.dirname(__file__), "uploads")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
@@ -401,27 +483,147 @@ os.makedirs(UPLOAD_DIR, exist_ok=True)
 # ==================== Helper Functions ====================
 
 
-def strip_markdown(text: str) -> str:
-    """Remove markdown formatting from text."""
-    if not text:
-        return text
-    text = re.sub(r"```.*?```", "", text, flags=re.DOTALL)
-    text = re.sub(r"(^|\n)#{1,6}\s*", r"\1", text)
-    text = re.sub(r"\*\*(.*?)\*\*", r"\1", text)
-    text = re.sub(r"\*(.*?)\*", r"\1", text)
-    text = re.sub(r"__(.*?)__", r"\1", text)
-    text = re.sub(r"_(.*?)_", r"\1", text)
-    text = re.sub(r"(^|\n)[\-\*\+]\s+", r"\1", text)
-    text = re.sub(r"\n[-*_]{3,}\n", "\n", text)
-    text = re.sub(r"\n{3,}", "\n\n", text)
-    return text.strip()
+def stream_chat_completion(llm, messages: list, **params):
+    """
+    Stream a chat completion as text deltas.
+
+    Args:
+        llm: LLM client (OpenAI, Azure OpenAI or mock)
+        messages: Chat messages
+        **params: Extra completion parameters (max_tokens, temperature, ...)
+
+    Yields:
+        Non-empty content deltas in order
+    """
+    started = time.perf_counter()
+    first = True
+    stream = llm.chat.completions.create(
+        model=get_llm_model(), messages=messages, stream=True, **params
+    )
+    for chunk in stream:
+        # Azure sends a leading chunk with content-filter results and no choices
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if not delta:
+            continue
+        if first:
+            print(f"[llm] Time to first token: {time.perf_counter() - started:.2f}s")
+            first = False
+        yield delta
+
+
+def sse_event(event: str, data: dict) -> str:
+    """Format one Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def settle_streamed_sections(sections: list, history: list, user_id) -> list:
+    """
+    Fill in the answers of streamed turns recorded as pending in the cookie
+    session, from the assistant messages saved to the database.
+
+    Pending turns without a saved answer (the stream failed) are dropped.
+
+    Args:
+        sections: Session memory sections (settled in place)
+        history: Session history (settled answers are appended)
+        user_id: Current user (owner of the database session)
+
+    Returns:
+        The settled sections
+    """
+    if not any(s.get("pending") for s in sections):
+        return sections
+    settled = []
+    for section in sections:
+        pending = section.pop("pending", None)
+        if pending:
+            answer = user_id and get_reply_message(pending["session_id"], user_id, pending["after"])
+            if not answer:
+                continue
+            section["answer"] = answer
+            history.append({"role": "assistant", "content": answer})
+        settled.append(section)
+    session["history"] = history
+    session["sections"] = settled
+    return settled
+
+
+def lookup_cached_answer(
+    user_msg: str, top_k: int, extra_system_msgs: list | None = None, session_id: str | None = None
+) -> tuple[CachedResponse | None, dict | None]:
+    """
+    Look up a cached answer before retrieval.
+
+    Args:
+        user_msg: User question
+        top_k: Documents to be retrieved (part of the key)
+        extra_system_msgs: Session memory messages
+        session_id: Chat session (scopes the entry when its own uploads are searched)
+
+    Returns:
+        (cache hit or None, pending entry for store_cached_answer or None
+        when caching is off)
+    """
+    if response_cache is None:
+        return None, None
+
+    # Answers drawing on this session's uploads are only reused within it.
+    # Decided by what retrieval will search (the store), not by the
+    # in-memory upload list, which is empty after a restart or on another worker
+    scoped = session_id and vs.has_documents({"session_id": session_id})
+    pending = {
+        "model": get_llm_model(),
+        "messages": build_hybrid_messages(user_msg, [], extra_system_msgs),
+        "params": {**ANSWER_PARAMS, "top_k": top_k},
+        "scope": session_id if scoped else None,
+        "embedding": None,
+    }
+    started = time.perf_counter()
+    try:
+        # Local-mode embeddings are hashes, useless for similarity
+        if response_cache.similarity > 0 and not vs.local_mode:
+            pending["embedding"] = vs.embed(user_msg)[0]
+        hit = response_cache.get(**pending)
+    except Exception as e:
+        print(f"[ResponseCache] Lookup failed: {e}")
+        return None, None
+
+    if hit is not None:
+        print(f"[ResponseCache] {hit.tier} hit (similarity {hit.similarity:.3f}, age {hit.age:.0f}s)")
+    pending["started"] = started
+    return hit, pending
+
+
+def store_cached_answer(pending: dict | None, user_msg: str, answer: str, sources: list) -> None:
+    """Cache a fresh answer, tagged with the company it is about."""
+    if response_cache is None or pending is None or not answer:
+        return
+    companies = []
+    company_info = extract_company_from_message(user_msg)
+    if company_info:
+        companies = [c for c in company_info if c]
+    latency = time.perf_counter() - pending.pop("started")
+    try:
+        response_cache.put(
+            answer=answer, sources=sources, latency=latency, companies=companies, **pending
+        )
+    except Exception as e:
+        print(f"[ResponseCache] Write failed: {e}")
 
 
 def search_azure(query_text: str, top_k: int = 5) -> list:
-    """Search Azure Cognitive Search index."""
+    """Search Azure Cognitive Search index (identical concurrent queries share one search)."""
     if not search_client or not query_text:
         return []
+    return search_flight.do(
+        request_key(query_text, top_k, casefold=True), _search_azure, query_text, top_k
+    )
 
+
+def _search_azure(query_text: str, top_k: int) -> list:
+    """Run one Azure Cognitive Search query and normalize the hits."""
     search_kwargs = {"search_text": query_text, "top": top_k}
 
     if AZURE_SEARCH_SEMANTIC_CONFIG:
@@ -457,14 +659,100 @@ def search_azure(query_text: str, top_k: int = 5) -> list:
     return output
 
 
+def generate_report_html(llm, company: str, user_message: str, context_text: str = "") -> str:
+    """
+    Generate an equity research report, sharing one generation among
+    identical concurrent requests (e.g. a report link opened by a team).
+
+    Args:
+        llm: LLM client
+        company: Company name
+        user_message: Request text passed to the prompt
+        context_text: Retrieved context
+
+    Returns:
+        Report HTML
+    """
+    model = get_llm_model()
+    key = request_key(model, company, user_message, context_text, casefold=True)
+    return report_flight.do(
+        key, generate_equity_research_html, llm, model, company, user_message, context_text
+    )
+
+
+def retrieval_sources(session_id: str | None = None, query_vector=None) -> list:
+    """
+    Sources for one retrieval: Azure Search, shared local documents and
+    this session's uploads (the local ones share one query embedding).
+
+    Temporary per-request PDF context of in-flight /query calls is never
+    returned.
+
+    Args:
+        session_id: Chat session whose uploads are searched
+        query_vector: Query embedding for the local sources (they are left
+            out without one)
+
+    Returns:
+        List of RetrievalSource
+    """
+    sources = []
+    if search_client:
+        sources.append(
+            RetrievalSource("azure", search_azure, RETRIEVAL_AZURE_TIMEOUT, scores="relative")
+        )
+    if query_vector is None or not vs.get_document_count():
+        return sources
+
+    def local(where: dict):
+        def search(query: str, k: int) -> list:
+            return search_batcher.search(
+                query, k=k, filter=where, query_vector=query_vector, include_temporary=False
+            )
+
+        return search
+
+    sources.append(RetrievalSource("vectors", local({"session_id": None}), RETRIEVAL_LOCAL_TIMEOUT))
+    if session_id:
+        sources.append(
+            RetrievalSource("session", local({"session_id": session_id}), RETRIEVAL_SESSION_TIMEOUT)
+        )
+    return sources
+
+
+def retrieve_documents(
+    query: str, top_k: int = 5, session_id: str | None = None, query_vector=None
+) -> list:
+    """
+    Retrieve context from all sources in parallel, merged by reciprocal-rank fusion.
+
+    A source that misses its deadline or fails is left out, so retrieval
+    takes as long as the slowest source within budget. The query is
+    embedded before the fan-out, so embedding latency does not count
+    against the local sources' deadlines.
+
+    Args:
+        query: User question
+        top_k: Number of merged results
+        session_id: Chat session whose uploads are searched
+        query_vector: Query embedding if already computed (e.g. by the response cache)
+
+    Returns:
+        List of results with doc_id, text, meta, normalized score and sources
+    """
+    if query_vector is None and query and vs.get_document_count():
+        try:
+            query_vector = vs.embed(query)[0]
+        except Exception as e:
+            print(f"[retrieval] Query embedding failed, skipping local sources: {e!r}")
+    return retriever.retrieve(query, retrieval_sources(session_id, query_vector), k=top_k)
+
+
 def build_hybrid_messages(
     user_msg: str, retrieved_docs: list, extra_system_msgs: list | None = None
 ) -> list:
     """Build messages for hybrid RAG."""
-    relevance_threshold = 0.35
-    relevant_docs = [
-        r for r in retrieved_docs if r.get("score", 0.0) >= relevance_threshold
-    ]
+    relevant_docs = filter_relevant(retrieved_docs)
 
     if relevant_docs:
         context_chunks = [
@@ -524,6 +812,15 @@ def api_status():
         "llm_ready": LLM_MODE != "none",
         "search_ready": search_client is not None,
         "blob_ready": blob_reader is not None,
+        "embedding_cache": vs.embedding_cache.stats() if vs.embedding_cache else None,
+        "extraction_cache": extraction_cache.stats() if extraction_cache else None,
+        "dedup": vs.deduplicator.stats() if vs.deduplicator else None,
+        "extraction_pool": extraction_pool_stats(),
+        "response_cache": response_cache.stats() if response_cache else None,
+        "llm_gateway": _llm_client.stats() if isinstance(_llm_client, LLMGateway) else None,
+        "coalescing": {"search": search_flight.stats(), "report": report_flight.stats()},
+        "retrieval": retriever.stats(),
+        "search_batching": search_batcher.stats(),
     })
 
 
@@ -558,6 +855,7 @@ def chat():
     # =====================================================
     # DATABASE-BACKED MESSAGE PERSISTENCE
     # =====================================================
+    user_message_id = None
     if user_id:
         # Check if we have a session_id, if not create one
         if not chat_session_id:
@@ -571,7 +869,7 @@ def chat():
         
         # Save user message to database
         if chat_session_id:
-            save_message(chat_session_id, user_id, "user", user_msg)
+            user_message_id = save_message(chat_session_id, user_id, "user", user_msg)
             
             # Update session title if this is the first message
             if db_session and (not db_session.get("title") or db_session.get("title") == "New Chat"):
@@ -592,7 +890,7 @@ def chat():
         session["current_topic"] = ""
 
     history = session["history"]
-    sections = session["sections"]
+    sections = settle_streamed_sections(session["sections"], history, user_id)
     last_topic = session.get("current_topic", "")
 
     current_topic = extract_topic(user_msg, last_topic)
@@ -611,32 +909,54 @@ def chat():
         )
 
     top_k = int(payload.get("top_k", 5))
-    retrieved = search_azure(user_msg, top_k)
-    if not retrieved and search_client is None:
-        retrieved = vs.search(user_msg, k=top_k)
-
-    messages = build_hybrid_messages(user_msg, retrieved, extra_system_msgs)
+    cached, pending = lookup_cached_answer(user_msg, top_k, extra_system_msgs, chat_session_id)
+    if cached is not None:
+        messages = []
+        sources = cached.sources
+    else:
+        retrieved = retrieve_documents(
+            user_msg, top_k, chat_session_id, pending and pending["embedding"]
+        )
+        messages = build_hybrid_messages(user_msg, retrieved, extra_system_msgs)
+        sources = [
+            {
+                "doc_id": r["doc_id"],
+                "source": r["meta"].get("source"),
+                "score": float(r["score"]),
+            }
+            for r in retrieved
+        ]
 
-    try:
+    def complete() -> str:
+        """Return the cached answer or generate one (non-streaming)."""
+        if cached is not None:
+            return cached.answer
         response = llm.chat.completions.create(
-            model=get_llm_model(),
-            messages=messages,
-            max_tokens=800,
-            temperature=0.0,
-            top_p=0.95,
+            model=get_llm_model(), messages=messages, **ANSWER_PARAMS
         )
         ai_msg = response.choices[0].message.content
+        store_cached_answer(pending, user_msg, ai_msg, sources)
+        return ai_msg
 
-        history.append({"role": "assistant", "content": ai_msg})
-        sections.append(
-            {
-                "timestamp": datetime.utcnow().isoformat(),
-                "query": user_msg,
-                "answer": ai_msg,
-            }
-        )
-        session["history"] = history
-        session["sections"] = sections
+    def finish(ai_msg: str, msg_id: str, remember: bool = True) -> dict:
+        """
+        Record the answer and build the response payload.
+
+        remember=False leaves the cookie session alone: a streamed turn was
+        recorded there as pending before streaming and is settled from the
+        database on the next request.
+        """
+        if remember:
+            history.append({"role": "assistant", "content": ai_msg})
+            sections.append(
+                {
+                    "timestamp": datetime.utcnow().isoformat(),
+                    "query": user_msg,
+                    "answer": ai_msg,
+                }
+            )
+            session["history"] = history
+            session["sections"] = sections
 
         # =====================================================
         # SAVE ASSISTANT MESSAGE TO DATABASE
@@ -658,28 +978,75 @@ def chat():
                 if portfolio_item_id:
                     print(f"[chat] Auto-added company to portfolio: {company_name} ({ticker})")
 
-        sources = [
-            {
-                "doc_id": r["doc_id"],
-                "source": r["meta"].get("source"),
-                "score": float(r["score"]),
-            }
-            for r in retrieved
-        ]
+        message_obj = {"id": msg_id, "role": "assistant", "content": ai_msg}
+        return {
+            "id": msg_id,
+            "response": ai_msg,
+            "message": message_obj,
+            "data": message_obj,
+            "sources": sources,
+            "session_id": chat_session_id,  # Return session ID for client
+            "cached": cached.tier if cached else None,
+        }
 
+    # =====================================================
+    # STREAMING (Server-Sent Events)
+    # "token" events carry deltas, "done" carries the usual JSON payload.
+    # The cookie session cannot change once the headers are sent, so the
+    # turn is stored in it as pending first; the streamed answer is saved
+    # to the database and settled into the session memory on the next
+    # request. Without a database session there is nowhere to settle it
+    # from, so the answer is generated in full and sent as one token.
+    # =====================================================
+    if payload.get("stream") or request.accept_mimetypes.best == "text/event-stream":
         msg_id = str(uuid4())
-        message_obj = {"id": msg_id, "role": "assistant", "content": ai_msg}
+        headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
 
-        return jsonify(
+        if user_message_id is None:
+            try:
+                body = finish(complete(), msg_id)
+                events = [
+                    sse_event("token", {"id": msg_id, "token": body["response"]}),
+                    sse_event("done", body),
+                ]
+            except Exception as e:
+                print(f"[chat][ERROR] {e!r}")
+                events = [sse_event("error", {"id": msg_id, "error": str(e)})]
+            return Response(events, mimetype="text/event-stream", headers=headers)
+
+        sections.append(
             {
-                "id": msg_id,
-                "response": ai_msg,
-                "message": message_obj,
-                "data": message_obj,
-                "sources": sources,
-                "session_id": chat_session_id,  # Return session ID for client
+                "timestamp": datetime.utcnow().isoformat(),
+                "query": user_msg,
+                "answer": "",
+                "pending": {"session_id": chat_session_id, "after": user_message_id},
             }
         )
+        session["history"] = history
+        session["sections"] = sections
+
+        def generate():
+            parts = []
+            try:
+                if cached is not None:
+                    parts.append(cached.answer)
+                    yield sse_event("token", {"id": msg_id, "token": cached.answer})
+                else:
+                    for delta in stream_chat_completion(llm, messages, **ANSWER_PARAMS):
+                        parts.append(delta)
+                        yield sse_event("token", {"id": msg_id, "token": delta})
+                    store_cached_answer(pending, user_msg, "".join(parts), sources)
+                yield sse_event("done", finish("".join(parts), msg_id, remember=False))
+            except Exception as e:
+                print(f"[chat][ERROR] {e!r}")
+                yield sse_event("error", {"id": msg_id, "error": str(e)})
+
+        return Response(
+            stream_with_context(generate()), mimetype="text/event-stream", headers=headers
+        )
+
+    try:
+        return jsonify(finish(complete(), str(uuid4())))
 
     except Exception as e:
         error_msg = f"Backend error: {e!s}"
@@ -775,9 +1142,7 @@ def chat_session():
         )
 
     top_k = int(payload.get("top_k", 5))
-    retrieved = search_azure(user_msg, top_k)
-    if not retrieved and search_client is None:
-        retrieved = vs.search(user_msg, k=top_k)
+    retrieved = retrieve_documents(user_msg, top_k, session_id)
 
     # ==================== PDF INTENT DETECTION ====================
     # Broadened keywords to capture "financial questions" as requested
@@ -823,10 +1188,7 @@ def chat_session():
     if is_research_request:
         # SKIP LLM call entirely for reports
         # Construct context text for the report generator
-        relevance_threshold = 0.35
-        relevant_docs = [
-            r for r in retrieved if r.get("score", 0.0) >= relevance_threshold
-        ]
+        relevant_docs = filter_relevant(retrieved)
         context_text = ""
         if relevant_docs:
             context_chunks = [
@@ -837,7 +1199,7 @@ def chat_session():
             context_text = "\n\n".join(context_chunks)[:10000]
 
         # Generate dynamic equity research report using LLM for content only
-        report_html = generate_equity_research_html(llm, get_llm_model(), company, user_msg, context_text)
+        report_html = generate_report_html(llm, company, user_msg, context_text)
 
         # FORCE set report_title
         report_title = f"{company.replace(' ', '_').upper()} Research Report"
@@ -926,24 +1288,26 @@ def query():
     top_k = int(payload.get("top_k", 5))
     fetch_pdf = bool(payload.get("fetch_pdf", True))
 
+    # Temporary PDF context is scoped to this request so concurrent
+    # queries don't see or clear each other's documents
+    temp_scope = str(uuid4())
+
     results = search_azure(q, top_k)
     if not results and search_client is None:
-        results = vs.search(q, k=top_k)
+        results = vs.search(q, k=top_k, scope=temp_scope, filter={"session_id": None})
 
     for r in results:
         att = r.get("meta", {}).get("attachment") or ""
         if not fetch_pdf or not att or not blob_reader:
             continue
         try:
-            if att.startswith("https://"):
-                pdf_bytes = blob_reader.download_blob_url_to_bytes(att)
-            else:
-                pdf_bytes = blob_reader.download_blob_to_bytes(att)
-            extracted = extract_text_from_pdf_bytes(pdf_bytes)
+            extracted = extract_attachment_text(att)
             meta = {"source": f"pdf_temp:{att}", "attachment": att}
             temp_doc_id = f"temp_pdf::{att}"
             try:
-                vs.add_temporary_document(doc_id=temp_doc_id, text=extracted, meta=meta)
+                vs.add_temporary_document(
+                    doc_id=temp_doc_id, text=extracted, meta=meta, scope=temp_scope
+                )
             except Exception:
                 pass
         except Exception as e:
@@ -952,7 +1316,9 @@ def query():
     if search_client:
         final_results = search_azure(q, top_k)
     else:
-        final_results = vs.search(q, k=top_k)
+        final_results = vs.search(
+            q, k=top_k, scope=temp_scope, filter={"session_id": None}
+        )
 
     messages = build_hybrid_messages(q, final_results)
 
@@ -967,7 +1333,7 @@ def query():
         ai_msg = resp.choices[0].message.content or ""
         ai_msg = strip_markdown(ai_msg)
         try:
-            vs.clear_temporary_documents()
+            vs.clear_temporary_documents(temp_scope)
         except Exception:
             pass
 
@@ -982,7 +1348,7 @@ def query():
         return jsonify({"answer": ai_msg, "sources": sources})
     except Exception as e:
         try:
-            vs.clear_temporary_documents()
+            vs.clear_temporary_documents(temp_scope)
         except Exception:
             pass
         print(f"[query][ERROR] {e!r}")
@@ -1078,7 +1444,14 @@ def refresh():
             or session.get("user")
         ):
             return jsonify({"error": "Authentication required"}), 401
-    return jsonify({"status": "refreshed"})
+
+    # New filings were indexed: drop cached answers for the company (or all)
+    payload = request.get_json(silent=True) or {}
+    invalidated = 0
+    if response_cache is not None:
+        company = (payload.get("company") or "").strip()
+        invalidated = response_cache.invalidate(company) if company else response_cache.clear()
+    return jsonify({"status": "refreshed", "invalidated": invalidated})
 
 
 @app.route("/test_search")
@@ -1121,27 +1494,80 @@ def handle_exception(e):
 # ==================== File Upload ====================
 
 # Store uploaded documents per session for RAG context
-SESSION_DOCUMENTS: dict = {}  # session_id -> [{"doc_id": str, "filename": str, "text": str}]
+SESSION_DOCUMENTS: dict = {}  # session_id -> [{"doc_id": str, "filename": str, "tables": list, ...}]
 
 
-def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> list:
-    """Split text into overlapping chunks for better retrieval."""
-    if not text:
-        return []
-    
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = start + chunk_size
-        chunk = text[start:end]
-        if chunk.strip():
-            chunks.append(chunk.strip())
-        start = end - overlap
-        if start < 0:
-            start = 0
-        if end >= len(text):
-            break
-    return chunks
+def iter_upload_text(file_path: str, file_ext: str):
+    """
+    Yield the text of an uploaded file piece by piece.
+
+    Yields (page number, text) pairs: PDF pages, or ~64KB blocks of a text
+    file cut at blank lines (page None) so paragraphs are never split.
+    """
+    if file_ext == ".pdf":
+        if extraction_cache is not None:
+            pages = extraction_cache.pages(
+                file_key(file_path),
+                lambda skipped: iter_pdf_file_pages(file_path, skipped=skipped),
+            )
+        else:
+            pages = iter_pdf_file_pages(file_path)
+        yield from pages
+    elif file_ext in {".txt", ".md"}:
+        with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
+            block: list[str] = []
+            size = 0
+            for line in f:
+                if size >= 65536 and not line.strip():
+                    yield None, "".join(block)
+                    block, size = [], 0
+                block.append(line)
+                size += len(line)
+            if block:
+                yield None, "".join(block)
+    elif file_ext == ".csv":
+        yield None, pd.read_csv(file_path).to_string()
+
+
+def extract_attachment_text(att: str) -> str:
+    """
+    Download and extract an attachment PDF.
+
+    A known attachment is served from the extraction cache without being
+    downloaded; otherwise the downloaded bytes are looked up by hash before
+    PyPDF2 runs.
+    """
+    if extraction_cache is not None:
+        pages = extraction_cache.get_by_alias(att)
+        if pages is not None:
+            return "\n".join(text for _, text in pages)
+
+    if att.startswith("https://"):
+        pdf_bytes = blob_reader.download_blob_url_to_bytes(att)
+    else:
+        pdf_bytes = blob_reader.download_blob_to_bytes(att)
+
+    if extraction_cache is None:
+        return extract_text_from_pdf_bytes(pdf_bytes)
+
+    doc_hash = doc_key(pdf_bytes)
+    pages = list(
+        extraction_cache.pages(
+            doc_hash, lambda skipped: extract_pdf_pages(pdf_bytes, skipped=skipped)
+        )
+    )
+    extraction_cache.add_alias(att, doc_hash)
+    return "\n".join(text for _, text in pages)
+
+
+def emit_upload_progress(target: str | None, payload: dict) -> None:
+    """Report upload progress to a socket id or session room."""
+    if not target:
+        return
+    try:
+        socketio.emit("upload_progress", payload, to=target)
+    except Exception as e:
+        print(f"[upload] Progress emit failed: {e}")
 
 
 @app.route("/upload", methods=["POST"])
@@ -1174,84 +1600,123 @@ def upload_file():
         return jsonify({"error": f"File type {file_ext} not supported. Use: {', '.join(allowed_extensions)}"}), 400
 
     try:
-        # Read file content
-        file_bytes = file.read()
-        file_size = len(file_bytes)
-
-        # Save file locally
+        # Stream the upload to disk instead of holding it in memory
         timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
         saved_filename = f"{timestamp}_{filename}"
         file_path = os.path.join(UPLOAD_DIR, saved_filename)
-        
-        with open(file_path, "wb") as f:
-            f.write(file_bytes)
+        file.save(file_path)
+        file_size = os.path.getsize(file_path)
 
         print(f"[upload] Saved file: {file_path} ({file_size} bytes)")
 
-        # Extract text based on file type
-        extracted_text = ""
-        if file_ext == ".pdf":
-            from extractor import extract_text_from_pdf_bytes
-            extracted_text = extract_text_from_pdf_bytes(file_bytes)
-        elif file_ext in {".txt", ".md"}:
-            extracted_text = file_bytes.decode("utf-8", errors="ignore")
-        elif file_ext == ".csv":
-            import pandas as pd
-            df = pd.read_csv(io.BytesIO(file_bytes))
-            extracted_text = df.to_string()
-
-        if not extracted_text.strip():
-            return jsonify({"error": "Could not extract text from file"}), 400
-
-        print(f"[upload] Extracted {len(extracted_text)} characters from {filename}")
-
-        # Chunk the text for better retrieval
-        chunks = chunk_text(extracted_text, chunk_size=1500, overlap=200)
-        print(f"[upload] Created {len(chunks)} chunks")
-
         # Generate unique document ID
         doc_id = f"upload_{session_id}_{timestamp}_{filename}"
 
-        # Index chunks in vector store
-        for i, chunk in enumerate(chunks):
-            chunk_id = f"{doc_id}_chunk_{i}"
-            meta = {
-                "source": f"upload:{filename}",
-                "filename": filename,
-                "session_id": session_id,
-                "chunk_index": i,
-                "total_chunks": len(chunks),
-            }
+        # Pipeline: pages stream out of the extractor, are chunked as they
+        # arrive and indexed in batches, so each batch is searchable before
+        # the rest of the document is parsed
+        progress_to = request.form.get("socket_id") or session_id
+        stats = {"pages": 0, "characters": 0, "chunks": 0, "indexed": 0}
+        preview: list[str] = []
+
+        tables: list = []
+
+        def pieces():
+            for page, text in iter_upload_text(file_path, file_ext):
+                if stats["characters"] < 500:
+                    preview.append(text[: 500 - stats["characters"]])
+                stats["pages"] += 1
+                stats["characters"] += len(text)
+                # Statement tables are kept as numeric columns next to the text
+                if file_ext == ".pdf":
+                    tables.extend(extract_tables_from_text(text, page))
+                yield page, text
+
+        def documents():
+            for i, chunk in enumerate(iter_chunks(pieces())):
+                stats["chunks"] = i + 1
+                yield {
+                    "doc_id": f"{doc_id}_chunk_{i}",
+                    "text": chunk.text,
+                    "meta": {
+                        "source": f"upload:{filename}",
+                        "filename": filename,
+                        "session_id": session_id,
+                        "chunk_index": i,
+                        "page_start": chunk.page_start,
+                        "page_end": chunk.page_end,
+                    },
+                }
+
+        def index_batch(batch: list) -> None:
             try:
-                vs.add_document(doc_id=chunk_id, text=chunk, meta=meta)
+                stats["indexed"] += vs.add_documents(batch)
             except Exception as e:
-                print(f"[upload] Failed to index chunk {i}: {e}")
+                print(f"[upload] Failed to index {len(batch)} chunks: {e}")
+            emit_upload_progress(
+                progress_to,
+                {"status": "indexing", "filename": filename, "session_id": session_id, **stats},
+            )
+
+        emit_upload_progress(
+            progress_to, {"status": "started", "filename": filename, "session_id": session_id}
+        )
+        batch = []
+        for document in documents():
+            batch.append(document)
+            if len(batch) >= UPLOAD_INDEX_BATCH:
+                index_batch(batch)
+                batch = []
+        if batch:
+            index_batch(batch)
+
+        if not stats["chunks"]:
+            emit_upload_progress(
+                progress_to, {"status": "error", "filename": filename, "session_id": session_id}
+            )
+            return jsonify({"error": "Could not extract text from file"}), 400
+
+        print(
+            f"[upload] Extracted {stats['characters']} characters from {filename}, "
+            f"indexed {stats['indexed']}/{stats['chunks']} chunks"
+        )
 
         # Store document info for session
         if session_id not in SESSION_DOCUMENTS:
             SESSION_DOCUMENTS[session_id] = []
-        
+
         SESSION_DOCUMENTS[session_id].append({
             "doc_id": doc_id,
             "filename": filename,
             "file_path": file_path,
-            "text_preview": extracted_text[:500],
-            "chunk_count": len(chunks),
+            "text_preview": "".join(preview),
+            "chunk_count": stats["chunks"],
+            "tables": [table.to_dict() for table in tables],
             "uploaded_at": datetime.utcnow().isoformat(),
         })
 
         # Save vector store
         vs.save_index()
 
+        # Cached answers about this company may miss the new filing
+        if response_cache is not None and stats["indexed"]:
+            response_cache.invalidate(filename)
+
+        emit_upload_progress(
+            progress_to,
+            {"status": "done", "filename": filename, "session_id": session_id, **stats},
+        )
+
         return jsonify({
             "success": True,
             "filename": filename,
             "doc_id": doc_id,
-            "chunks": len(chunks),
-            "characters": len(extracted_text),
+            "chunks": stats["chunks"],
+            "characters": stats["characters"],
+            "tables": len(tables),
             "session_id": session_id,
             "url": f"/uploads/{saved_filename}",
-            "message": f"Successfully processed {filename} ({len(chunks)} chunks indexed)",
+            "message": f"Successfully processed {filename} ({stats['chunks']} chunks indexed)",
         })
 
     except Exception as e:
@@ -1306,6 +1771,7 @@ def handle_chat_message(data):
     sources = []
     ai_msg = ""
     session_id = None
+    msg_id = str(uuid4())
     
     # Get LLM client (always available due to mock fallback)
     llm = get_llm_client()
@@ -1348,20 +1814,31 @@ def handle_chat_message(data):
 
     try:
         top_k = int(data.get("top_k", 5))
-        retrieved = search_azure(user_msg, top_k)
-        if not retrieved and search_client is None:
-            retrieved = vs.search(user_msg, k=top_k)
+        cached, pending = lookup_cached_answer(user_msg, top_k, session_id=session_id)
+        if cached is not None:
+            ai_msg = cached.answer
+            sources = cached.sources
+        else:
+            retrieved = retrieve_documents(
+                user_msg, top_k, session_id, pending and pending["embedding"]
+            )
+            sources = [
+                {"doc_id": r["doc_id"], "source": r["meta"].get("source")}
+                for r in retrieved
+            ]
 
-        messages = build_hybrid_messages(user_msg, retrieved)
+            messages = build_hybrid_messages(user_msg, retrieved)
 
-        response = llm.chat.completions.create(
-            model=get_llm_model(),
-            messages=messages,
-            max_tokens=800,
-            temperature=0.0,
-            top_p=0.95,
-        )
-        ai_msg = response.choices[0].message.content
+            # Stream deltas as chat_token events; chat_response (same id) still
+            # carries the complete answer once the stream ends
+            parts = []
+            for delta in stream_chat_completion(llm, messages, **ANSWER_PARAMS):
+                if not parts:
+                    emit("typing", {"status": False})
+                parts.append(delta)
+                emit("chat_token", {"id": msg_id, "token": delta, "session_id": session_id})
+            ai_msg = "".join(parts)
+            store_cached_answer(pending, user_msg, ai_msg, sources)
 
         # =====================================================
         # SAVE ASSISTANT MESSAGE TO DATABASE (WebSocket)
@@ -1383,18 +1860,13 @@ def handle_chat_message(data):
                 if portfolio_item_id:
                     print(f"[ws] Auto-added company to portfolio: {company_name} ({ticker})")
 
-        sources = [
-            {"doc_id": r["doc_id"], "source": r["meta"].get("source")}
-            for r in retrieved
-        ]
-
     except Exception as e:
         logger.exception("[ws] Error in handle_chat_message: %s", e)
         emit("typing", {"status": False})
         emit(
             "chat_response",
             {
-                "id": str(uuid4()),
+                "id": msg_id,
                 "response": "Sorry, an error occurred while processing your message. Please try again.",
                 "sources": [],
                 "session_id": session_id,
@@ -1409,7 +1881,7 @@ def handle_chat_message(data):
     emit(
         "chat_response",
         {
-            "id": str(uuid4()),
+            "id": msg_id,
             "response": ai_msg,
             "sources": sources,
             "session_id": session_id,
@@ -1508,7 +1980,11 @@ def chat_create_report():
         context_text = ""
         try:
             if vs:
-                retrieved = vs.search(company_name, top_k=3)
+                # Shared documents only; session uploads and other requests'
+                # temporary PDF context stay private
+                retrieved = vs.search(
+                    company_name, k=3, filter={"session_id": None}, include_temporary=False
+                )
                 context_chunks = [
                     r.get("text", "")
                     for r in retrieved
@@ -1519,13 +1995,7 @@ def chat_create_report():
             print(f"[chat/create-report] Context retrieval warning: {e}")
         
         # Generate the report HTML
-        report_html = generate_equity_research_html(
-            llm, 
-            get_llm_model(), 
-            company_name, 
-            user_message, 
-            context_text
-        )
+        report_html = generate_report_html(llm, company_name, user_message, context_text)
         
         # Generate unique report ID and filename
         report_id = f"{company_name.replace(' ', '_').lower()}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
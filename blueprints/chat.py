@@ -180,6 +180,37 @@ def save_message(session_id: str, user_id: int, role: str, content: str) -> Opti
         return None
 
 
+def get_reply_message(session_id: str, user_id: int, after_id: int) -> Optional[str]:
+    """
+    Get the first assistant message saved after a given message.
+
+    Used to settle streamed answers, which are saved to the database after
+    the cookie session has already been sent.
+
+    Args:
+        session_id: The session UUID
+        user_id: The user ID (for ownership check)
+        after_id: ID of the user message the reply answers
+
+    Returns:
+        The reply content, or None if no reply was saved
+    """
+    try:
+        with db_cursor(commit=False) as cur:
+            cur.execute(
+                """SELECT content FROM messages
+                   WHERE session_id = %s AND user_id = %s AND role = 'assistant' AND id > %s
+                   ORDER BY id ASC
+                   LIMIT 1""",
+                (session_id, user_id, after_id)
+            )
+            row = cur.fetchone()
+            return row["content"] if row else None
+    except Exception as e:
+        print(f"[chat] Error getting reply message: {e}")
+        return None
+
+
 def update_session_title(session_id: str, user_id: int, title: str) -> bool:
     """
     Update a session's title.
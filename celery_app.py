@@ -4,6 +4,7 @@ Background task processing with Redis (production) or RabbitMQ (local fallback)
 """
 
 import os
+import threading
 
 from celery import Celery
 from dotenv import load_dotenv
@@ -80,6 +81,37 @@ celery_app = make_celery()
 
 
 # ==================== Task Definitions ====================
+# Opened on first use in each worker process and reused by later tasks
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Return this worker's shared ResponseCache, or None when caching is off."""
+    global _response_cache
+    from response_cache import RESPONSE_CACHE_ENABLED, ResponseCache
+
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache(
+                os.getenv("RESPONSE_CACHE_PATH")
+                or os.path.join("vector_store_data", "response_cache.sqlite3")
+            )
+        return _response_cache
+
+
+def invalidate_cached_answers(text: str) -> None:
+    """Drop cached chat answers about any company named in text (see response_cache)."""
+    try:
+        cache = get_response_cache() if text.strip() else None
+        if cache is not None:
+            cache.invalidate(text)
+    except Exception as e:
+        print(f"[celery] Response cache invalidation failed: {e}")
+
+
 @celery_app.task(bind=True, max_retries=3)
 def process_pdf_async(self, file_path: str, session_id: str, filename: str):
     """
@@ -89,33 +121,40 @@ def process_pdf_async(self, file_path: str, session_id: str, filename: str):
     - Index in vector store
     """
     try:
-        from extractor import extract_text_from_pdf_file
+        from chunker import iter_chunks
+        from extractor import iter_pdf_file_pages
         from vector_store import VectorStore
         
-        # Extract text
-        text = extract_text_from_pdf_file(file_path)
-        if not text:
-            raise ValueError("Could not extract text from PDF")
-        
-        # Chunk text
-        chunks = chunk_text(text, chunk_size=1500, overlap=200)
-        
-        # Index in vector store
-        vs = VectorStore(use_azure=IS_PRODUCTION)
+        # Pages stream through the chunker into batched embedding
+        vs = VectorStore()
         doc_id = f"upload_{session_id}_{filename}"
+        chunk_count = 0
         
-        for i, chunk in enumerate(chunks):
-            chunk_id = f"{doc_id}_chunk_{i}"
-            vs.add_document(
-                doc_id=chunk_id,
-                text=chunk,
-                meta={"source": f"upload:{filename}", "chunk": i, "session_id": session_id}
-            )
+        def documents():
+            nonlocal chunk_count
+            for i, chunk in enumerate(iter_chunks(iter_pdf_file_pages(file_path))):
+                chunk_count = i + 1
+                yield {
+                    "doc_id": f"{doc_id}_chunk_{i}",
+                    "text": chunk.text,
+                    "meta": {
+                        "source": f"upload:{filename}",
+                        "chunk": i,
+                        "session_id": session_id,
+                        "page_start": chunk.page_start,
+                        "page_end": chunk.page_end,
+                    },
+                }
+        
+        vs.add_documents(documents())
+        if not chunk_count:
+            raise ValueError("Could not extract text from PDF")
+        invalidate_cached_answers(filename)
         
         return {
             "status": "success",
             "filename": filename,
-            "chunks": len(chunks),
+            "chunks": chunk_count,
             "doc_id": doc_id,
         }
         
@@ -130,8 +169,11 @@ def index_document_async(self, doc_id: str, text: str, metadata: dict):
     try:
         from vector_store import VectorStore
         
-        vs = VectorStore(use_azure=IS_PRODUCTION)
+        vs = VectorStore()
         vs.add_document(doc_id=doc_id, text=text, meta=metadata)
+        invalidate_cached_answers(
+            " ".join(str(metadata.get(k) or "") for k in ("company", "filename", "source"))
+        )
         
         return {"status": "success", "doc_id": doc_id}
         
@@ -139,26 +181,6 @@ def index_document_async(self, doc_id: str, text: str, metadata: dict):
         raise self.retry(exc=exc, countdown=2 ** self.request.retries)
 
 
-def chunk_text(text: str, chunk_size: int = 1500, overlap: int = 200) -> list:
-    """Split text into overlapping chunks."""
-    if not text:
-        return []
-    
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = start + chunk_size
-        chunk = text[start:end]
-        if chunk.strip():
-            chunks.append(chunk.strip())
-        start = end - overlap
-        if start < 0:
-            start = 0
-        if end >= len(text):
-            break
-    return chunks
-
-
 # ==================== Flask Integration ====================
 def init_celery(app):
     """Initialize Celery with Flask app context."""
@@ -0,0 +1,239 @@
+"""
+SageAlpha.ai Chunker
+Structure-aware, token-sized chunking shared by uploads and background tasks
+
+Text is split once, left to right, into sentence units that remember the
+strongest boundary before them (page, heading, paragraph or sentence).
+Units are packed greedily until the next one would exceed the token budget;
+a heading starts a new chunk, and consecutive chunks share a few trailing
+sentences as overlap. Chunks are yielded lazily with the pages they span.
+"""
+
+import os
+import re
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from tokenizer import count_tokens, get_encoding
+
+# ==================== Configuration ====================
+# Token budget per chunk (about 1,500 characters of English prose)
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "400"))
+
+# Tokens of trailing sentences repeated at the start of the next chunk
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "50"))
+
+# A heading only closes the current chunk once it holds this share of the budget
+_HEADING_MIN_FILL = 0.25
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])")
+_HEADING_RE = re.compile(
+    r"^\s*(?:"
+    r"#{1,6}\s+\S.*"  # markdown heading
+    r"|(?:\d{1,2}(?:\.\d{1,2})*\.?|[IVX]{1,5}\.|[A-H]\.)\s+[A-Z][^.!?]{0,80}"  # numbered
+    r")\s*$"
+)
+# ALL CAPS line with at least one word of three or more letters
+_CAPS_HEADING_RE = re.compile(
+    r"^\s*(?=[A-Z0-9 &,'()/:-]*?\b[A-Z]{3,}\b)[A-Z][A-Z0-9 &,'()/:-]{3,80}\s*$"
+)
+
+# Separator placed before a unit, by the boundary that precedes it
+_SEPARATORS = {"page": "\n\n", "heading": "\n\n", "paragraph": "\n\n", "sentence": " "}
+
+Page = Tuple[Optional[int], str]
+
+
+class Chunk(NamedTuple):
+    """A chunk of text and the (1-based) pages it spans."""
+
+    text: str
+    page_start: Optional[int]
+    page_end: Optional[int]
+    tokens: int
+
+
+class _Unit(NamedTuple):
+    text: str
+    tokens: int
+    boundary: str
+    page: Optional[int]
+
+
+def _is_heading(line: str) -> bool:
+    """
+    Check whether a line is a section heading.
+
+    All-caps lines that are mostly digits (table rows such as
+    "TOTAL 1,234 5,678") are not headings.
+    """
+    if _HEADING_RE.match(line):
+        return True
+    if not _CAPS_HEADING_RE.match(line):
+        return False
+    return sum(c.isalpha() for c in line) > sum(c.isdigit() for c in line)
+
+
+def _paragraphs(text: str) -> Iterator[Tuple[str, bool]]:
+    """Split text into (paragraph, starts with a heading) on blank lines and headings."""
+    lines: List[str] = []
+    heading = False
+    for line in text.splitlines():
+        if not line.strip():
+            if lines:
+                yield "\n".join(lines), heading
+                lines, heading = [], False
+        elif _is_heading(line):
+            if lines:
+                yield "\n".join(lines), heading
+            lines, heading = [line.strip()], True
+        else:
+            lines.append(line.rstrip())
+    if lines:
+        yield "\n".join(lines), heading
+
+
+def _split_oversize(text: str, max_tokens: int) -> Iterator[Tuple[str, int]]:
+    """
+    Split a unit longer than the budget: by lines first (tables), then by
+    token windows (or character windows without tiktoken).
+    """
+    n = count_tokens(text)
+    if n <= max_tokens:
+        yield text, n
+        return
+
+    lines = text.split("\n")
+    if len(lines) > 1:
+        group: List[str] = []
+        group_tokens = 0
+        for line in lines:
+            line_tokens = count_tokens(line)
+            if group and group_tokens + line_tokens > max_tokens:
+                yield "\n".join(group), group_tokens
+                group, group_tokens = [], 0
+            if line_tokens > max_tokens:
+                yield from _split_oversize(line, max_tokens)
+                continue
+            group.append(line)
+            group_tokens += line_tokens
+        if group:
+            yield "\n".join(group), group_tokens
+        return
+
+    encoding = get_encoding()
+    if encoding is not None:
+        ids = encoding.encode(text, disallowed_special=())
+        for i in range(0, len(ids), max_tokens):
+            piece = ids[i : i + max_tokens]
+            yield encoding.decode(piece), len(piece)
+    else:
+        width = max_tokens * 4
+        for i in range(0, len(text), width):
+            piece = text[i : i + width]
+            yield piece, count_tokens(piece)
+
+
+def _units(pages: Iterable[Union[Page, str]], max_tokens: int) -> Iterator[_Unit]:
+    """Split pages into sentence units tagged with the boundary before them."""
+    previous_page: Optional[int] = None
+    for item in pages:
+        page, text = (None, item) if isinstance(item, str) else item
+        page_break = page is not None and page != previous_page
+        previous_page = page
+
+        for p, (paragraph, heading) in enumerate(_paragraphs(text)):
+            if heading:
+                boundary = "heading"
+            elif p == 0 and page_break:
+                boundary = "page"
+            else:
+                boundary = "paragraph"
+
+            for sentence in _SENTENCE_RE.split(paragraph):
+                if not sentence.strip():
+                    continue
+                for piece, n in _split_oversize(sentence, max_tokens):
+                    yield _Unit(piece, n, boundary, page)
+                    boundary = "sentence"
+
+
+def iter_chunks(
+    pages: Iterable[Union[Page, str]],
+    max_tokens: int = CHUNK_MAX_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+) -> Iterator[Chunk]:
+    """
+    Chunk a stream of pages.
+
+    Args:
+        pages: (page number, text) pairs, or plain strings without pages
+        max_tokens: Token budget per chunk
+        overlap_tokens: Tokens of trailing sentences repeated in the next chunk
+
+    Yields:
+        Chunk tuples in document order
+    """
+    current: List[_Unit] = []
+    tokens = 0
+    fresh = 0  # units in current that were not carried over as overlap
+
+    for unit in _units(pages, max_tokens):
+        new_section = unit.boundary == "heading" and tokens >= max_tokens * _HEADING_MIN_FILL
+        if current and (tokens + unit.tokens > max_tokens or new_section):
+            if fresh:
+                yield _make_chunk(current, tokens)
+            # Carry trailing sentences, but never across a section heading
+            carry: List[_Unit] = []
+            carry_tokens = 0
+            if not new_section:
+                for prev in reversed(current):
+                    if carry_tokens + prev.tokens > overlap_tokens:
+                        break
+                    carry.insert(0, prev)
+                    carry_tokens += prev.tokens
+                while carry and carry_tokens + unit.tokens > max_tokens:
+                    carry_tokens -= carry.pop(0).tokens
+            current, tokens, fresh = carry, carry_tokens, 0
+
+        current.append(unit)
+        tokens += unit.tokens
+        fresh += 1
+
+    if current and fresh:
+        yield _make_chunk(current, tokens)
+
+
+def _make_chunk(units: List[_Unit], tokens: int) -> Chunk:
+    """Join units with separators matching the boundaries between them."""
+    parts = [units[0].text]
+    for unit in units[1:]:
+        parts.append(_SEPARATORS[unit.boundary])
+        parts.append(unit.text)
+    pages = [u.page for u in units if u.page is not None]
+    return Chunk(
+        text="".join(parts).strip(),
+        page_start=pages[0] if pages else None,
+        page_end=pages[-1] if pages else None,
+        tokens=tokens,
+    )
+
+
+def chunk_text(
+    text: str,
+    max_tokens: int = CHUNK_MAX_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+) -> List[str]:
+    """
+    Split text into overlapping, structure-aware chunks.
+
+    Args:
+        text: Text to split
+        max_tokens: Token budget per chunk
+        overlap_tokens: Tokens of trailing sentences repeated in the next chunk
+
+    Returns:
+        List of chunk texts
+    """
+    if not text:
+        return []
+    return [chunk.text for chunk in iter_chunks([text], max_tokens, overlap_tokens)]
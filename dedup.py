@@ -0,0 +1,271 @@
+"""
+SageAlpha.ai Near-Duplicate Detection
+MinHash-LSH over word shingles, persisted so dedup works across documents and restarts
+
+Filings repeat large amounts of boilerplate (disclaimers, board-meeting
+headers, auditor language). Each chunk gets a MinHash signature; signatures
+are banded into an LSH table in SQLite, and a chunk whose estimated Jaccard
+similarity to an indexed chunk reaches the threshold is linked to that chunk
+instead of being embedded again.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# ==================== Configuration ====================
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Estimated Jaccard similarity at which a chunk counts as a duplicate
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.85"))
+
+# Signature layout; stored signatures are only comparable with the same values
+NUM_PERM = 128
+BANDS = 16
+SHINGLE_WORDS = 5
+
+_ROWS = NUM_PERM // BANDS
+_PRIME = (1 << 31) - 1
+_WORD_RE = re.compile(r"\w+")
+
+# (doc_id, scope, signature, band keys) and (record, canonical doc_id, similarity)
+Signature = Tuple[str, Optional[str], np.ndarray, List[int]]
+Duplicate = Tuple[Dict[str, Any], str, float]
+
+# Fixed seed so signatures stay comparable across processes and restarts
+_rng = np.random.RandomState(20240601)
+_PERM_A = _rng.randint(1, _PRIME, size=NUM_PERM).astype(np.uint64)
+_PERM_B = _rng.randint(0, _PRIME, size=NUM_PERM).astype(np.uint64)
+
+
+def minhash(text: str) -> Optional[np.ndarray]:
+    """
+    Compute the MinHash signature of a text's word shingles.
+
+    Args:
+        text: Chunk text
+
+    Returns:
+        uint32 signature of NUM_PERM values, or None for text without words
+    """
+    words = _WORD_RE.findall(text.lower())
+    if not words:
+        return None
+    n = max(len(words) - SHINGLE_WORDS + 1, 1)
+    shingles = np.fromiter(
+        (zlib.crc32(" ".join(words[i : i + SHINGLE_WORDS]).encode("utf-8")) for i in range(n)),
+        dtype=np.uint64,
+        count=n,
+    )
+    shingles %= np.uint64(_PRIME)
+    hashed = (_PERM_A[:, None] * shingles[None, :] + _PERM_B[:, None]) % np.uint64(_PRIME)
+    return hashed.min(axis=1).astype(np.uint32)
+
+
+def band_keys(signature: np.ndarray) -> List[int]:
+    """Hash each band of a signature to a signed 64-bit LSH key."""
+    rows = signature.reshape(BANDS, _ROWS)
+    keys = []
+    for band, values in enumerate(rows):
+        digest = zlib.crc32(values.tobytes(), band) << 32 | zlib.adler32(values.tobytes())
+        keys.append(digest - (1 << 63))
+    return keys
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimate Jaccard similarity from two signatures."""
+    return float(np.count_nonzero(a == b)) / NUM_PERM
+
+
+class ChunkDeduplicator:
+    """
+    Persistent MinHash-LSH index of indexed chunks.
+
+    Candidates are scoped: a chunk may only be linked to a chunk in the
+    same scope (e.g. the same upload session) or to a chunk without one
+    (the shared corpus), matching what a filtered search can see.
+    """
+
+    def __init__(self, path: str, threshold: float = DEDUP_THRESHOLD) -> None:
+        """
+        Open (or create) the signature index.
+
+        Args:
+            path: SQLite database file
+            threshold: Estimated Jaccard similarity treated as duplicate
+        """
+        self.path = path
+        self.threshold = threshold
+
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.checked = 0
+        self.duplicates = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = self._conn()
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS signatures (
+                   doc_id TEXT PRIMARY KEY,
+                   scope TEXT,
+                   signature BLOB NOT NULL
+               )"""
+        )
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS bands (
+                   band INTEGER NOT NULL,
+                   doc_id TEXT NOT NULL
+               )"""
+        )
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS duplicates (
+                   doc_id TEXT PRIMARY KEY,
+                   canonical_id TEXT NOT NULL,
+                   similarity REAL NOT NULL,
+                   created REAL NOT NULL
+               )"""
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_bands_band ON bands (band)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        """Return this thread's connection."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _candidates(self, keys: List[int]) -> List[Tuple[str, Optional[str], np.ndarray]]:
+        """Return indexed chunks sharing at least one LSH band."""
+        placeholders = ",".join("?" * len(keys))
+        rows = self._conn().execute(
+            f"""SELECT DISTINCT s.doc_id, s.scope, s.signature
+                FROM bands b JOIN signatures s ON s.doc_id = b.doc_id
+                WHERE b.band IN ({placeholders})""",
+            keys,
+        ).fetchall()
+        return [(d, s, np.frombuffer(sig, dtype=np.uint32)) for d, s, sig in rows]
+
+    def filter(
+        self, records: Sequence[Dict[str, Any]], scope_field: str = "session_id"
+    ) -> Tuple[List[Dict[str, Any]], List[Signature], List[Duplicate]]:
+        """
+        Split a batch into unique records and near-duplicates.
+
+        Records are also compared with earlier records of the same batch.
+        Nothing is written; call register() once the unique records are
+        indexed and link() for the duplicates.
+
+        Args:
+            records: Dicts with doc_id, text and meta
+            scope_field: Meta field that scopes candidates
+
+        Returns:
+            (unique records, their signatures, (duplicate record, canonical
+            doc_id, similarity) triples)
+        """
+        unique: List[Dict[str, Any]] = []
+        signatures: List[Signature] = []
+        duplicates: List[Duplicate] = []
+        pending: Dict[int, List[Tuple[str, Optional[str], np.ndarray]]] = {}
+
+        for record in records:
+            signature = minhash(record["text"])
+            if signature is None:
+                unique.append(record)
+                continue
+
+            scope = (record.get("meta") or {}).get(scope_field)
+            scope = None if scope is None else str(scope)
+            keys = band_keys(signature)
+            candidates = self._candidates(keys)
+            for key in keys:
+                candidates.extend(pending.get(key, ()))
+
+            best: Optional[Tuple[str, float]] = None
+            for doc_id, candidate_scope, candidate in candidates:
+                if candidate_scope is not None and candidate_scope != scope:
+                    continue
+                score = similarity(signature, candidate)
+                if score >= self.threshold and (best is None or score > best[1]):
+                    best = (doc_id, score)
+
+            if best is not None:
+                duplicates.append((record, best[0], best[1]))
+                continue
+
+            for key in keys:
+                pending.setdefault(key, []).append((record["doc_id"], scope, signature))
+            unique.append(record)
+            signatures.append((record["doc_id"], scope, signature, keys))
+
+        with self._stats_lock:
+            self.checked += len(records)
+            self.duplicates += len(duplicates)
+        return unique, signatures, duplicates
+
+    def register(self, signatures: Sequence[Signature]) -> None:
+        """
+        Add the signatures of indexed chunks.
+
+        Args:
+            signatures: Entries returned by filter() for the unique records
+        """
+        if not signatures:
+            return
+        conn = self._conn()
+        conn.executemany(
+            "INSERT OR REPLACE INTO signatures (doc_id, scope, signature) VALUES (?, ?, ?)",
+            [(doc_id, scope, sig.tobytes()) for doc_id, scope, sig, _ in signatures],
+        )
+        conn.executemany(
+            "INSERT INTO bands (band, doc_id) VALUES (?, ?)",
+            [(key, doc_id) for doc_id, _, _, keys in signatures for key in keys],
+        )
+        conn.commit()
+
+    def link(self, duplicates: Sequence[Duplicate]) -> None:
+        """
+        Record which indexed chunk each dropped duplicate maps to.
+
+        Args:
+            duplicates: Entries returned by filter() for the duplicates
+        """
+        if not duplicates:
+            return
+        now = time.time()
+        conn = self._conn()
+        conn.executemany(
+            "INSERT OR REPLACE INTO duplicates (doc_id, canonical_id, similarity, created) "
+            "VALUES (?, ?, ?, ?)",
+            [(r["doc_id"], canonical, score, now) for r, canonical, score in duplicates],
+        )
+        conn.commit()
+
+    def canonical(self, doc_id: str) -> Optional[str]:
+        """Return the indexed chunk a dropped duplicate was linked to."""
+        row = self._conn().execute(
+            "SELECT canonical_id FROM duplicates WHERE doc_id = ?", (doc_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def stats(self) -> Dict[str, Any]:
+        """Return chunk and duplicate counters for this process."""
+        with self._stats_lock:
+            return {
+                "checked": self.checked,
+                "duplicates": self.duplicates,
+                "duplicate_rate": (self.duplicates / self.checked) if self.checked else 0.0,
+            }
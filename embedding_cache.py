@@ -0,0 +1,221 @@
+"""
+SageAlpha.ai Embedding Cache
+Persistent, content-addressed cache of embedding vectors shared by all workers
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# ==================== Configuration ====================
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+
+# Size bound for stored vectors; least recently used entries are evicted
+EMBEDDING_CACHE_MAX_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "512"))
+
+# Writes between checks of the total cache size
+_EVICTION_CHECK_INTERVAL = 256
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so trivially reformatted chunks share a key."""
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def text_key(text: str) -> str:
+    """Return the sha256 hex digest of the normalized text."""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    SQLite-backed embedding cache keyed by (text hash, deployment, dim).
+
+    The database runs in WAL mode so every Gunicorn worker can read and
+    write the same file. Vectors are stored as raw float32 blobs.
+    """
+
+    def __init__(
+        self, path: str, deployment: str, max_mb: int = EMBEDDING_CACHE_MAX_MB
+    ) -> None:
+        """
+        Open (or create) the cache.
+
+        Args:
+            path: SQLite database file
+            deployment: Embedding deployment the vectors come from
+            max_mb: Maximum size of stored vectors in megabytes
+        """
+        self.path = path
+        self.deployment = deployment
+        self.max_bytes = max_mb * 1024 * 1024
+
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._writes_since_check = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = self._conn()
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                   text_hash TEXT NOT NULL,
+                   deployment TEXT NOT NULL,
+                   dim INTEGER NOT NULL,
+                   vector BLOB NOT NULL,
+                   last_access REAL NOT NULL,
+                   PRIMARY KEY (text_hash, deployment, dim)
+               )"""
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings (last_access)"
+        )
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        """Return this thread's connection."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_many(
+        self, texts: List[str], dim: Optional[int] = None
+    ) -> List[Optional[np.ndarray]]:
+        """
+        Look up cached vectors.
+
+        Args:
+            texts: Texts to look up
+            dim: Required vector dimension (any dimension when None)
+
+        Returns:
+            One vector or None per text, in input order
+        """
+        keys = [text_key(t) for t in texts]
+        found: Dict[str, np.ndarray] = {}
+        conn = self._conn()
+
+        unique = list(dict.fromkeys(keys))
+        for start in range(0, len(unique), 500):
+            batch = unique[start : start + 500]
+            placeholders = ",".join("?" * len(batch))
+            sql = (
+                f"SELECT text_hash, dim, vector FROM embeddings "
+                f"WHERE deployment = ? AND text_hash IN ({placeholders})"
+            )
+            params: List[Any] = [self.deployment, *batch]
+            if dim is not None:
+                sql += " AND dim = ?"
+                params.append(dim)
+            for text_hash, row_dim, blob in conn.execute(sql, params):
+                found[text_hash] = np.frombuffer(blob, dtype=np.float32, count=row_dim)
+
+        if found:
+            now = time.time()
+            conn.executemany(
+                "UPDATE embeddings SET last_access = ? WHERE text_hash = ? AND deployment = ?",
+                [(now, h, self.deployment) for h in found],
+            )
+            conn.commit()
+
+        out = [found.get(k) for k in keys]
+        hits = sum(v is not None for v in out)
+        with self._stats_lock:
+            self.hits += hits
+            self.misses += len(out) - hits
+        return out
+
+    def put_many(self, texts: List[str], vectors: np.ndarray) -> None:
+        """
+        Store vectors for texts.
+
+        Args:
+            texts: Texts that were embedded
+            vectors: Matrix of their embeddings (one row per text)
+        """
+        if not texts:
+            return
+
+        now = time.time()
+        dim = int(vectors.shape[1])
+        rows = [
+            (text_key(t), self.deployment, dim, np.asarray(v, dtype=np.float32).tobytes(), now)
+            for t, v in zip(texts, vectors)
+        ]
+        conn = self._conn()
+        conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (text_hash, deployment, dim, vector, last_access) "
+            "VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+        conn.commit()
+
+        with self._stats_lock:
+            self._writes_since_check += len(rows)
+            check = self._writes_since_check >= _EVICTION_CHECK_INTERVAL
+            if check:
+                self._writes_since_check = 0
+        if check:
+            self.evict()
+
+    def evict(self) -> int:
+        """
+        Delete least recently used entries until the cache fits its budget.
+
+        Returns:
+            Number of entries removed
+        """
+        conn = self._conn()
+        total = conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+        if total <= self.max_bytes:
+            return 0
+
+        # Evict down to 90% of the budget so eviction does not run on every write
+        excess = total - int(self.max_bytes * 0.9)
+        removed = 0
+        freed = 0
+        for text_hash, deployment, dim, size in conn.execute(
+            "SELECT text_hash, deployment, dim, LENGTH(vector) FROM embeddings "
+            "ORDER BY last_access ASC"
+        ).fetchall():
+            if freed >= excess:
+                break
+            conn.execute(
+                "DELETE FROM embeddings WHERE text_hash = ? AND deployment = ? AND dim = ?",
+                (text_hash, deployment, dim),
+            )
+            freed += size
+            removed += 1
+        conn.commit()
+        print(f"[EmbeddingCache] Evicted {removed} entries ({freed // 1024} KB)")
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and the hit rate for this process."""
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
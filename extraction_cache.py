@@ -0,0 +1,323 @@
+"""
+SageAlpha.ai Extraction Cache
+Persistent cache of extracted PDF page text keyed by the document's sha256
+
+Pages are stored zlib-compressed in a SQLite database (WAL mode, shared by
+all workers) and evicted least-recently-used once the cache exceeds its size
+budget. Attachment paths and URLs can be aliased to a document hash, so a
+repeat query for the same filing skips both the download and PyPDF2.
+
+The raw page text is cached rather than the clean_text output: chunking and
+table extraction need the line breaks that clean_text collapses. Extractions
+that lost pages to a worker timeout or crash are never stored, so the next
+lookup extracts the document again.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit
+
+# ==================== Configuration ====================
+EXTRACTION_CACHE_ENABLED = os.getenv("EXTRACTION_CACHE_ENABLED", "true").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+
+# Size bound for compressed page text; least recently used entries are evicted
+EXTRACTION_CACHE_MAX_MB = int(os.getenv("EXTRACTION_CACHE_MAX_MB", "1024"))
+
+# How long an attachment alias is trusted before the blob is downloaded again
+EXTRACTION_CACHE_ALIAS_TTL = float(os.getenv("EXTRACTION_CACHE_ALIAS_TTL_HOURS", "168")) * 3600
+
+# Writes between checks of the total cache size
+_EVICTION_CHECK_INTERVAL = 32
+
+Pages = List[Tuple[int, str]]
+
+
+def doc_key(data: bytes) -> str:
+    """Return the sha256 hex digest of raw document bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_key(file_path: str) -> str:
+    """Return the sha256 hex digest of a file, read in blocks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def alias_key(alias: str) -> str:
+    """Normalize an attachment reference; SAS query strings change per request."""
+    if alias.startswith(("http://", "https://")):
+        parts = urlsplit(alias)
+        return urlunsplit((parts.scheme, parts.netloc, parts.path, "", ""))
+    return alias
+
+
+class ExtractionCache:
+    """
+    SQLite-backed cache of per-page text keyed by document hash.
+
+    Each entry is a zlib stream of JSON lines, one [page number, text] pair
+    per line, so entries can be written while pages are still streaming in.
+    """
+
+    def __init__(self, path: str, max_mb: int = EXTRACTION_CACHE_MAX_MB) -> None:
+        """
+        Open (or create) the cache.
+
+        Args:
+            path: SQLite database file
+            max_mb: Maximum size of stored (compressed) pages in megabytes
+        """
+        self.path = path
+        self.max_bytes = max_mb * 1024 * 1024
+
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._writes_since_check = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = self._conn()
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS extractions (
+                   doc_hash TEXT PRIMARY KEY,
+                   pages BLOB NOT NULL,
+                   page_count INTEGER NOT NULL,
+                   last_access REAL NOT NULL
+               )"""
+        )
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS aliases (
+                   alias TEXT PRIMARY KEY,
+                   doc_hash TEXT NOT NULL,
+                   created REAL NOT NULL
+               )"""
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_extractions_last_access ON extractions (last_access)"
+        )
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        """Return this thread's connection."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _record(self, hit: bool) -> None:
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, doc_hash: str) -> Optional[Pages]:
+        """
+        Look up the pages of a document.
+
+        Args:
+            doc_hash: sha256 of the document bytes
+
+        Returns:
+            (page number, text) pairs, or None on a miss
+        """
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT pages FROM extractions WHERE doc_hash = ?", (doc_hash,)
+        ).fetchone()
+        self._record(row is not None)
+        if row is None:
+            return None
+
+        conn.execute(
+            "UPDATE extractions SET last_access = ? WHERE doc_hash = ?",
+            (time.time(), doc_hash),
+        )
+        conn.commit()
+        lines = zlib.decompress(row[0]).decode("utf-8").splitlines()
+        return [tuple(json.loads(line)) for line in lines]
+
+    def put(self, doc_hash: str, pages: Iterable[Tuple[int, str]]) -> None:
+        """
+        Store the pages of a document.
+
+        Args:
+            doc_hash: sha256 of the document bytes
+            pages: (page number, text) pairs; consumed lazily
+        """
+        for _ in self.store_pages(doc_hash, pages):
+            pass
+
+    def store_pages(
+        self,
+        doc_hash: str,
+        pages: Iterable[Tuple[int, str]],
+        skipped: Optional[List[int]] = None,
+    ) -> Iterator[Tuple[int, str]]:
+        """
+        Pass pages through while compressing them into the cache.
+
+        The entry is written once the input is exhausted, so an extraction
+        that fails halfway leaves nothing behind. Neither does one that
+        reported skipped pages.
+
+        Args:
+            doc_hash: sha256 of the document bytes
+            pages: (page number, text) pairs
+            skipped: Filled by the extractor with pages it could not extract
+
+        Yields:
+            The input pages, unchanged
+        """
+        compressor = zlib.compressobj(6)
+        parts: List[bytes] = []
+        count = 0
+        for page in pages:
+            parts.append(compressor.compress((json.dumps(list(page)) + "\n").encode("utf-8")))
+            count += 1
+            yield page
+        parts.append(compressor.flush())
+        if skipped:
+            print(
+                f"[ExtractionCache] Not caching {doc_hash[:12]}: "
+                f"{len(skipped)} pages failed to extract"
+            )
+            return
+
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO extractions (doc_hash, pages, page_count, last_access) "
+            "VALUES (?, ?, ?, ?)",
+            (doc_hash, b"".join(parts), count, time.time()),
+        )
+        conn.commit()
+
+        with self._stats_lock:
+            self._writes_since_check += 1
+            check = self._writes_since_check >= _EVICTION_CHECK_INTERVAL
+            if check:
+                self._writes_since_check = 0
+        if check:
+            self.evict()
+
+    def pages(
+        self, doc_hash: str, extract: Callable[[List[int]], Iterable[Tuple[int, str]]]
+    ) -> Iterator[Tuple[int, str]]:
+        """
+        Yield a document's pages from the cache, extracting them on a miss.
+
+        Args:
+            doc_hash: sha256 of the document bytes
+            extract: Called on a miss with a list to record skipped page
+                numbers in; returns the pages
+
+        Yields:
+            (page number, text) pairs in page order
+        """
+        cached = self.get(doc_hash)
+        if cached is not None:
+            yield from cached
+        else:
+            skipped: List[int] = []
+            yield from self.store_pages(doc_hash, extract(skipped), skipped)
+
+    def resolve_alias(self, alias: str) -> Optional[str]:
+        """
+        Return the document hash an attachment reference points to.
+
+        Args:
+            alias: Blob path or URL
+
+        Returns:
+            Document hash, or None if unknown or expired
+        """
+        row = self._conn().execute(
+            "SELECT doc_hash, created FROM aliases WHERE alias = ?", (alias_key(alias),)
+        ).fetchone()
+        if row is None or time.time() - row[1] > EXTRACTION_CACHE_ALIAS_TTL:
+            return None
+        return row[0]
+
+    def add_alias(self, alias: str, doc_hash: str) -> None:
+        """
+        Point an attachment reference at a document hash.
+
+        Args:
+            alias: Blob path or URL
+            doc_hash: sha256 of the downloaded bytes
+        """
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO aliases (alias, doc_hash, created) VALUES (?, ?, ?)",
+            (alias_key(alias), doc_hash, time.time()),
+        )
+        conn.commit()
+
+    def get_by_alias(self, alias: str) -> Optional[Pages]:
+        """Look up pages through an attachment alias (None on a miss)."""
+        doc_hash = self.resolve_alias(alias)
+        if doc_hash is None:
+            self._record(False)
+            return None
+        return self.get(doc_hash)
+
+    def evict(self) -> int:
+        """
+        Delete least recently used entries until the cache fits its budget.
+
+        Returns:
+            Number of documents removed
+        """
+        conn = self._conn()
+        total = conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(pages)), 0) FROM extractions"
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return 0
+
+        # Evict down to 90% of the budget so eviction does not run on every write
+        excess = total - int(self.max_bytes * 0.9)
+        removed = 0
+        freed = 0
+        for doc_hash, size in conn.execute(
+            "SELECT doc_hash, LENGTH(pages) FROM extractions ORDER BY last_access ASC"
+        ).fetchall():
+            if freed >= excess:
+                break
+            conn.execute("DELETE FROM extractions WHERE doc_hash = ?", (doc_hash,))
+            conn.execute("DELETE FROM aliases WHERE doc_hash = ?", (doc_hash,))
+            freed += size
+            removed += 1
+        conn.commit()
+        print(f"[ExtractionCache] Evicted {removed} documents ({freed // 1024} KB)")
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and the hit rate for this process."""
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
@@ -0,0 +1,385 @@
+"""
+SageAlpha.ai Extraction Worker Pool
+Long-lived extraction processes with memory limits, job timeouts and recycling
+
+PyPDF2 can allocate gigabytes or spin forever on hostile PDFs. Extraction
+jobs therefore run in dedicated worker processes instead of the web worker:
+
+- each worker caps its address space (RLIMIT_AS), so a runaway allocation
+  fails with MemoryError inside that worker
+- a job that exceeds its timeout gets its worker killed and replaced
+- a worker that dies (segfault, OOM kill) fails only the job it was running
+- workers are recycled after a number of jobs or once their RSS grows
+
+Callers submit a picklable function and arguments and get a Future back.
+Each worker is driven by one dispatcher thread in the parent process.
+
+Workers are fresh interpreters started through a one-line bootstrap that
+imports only this module, not with multiprocessing's spawn/forkserver
+start methods: those re-run the parent's __main__ script in every worker,
+which for `python app.py` would repeat the whole app start-up (database,
+LLM client, a VectorStore with background threads) per worker.
+"""
+
+import atexit
+import multiprocessing
+import os
+import queue
+import signal
+import subprocess
+import sys
+import threading
+from concurrent.futures import Future
+from multiprocessing.connection import Connection
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+try:
+    import resource
+except ImportError:  # Not available on Windows: no memory limit
+    resource = None
+
+# ==================== Configuration ====================
+# Extra memory a worker may allocate beyond its start-up footprint (0 = no limit)
+EXTRACT_WORKER_MAX_MB = int(os.getenv("EXTRACT_WORKER_MAX_MB", "1536"))
+
+# Seconds a single job may run before its worker is killed (0 = no limit)
+EXTRACT_JOB_TIMEOUT = float(os.getenv("EXTRACT_JOB_TIMEOUT", "120"))
+
+# Jobs a worker runs before it is replaced with a fresh process
+EXTRACT_WORKER_MAX_JOBS = int(os.getenv("EXTRACT_WORKER_MAX_JOBS", "200"))
+
+# Resident memory after which a worker is replaced once its job finishes
+EXTRACT_WORKER_RECYCLE_MB = int(os.getenv("EXTRACT_WORKER_RECYCLE_MB", "768"))
+
+# Modules imported before the memory limit is measured and applied
+_PRELOAD_MODULES = ("numpy", "PyPDF2")
+
+# Worker entry point: a fresh interpreter that never imports the app
+_BOOTSTRAP = "from extraction_pool import _worker_bootstrap; _worker_bootstrap()"
+
+
+class ExtractionError(Exception):
+    """An extraction job failed outside the extraction code itself."""
+
+
+class ExtractionTimeout(ExtractionError):
+    """The job exceeded its timeout; its worker was killed."""
+
+
+class WorkerCrashed(ExtractionError):
+    """The worker process died while running the job."""
+
+
+def _memory_mb() -> Tuple[float, float]:
+    """Return (address space, resident set) of this process in megabytes."""
+    try:
+        with open("/proc/self/statm") as f:
+            size, rss = f.read().split()[:2]
+        page_mb = os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+        return int(size) * page_mb, int(rss) * page_mb
+    except (OSError, ValueError, AttributeError):
+        if resource is None:
+            return 0.0, 0.0
+        # ru_maxrss is a peak, in KB on Linux: good enough for recycling
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        return 0.0, peak
+
+
+def _worker_main(conn: Connection, max_mb: int, recycle_mb: int, max_jobs: int) -> None:
+    """
+    Worker loop: receive (fn, args, kwargs), reply (ok, value, retiring).
+
+    Runs jobs on the main thread so SIGALRM-based page timeouts work.
+    """
+    # Ctrl-C is handled by the parent, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    for name in _PRELOAD_MODULES:
+        try:
+            __import__(name)
+        except ImportError:
+            pass
+
+    if max_mb > 0 and resource is not None:
+        address_space, _ = _memory_mb()
+        limit = int((address_space + max_mb) * 1024 * 1024)
+        try:
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ValueError, OSError) as e:
+            print(f"[ExtractionPool] Could not set memory limit: {e}")
+
+    jobs = 0
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            return
+        if message is None:
+            return
+
+        fn, args, kwargs = message
+        out_of_memory = False
+        try:
+            reply: Tuple[bool, Any] = (True, fn(*args, **kwargs))
+        except MemoryError:
+            out_of_memory = True
+            reply = (False, ExtractionError(f"Worker exceeded its {max_mb} MB memory limit"))
+        except BaseException as e:
+            reply = (False, e)
+
+        jobs += 1
+        retiring = out_of_memory or jobs >= max_jobs or _memory_mb()[1] > recycle_mb
+        try:
+            conn.send((*reply, retiring))
+        except Exception as e:
+            # Unpicklable result or exception
+            conn.send((False, ExtractionError(f"Job result could not be returned: {e!r}"), retiring))
+        if retiring:
+            return
+
+
+def _worker_bootstrap() -> None:
+    """Run _worker_main in a bootstrapped worker (argv: fd max_mb recycle_mb max_jobs)."""
+    fd, max_mb, recycle_mb, max_jobs = (int(arg) for arg in sys.argv[1:5])
+    _worker_main(Connection(fd), max_mb, recycle_mb, max_jobs)
+
+
+class _WorkerProcess:
+    """A bootstrapped worker, with the multiprocessing.Process calls the pool uses."""
+
+    def __init__(self, popen: subprocess.Popen) -> None:
+        self._popen = popen
+
+    def is_alive(self) -> bool:
+        return self._popen.poll() is None
+
+    def kill(self) -> None:
+        self._popen.kill()
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        try:
+            self._popen.wait(timeout)
+        except subprocess.TimeoutExpired:
+            pass
+
+    @property
+    def exitcode(self) -> Optional[int]:
+        return self._popen.poll()
+
+
+Worker = Union[_WorkerProcess, multiprocessing.Process]
+
+
+class ExtractionPool:
+    """
+    Pool of isolated extraction worker processes.
+
+    Worker processes are started on demand (fresh interpreters, so the
+    multi-threaded server is never forked) and replaced after timeouts,
+    crashes and recycling.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        max_mb: int = EXTRACT_WORKER_MAX_MB,
+        job_timeout: float = EXTRACT_JOB_TIMEOUT,
+        max_jobs: int = EXTRACT_WORKER_MAX_JOBS,
+        recycle_mb: int = EXTRACT_WORKER_RECYCLE_MB,
+    ) -> None:
+        """
+        Start the dispatcher threads.
+
+        Args:
+            workers: Number of worker processes
+            max_mb: Extra memory each worker may allocate (0 = no limit)
+            job_timeout: Default seconds per job (0 = no limit)
+            max_jobs: Jobs per worker before it is replaced
+            recycle_mb: Resident memory that triggers replacement
+        """
+        self.workers = max(1, workers)
+        self.max_mb = max_mb
+        self.job_timeout = job_timeout
+        self.max_jobs = max(1, max_jobs)
+        self.recycle_mb = recycle_mb
+
+        self._jobs: "queue.Queue[Optional[Tuple[Future, Callable, tuple, dict, float]]]" = (
+            queue.Queue()
+        )
+        self._stats_lock = threading.Lock()
+        self._stats = {"jobs": 0, "errors": 0, "timeouts": 0, "crashes": 0, "recycled": 0}
+        self._closed = False
+
+        self._threads = [
+            threading.Thread(target=self._dispatch, name=f"extraction-slot-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(
+        self, fn: Callable[..., Any], *args: Any, timeout: Optional[float] = None, **kwargs: Any
+    ) -> Future:
+        """
+        Run fn(*args, **kwargs) in a worker process.
+
+        Args:
+            fn: Module-level (picklable) function
+            timeout: Seconds before the worker is killed (defaults to job_timeout)
+
+        Returns:
+            Future for the result; fails with ExtractionTimeout or
+            WorkerCrashed if the worker had to be killed or died
+        """
+        if self._closed:
+            raise RuntimeError("Extraction pool is shut down")
+        future: Future = Future()
+        self._jobs.put((future, fn, args, kwargs, self.job_timeout if timeout is None else timeout))
+        return future
+
+    def _spawn(self) -> Tuple[Worker, Connection]:
+        """Start a worker process connected by a pipe."""
+        parent_conn, child_conn = multiprocessing.Pipe()
+        args = (self.max_mb, self.recycle_mb, self.max_jobs)
+
+        if os.name != "posix":
+            # Pipe handles cannot be passed to a plain child process on
+            # Windows, so fall back to a spawned worker there
+            context = multiprocessing.get_context("spawn")
+            process: Worker = context.Process(
+                target=_worker_main, args=(child_conn, *args), daemon=True
+            )
+            process.start()
+        else:
+            fd = child_conn.fileno()
+            # The parent's import path, so job functions resolve the same way
+            env = {**os.environ, "PYTHONPATH": os.pathsep.join(_import_path())}
+            process = _WorkerProcess(
+                subprocess.Popen(
+                    [sys.executable, "-c", _BOOTSTRAP, str(fd), *map(str, args)],
+                    pass_fds=(fd,),
+                    env=env,
+                )
+            )
+        child_conn.close()
+        return process, parent_conn
+
+    @staticmethod
+    def _stop(process: Worker, conn: Connection, kill: bool) -> None:
+        """Stop a worker (killing it if it may be stuck) and release its pipe."""
+        if kill and process.is_alive():
+            process.kill()
+        process.join(5)
+        if process.is_alive():
+            process.kill()
+            process.join()
+        conn.close()
+
+    def _count(self, name: str) -> None:
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def _dispatch(self) -> None:
+        """Feed queued jobs to one worker process, replacing it as needed."""
+        process: Optional[Worker] = None
+        conn: Optional[Connection] = None
+        while True:
+            item = self._jobs.get()
+            if item is None:
+                break
+            future, fn, args, kwargs, timeout = item
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            if process is None:
+                process, conn = self._spawn()
+            self._count("jobs")
+
+            try:
+                conn.send((fn, args, kwargs))
+                if not conn.poll(timeout if timeout > 0 else None):
+                    print(f"[ExtractionPool] Job {fn.__name__} timed out after {timeout:g}s, worker killed")
+                    self._stop(process, conn, kill=True)
+                    process = conn = None
+                    self._count("timeouts")
+                    future.set_exception(
+                        ExtractionTimeout(f"{fn.__name__} exceeded {timeout:g}s")
+                    )
+                    continue
+                ok, value, retiring = conn.recv()
+            except (EOFError, OSError):
+                process.join(5)
+                code = process.exitcode
+                print(f"[ExtractionPool] Worker died during {fn.__name__} (exit code {code})")
+                self._stop(process, conn, kill=True)
+                process = conn = None
+                self._count("crashes")
+                future.set_exception(WorkerCrashed(f"Worker died with exit code {code}"))
+                continue
+
+            if retiring:
+                self._stop(process, conn, kill=False)
+                process = conn = None
+                self._count("recycled")
+            if ok:
+                future.set_result(value)
+            else:
+                self._count("errors")
+                future.set_exception(value)
+
+        if process is not None:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+            self._stop(process, conn, kill=False)
+
+    def shutdown(self) -> None:
+        """Stop accepting jobs and shut every worker down once the queue drains."""
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._threads:
+            self._jobs.put(None)
+        for thread in self._threads:
+            thread.join(10)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return job, failure and recycling counters for this process."""
+        with self._stats_lock:
+            return {"workers": self.workers, "queued": self._jobs.qsize(), **self._stats}
+
+
+def _import_path() -> List[str]:
+    """sys.path of this process as absolute directories (for workers)."""
+    return [os.path.abspath(path or os.curdir) for path in sys.path]
+
+
+_pool: Optional[ExtractionPool] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+
+
+def get_extraction_pool(workers: int) -> ExtractionPool:
+    """
+    Return this process's shared pool, creating it on first use.
+
+    Args:
+        workers: Worker processes (only used when the pool is created)
+    """
+    global _pool, _pool_pid
+    with _pool_lock:
+        # A forked child inherits the object but not the dispatcher threads
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ExtractionPool(workers)
+            _pool_pid = os.getpid()
+            atexit.register(_pool.shutdown)
+        return _pool
+
+
+def extraction_pool_stats() -> Optional[Dict[str, Any]]:
+    """Return the shared pool's counters, or None if it was never started."""
+    pool = _pool
+    if pool is None or _pool_pid != os.getpid():
+        return None
+    return pool.stats()
@@ -1,15 +1,402 @@
 """
 SageAlpha.ai Document Extraction Utilities
 Extract text from PDF and XBRL files for indexing
+
+PDFs are parsed in isolated extraction workers (see extraction_pool), so a
+hostile file can only take down a worker, never the web process. Large
+documents are split into page ranges that run in parallel, and every page
+gets its own timeout so one malformed page cannot stall the whole document.
+
+XBRL instances are streamed with iterparse into a columnar fact table
+(XbrlFacts) that can be queried numerically or rendered as text for RAG.
+Statement tables in PDF text (income statements, balance sheets) are
+detected line by line and returned as FinancialTable arrays with row labels
+and periods, so ratios can be computed without re-reading the text.
 """
 
 import io
+import multiprocessing
+import os
 import re
+import signal
+import tempfile
+import threading
 import xml.etree.ElementTree as ET
-from typing import List
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, BinaryIO, Deque, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
+import numpy as np
 from PyPDF2 import PdfReader
 
+from extraction_pool import ExtractionError, ExtractionPool, get_extraction_pool
+
+# ==================== PDF Extraction Configuration ====================
+# Extraction worker processes (0 = one per CPU)
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", "0"))
+
+# Parse PDFs in isolated worker processes (false = in the calling process)
+PDF_EXTRACT_ISOLATED = os.getenv("PDF_EXTRACT_ISOLATED", "true").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+
+# Seconds a single page may take before it is skipped (0 = no limit)
+PDF_PAGE_TIMEOUT = float(os.getenv("PDF_PAGE_TIMEOUT", "10"))
+
+# Documents with fewer pages are extracted as a single job
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "16"))
+
+# Upper bound on pages per shard, so the first pages stream out early
+PDF_SHARD_MAX_PAGES = 16
+
+# Classify pages from their object tree before extract_text, skipping
+# scanned and blank pages that cannot yield text
+PDF_LAYOUT_PREPASS = os.getenv("PDF_LAYOUT_PREPASS", "true").lower() in ("1", "true", "yes")
+
+# Page classes returned by classify_page
+PAGE_TEXT = "text"
+PAGE_SCANNED = "scanned"
+PAGE_BLANK = "blank"
+
+
+class PageTimeout(BaseException):
+    """
+    Raised inside a page extraction that exceeded PDF_PAGE_TIMEOUT.
+
+    Derives from BaseException so PyPDF2's own "except Exception" handlers
+    cannot swallow it.
+    """
+
+
+def _raise_page_timeout(signum, frame) -> None:
+    raise PageTimeout()
+
+
+def _extract_page(reader: PdfReader, index: int, timeout: float) -> str:
+    """
+    Extract the text of one page, giving up after timeout seconds.
+
+    The timeout uses SIGALRM, so it only applies on platforms with
+    setitimer and when running on the main thread (always true in pool
+    workers); elsewhere the page runs unbounded.
+    """
+    use_alarm = (
+        timeout > 0
+        and hasattr(signal, "setitimer")
+        and threading.current_thread() is threading.main_thread()
+    )
+    previous = None
+    try:
+        if use_alarm:
+            previous = signal.signal(signal.SIGALRM, _raise_page_timeout)
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+        return reader.pages[index].extract_text() or ""
+    except PageTimeout:
+        print(f"[extractor] Page {index + 1} timed out after {timeout:g}s, skipped")
+        return ""
+    except Exception:
+        return ""
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+
+
+def _scan_resources(resources: Any, depth: int = 0) -> Tuple[bool, bool]:
+    """
+    Return (has fonts, has images) for a resource dictionary, looking into
+    form XObjects (which carry their own resources) a few levels deep.
+    """
+    if not resources:
+        return False, False
+    resources = resources.get_object()
+    fonts = bool(resources.get("/Font"))
+    images = False
+    xobjects = resources.get("/XObject")
+    if xobjects:
+        for ref in xobjects.get_object().values():
+            xobject = ref.get_object()
+            subtype = xobject.get("/Subtype")
+            if subtype == "/Image":
+                images = True
+            elif subtype == "/Form" and depth < 3:
+                form_fonts, form_images = _scan_resources(xobject.get("/Resources"), depth + 1)
+                fonts = fonts or form_fonts
+                images = images or form_images
+            if fonts and images:
+                break
+    return fonts, images
+
+
+def classify_page(page: Any) -> str:
+    """
+    Classify a page from its object tree, without parsing its content.
+
+    Text can only be drawn with a font resource, so a page without fonts is
+    either an image (scanned) or blank, whatever extract_text would do with
+    its content stream.
+
+    Args:
+        page: PyPDF2 page object
+
+    Returns:
+        PAGE_TEXT, PAGE_SCANNED or PAGE_BLANK (PAGE_TEXT when unsure)
+    """
+    try:
+        resources = page.get("/Resources")
+        fonts, images = _scan_resources(resources)
+        if fonts:
+            return PAGE_TEXT
+        return PAGE_SCANNED if images else PAGE_BLANK
+    except Exception:
+        return PAGE_TEXT
+
+
+def classify_pdf_pages(source: Union[str, BinaryIO]) -> List[str]:
+    """
+    Classify every page of a PDF as text, scanned or blank.
+
+    Callers can route scanned pages to a slower path (e.g. OCR), which the
+    text extraction functions skip.
+
+    Args:
+        source: PDF file path or binary stream
+
+    Returns:
+        One class per page, in page order
+    """
+    return [classify_page(page) for page in PdfReader(source).pages]
+
+
+def _extract_page_range(
+    source: Union[str, PdfReader], start: int, end: int, timeout: float
+) -> List[Tuple[int, str]]:
+    """
+    Extract pages [start, end) of a PDF.
+
+    With PDF_LAYOUT_PREPASS, scanned and blank pages are recognized from
+    their resources and skipped before the costly extract_text call.
+
+    Args:
+        source: PDF file path (in pool workers) or an open reader
+        start: First page index (0-based)
+        end: Page index to stop before
+        timeout: Per-page timeout in seconds
+
+    Returns:
+        (1-based page number, text) for every page that has text
+    """
+    reader = PdfReader(source) if isinstance(source, str) else source
+    pages = []
+    skipped = {PAGE_SCANNED: 0, PAGE_BLANK: 0}
+    for index in range(start, end):
+        if PDF_LAYOUT_PREPASS:
+            kind = classify_page(reader.pages[index])
+            if kind != PAGE_TEXT:
+                skipped[kind] += 1
+                continue
+        text = _extract_page(reader, index, timeout)
+        if text.strip():
+            pages.append((index + 1, text))
+    if skipped[PAGE_SCANNED] or skipped[PAGE_BLANK]:
+        print(
+            f"[extractor] Pages {start + 1}-{end}: skipped {skipped[PAGE_SCANNED]} scanned, "
+            f"{skipped[PAGE_BLANK]} blank"
+        )
+    return pages
+
+
+def _worker_count(workers: Optional[int]) -> int:
+    """Resolve the configured worker count."""
+    workers = workers if workers is not None else PDF_EXTRACT_WORKERS
+    if workers > 0:
+        return workers
+    # Respect container CPU affinity where the platform exposes it
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0)) or 1
+    return os.cpu_count() or 1
+
+
+def _count_pages(path: str) -> int:
+    """Return the page count of a PDF file (runs in a pool worker)."""
+    return len(PdfReader(path).pages)
+
+
+def _iter_pages_in_process(
+    source: Union[str, BinaryIO], timeout: float
+) -> Iterator[Tuple[int, str]]:
+    """Yield page texts, parsing the PDF in the calling process."""
+    reader = PdfReader(source)
+    num_pages = len(reader.pages)
+    for start in range(0, num_pages, PDF_SHARD_MAX_PAGES):
+        end = min(start + PDF_SHARD_MAX_PAGES, num_pages)
+        yield from _extract_page_range(reader, start, end, timeout)
+
+
+def _retry_pages(
+    pool: ExtractionPool,
+    path: str,
+    start: int,
+    end: int,
+    timeout: float,
+    skipped: Optional[List[int]] = None,
+) -> List[Tuple[int, str]]:
+    """
+    Re-run a failed range one page per job, so only the offending pages
+    are lost. Lost page numbers are appended to skipped.
+    """
+    futures = [
+        (index, pool.submit(_extract_page_range, path, index, index + 1, timeout))
+        for index in range(start, end)
+    ]
+    pages = []
+    for index, future in futures:
+        try:
+            pages.extend(future.result())
+        except ExtractionError as e:
+            print(f"[extractor] Page {index + 1} skipped: {e}")
+            if skipped is not None:
+                skipped.append(index + 1)
+    return pages
+
+
+def _iter_pages(
+    path: str,
+    workers: Optional[int],
+    page_timeout: Optional[float],
+    skipped: Optional[List[int]] = None,
+) -> Iterator[Tuple[int, str]]:
+    """
+    Yield page texts in page order, sharded over the extraction pool.
+
+    The PDF is only ever opened inside pool workers. At most two shards per
+    worker are in flight, so pages stream out as soon as the leading shard
+    finishes and memory stays bounded for very long documents. A shard
+    whose worker timed out or crashed is retried page by page.
+
+    Args:
+        path: PDF file path
+        workers: Worker processes (defaults to PDF_EXTRACT_WORKERS)
+        page_timeout: Per-page timeout (defaults to PDF_PAGE_TIMEOUT)
+        skipped: Receives the numbers of pages lost to a worker timeout or
+            crash, so callers can tell a partial extraction apart
+
+    Yields:
+        (1-based page number, text) for every page that has text
+    """
+    timeout = PDF_PAGE_TIMEOUT if page_timeout is None else page_timeout
+    workers = _worker_count(workers)
+
+    # Daemonic processes (e.g. Celery prefork children) cannot start
+    # workers; they are already isolated from the web server
+    if not PDF_EXTRACT_ISOLATED or multiprocessing.current_process().daemon:
+        yield from _iter_pages_in_process(path, timeout)
+        return
+
+    pool = get_extraction_pool(workers)
+    try:
+        num_pages = pool.submit(_count_pages, path).result()
+    except ExtractionError as e:
+        raise ValueError(f"Could not read PDF: {e}") from e
+
+    if num_pages < PDF_PARALLEL_MIN_PAGES:
+        shard = max(num_pages, 1)
+    else:
+        # At least two shards per worker so one slow range does not idle the rest
+        shard = max(1, min(PDF_SHARD_MAX_PAGES, -(-num_pages // (workers * 2))))
+    ranges = [(i, min(i + shard, num_pages)) for i in range(0, num_pages, shard)]
+
+    pending: Deque[Tuple[int, int, Future]] = deque()
+    next_range = 0
+    while pending or next_range < len(ranges):
+        while next_range < len(ranges) and len(pending) < workers * 2:
+            start, end = ranges[next_range]
+            pending.append((start, end, pool.submit(_extract_page_range, path, start, end, timeout)))
+            next_range += 1
+
+        start, end, future = pending.popleft()
+        try:
+            pages = future.result()
+        except ExtractionError as e:
+            print(f"[extractor] Pages {start + 1}-{end} failed ({e}), retrying page by page")
+            pages = _retry_pages(pool, path, start, end, timeout, skipped)
+        yield from pages
+
+
+def iter_pdf_file_pages(
+    file_path: str,
+    workers: Optional[int] = None,
+    page_timeout: Optional[float] = None,
+    skipped: Optional[List[int]] = None,
+) -> Iterator[Tuple[int, str]]:
+    """
+    Stream per-page text from a PDF file path.
+
+    Args:
+        file_path: Path to the PDF file
+        workers: Worker processes (defaults to PDF_EXTRACT_WORKERS)
+        page_timeout: Per-page timeout in seconds (defaults to PDF_PAGE_TIMEOUT)
+        skipped: Receives the numbers of pages lost to a worker failure
+
+    Yields:
+        (1-based page number, text) for every page that has text, in order
+    """
+    yield from _iter_pages(file_path, workers, page_timeout, skipped)
+
+
+def extract_pdf_pages(
+    pdf_bytes: bytes,
+    workers: Optional[int] = None,
+    page_timeout: Optional[float] = None,
+    skipped: Optional[List[int]] = None,
+) -> List[Tuple[int, str]]:
+    """
+    Extract per-page text from PDF bytes.
+
+    Args:
+        pdf_bytes: Raw PDF file bytes
+        workers: Worker processes (defaults to PDF_EXTRACT_WORKERS)
+        page_timeout: Per-page timeout in seconds (defaults to PDF_PAGE_TIMEOUT)
+        skipped: Receives the numbers of pages lost to a worker failure
+
+    Returns:
+        (1-based page number, text) for every page that has text, in order
+    """
+    if not PDF_EXTRACT_ISOLATED:
+        timeout = PDF_PAGE_TIMEOUT if page_timeout is None else page_timeout
+        return list(_iter_pages_in_process(io.BytesIO(pdf_bytes), timeout))
+
+    # Workers read the document from a temporary file instead of each
+    # receiving a pickled copy of the bytes
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(pdf_bytes)
+        return list(_iter_pages(path, workers, page_timeout, skipped))
+    finally:
+        os.remove(path)
+
+
+def extract_pdf_file_pages(
+    file_path: str,
+    workers: Optional[int] = None,
+    page_timeout: Optional[float] = None,
+) -> List[Tuple[int, str]]:
+    """
+    Extract per-page text from a PDF file path.
+
+    Args:
+        file_path: Path to the PDF file
+        workers: Worker processes (defaults to PDF_EXTRACT_WORKERS)
+        page_timeout: Per-page timeout in seconds (defaults to PDF_PAGE_TIMEOUT)
+
+    Returns:
+        (1-based page number, text) for every page that has text, in order
+    """
+    return list(iter_pdf_file_pages(file_path, workers, page_timeout))
+
 
 def extract_text_from_pdf_bytes(pdf_bytes: bytes) -> str:
     """
@@ -21,18 +408,7 @@ def extract_text_from_pdf_bytes(pdf_bytes: bytes) -> str:
     Returns:
         Extracted text content as string
     """
-    reader = PdfReader(io.BytesIO(pdf_bytes))
-    texts: List[str] = []
-
-    for page in reader.pages:
-        try:
-            text = page.extract_text() or ""
-            if text.strip():
-                texts.append(text)
-        except Exception:
-            continue
-
-    return "\n".join(texts)
+    return "\n".join(text for _, text in extract_pdf_pages(pdf_bytes))
 
 
 def extract_text_from_pdf_file(file_path: str) -> str:
@@ -45,94 +421,503 @@ def extract_text_from_pdf_file(file_path: str) -> str:
     Returns:
         Extracted text content as string
     """
-    with open(file_path, "rb") as f:
-        return extract_text_from_pdf_bytes(f.read())
+    return "\n".join(text for _, text in extract_pdf_file_pages(file_path))
 
 
-def parse_xbrl_file_to_text(xml_bytes: bytes) -> str:
+# ==================== XBRL ====================
+
+_NUMERIC_RE = re.compile(r"^-?[\d,]*\.?\d+$")
+_XSI_NIL = "{http://www.w3.org/2001/XMLSchema-instance}nil"
+
+# Non-numeric facts longer than this (narrative/HTML text blocks) are left
+# out of the text rendering
+XBRL_TEXT_FACT_MAX_CHARS = 200
+
+
+def _local_name(tag: str) -> Tuple[str, str]:
+    """Split an ElementTree "{uri}local" tag into (uri, local name)."""
+    if tag.startswith("{"):
+        uri, local = tag[1:].split("}", 1)
+        return uri, local
+    return "", tag
+
+
+class XbrlFacts:
+    """
+    Columnar table of XBRL facts.
+
+    String columns are lists aligned by row; numeric values are a float64
+    array with NaN for text or nil facts, so facts can be filtered and
+    aggregated without re-parsing the document.
     """
-    Parse XBRL/XML file and extract structured text.
 
-    This is a simple extractor that captures numeric facts and key elements.
-    For production use, consider using Arelle or a robust XBRL parser.
+    COLUMNS = (
+        "concept",
+        "context",
+        "unit",
+        "period_start",
+        "period_end",
+        "dimensions",
+        "decimals",
+        "value",
+    )
+
+    def __init__(self, rows: Dict[str, List[Any]]) -> None:
+        """
+        Build the table from per-column lists.
+
+        Args:
+            rows: Column name -> list of values (see COLUMNS)
+        """
+        for name in self.COLUMNS:
+            setattr(self, name, rows.get(name, []))
+        self.numeric = np.array(
+            [self._to_float(v, u) for v, u in zip(self.value, self.unit)], dtype=np.float64
+        )
+
+    @staticmethod
+    def _to_float(value: str, unit: str) -> float:
+        """Parse a numeric fact value; text facts become NaN."""
+        if not unit or not _NUMERIC_RE.match(value):
+            return float("nan")
+        return float(value.replace(",", ""))
+
+    def __len__(self) -> int:
+        return len(self.concept)
+
+    def where(self, **criteria: str) -> np.ndarray:
+        """
+        Return the row indices whose columns equal the given values.
+
+        Args:
+            criteria: Column name -> required value, e.g. concept="in-bse-fin:Revenue"
+
+        Returns:
+            Array of matching row indices
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for name, wanted in criteria.items():
+            mask &= np.array([v == wanted for v in getattr(self, name)], dtype=bool)
+        return np.flatnonzero(mask)
+
+    def to_dataframe(self):
+        """Return the facts as a pandas DataFrame (pandas imported lazily)."""
+        import pandas as pd
+
+        data = {name: getattr(self, name) for name in self.COLUMNS}
+        data["numeric"] = self.numeric
+        return pd.DataFrame(data)
+
+    def to_text(self) -> str:
+        """Render one line per fact for RAG indexing."""
+        lines = []
+        for i in range(len(self)):
+            value = self.value[i]
+            if not value:
+                continue
+            if np.isnan(self.numeric[i]) and len(value) > XBRL_TEXT_FACT_MAX_CHARS:
+                continue
+            period = self.period_end[i]
+            if self.period_start[i]:
+                period = f"{self.period_start[i]} to {self.period_end[i]}"
+            qualifiers = [q for q in (period, self.unit[i], self.dimensions[i]) if q]
+            label = self.concept[i].split(":", 1)[-1]
+            if qualifiers:
+                label += f" ({'; '.join(qualifiers)})"
+            lines.append(f"{label}: {value}")
+        return "\n".join(lines)
+
+
+def parse_xbrl_facts(source: Union[bytes, str, BinaryIO]) -> XbrlFacts:
+    """
+    Stream an XBRL instance into a columnar fact table.
+
+    Uses iterparse and clears every top-level element once it has been
+    read, so memory stays proportional to the contexts and facts kept
+    rather than the document tree.
 
     Args:
-        xml_bytes: Raw XML/XBRL file bytes
+        source: Raw XML bytes, a file path or a binary file object
 
     Returns:
-        Extracted text summary
+        XbrlFacts with one row per fact
     """
-    root = ET.fromstring(xml_bytes)
-
-    # Build namespace map for reference
-    ns_map: dict = {}
-    for key, value in root.attrib.items():
-        if key.startswith("xmlns"):
-            parts = key.split(":")
-            prefix = parts[1] if len(parts) > 1 else ""
-            ns_map[prefix] = value
-
-    facts: List[str] = []
-
-    # Important element tags to capture
-    important_tags = {
-        "entityregistrantname",
-        "contextref",
-        "period",
-        "instant",
-        "startdate",
-        "enddate",
-        "documenttype",
-        "tradingsymbol",
-        "securityexchangename",
-    }
-
-    for elem in root.iter():
-        tag = elem.tag
-        if "}" in tag:
-            tag_clean = tag.split("}", 1)[1]
-        else:
-            tag_clean = tag
-
-        text = (elem.text or "").strip()
-        if not text:
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+
+    prefixes: Dict[str, str] = {}
+    contexts: Dict[str, Tuple[str, str, str]] = {}
+    units: Dict[str, str] = {}
+    facts: List[Tuple[str, str, str, str, str]] = []
+
+    root = None
+    depth = 0
+    for event, item in ET.iterparse(source, events=("start-ns", "start", "end")):
+        if event == "start-ns":
+            prefix, uri = item
+            prefixes.setdefault(uri, prefix)
+            continue
+        if event == "start":
+            if root is None:
+                root = item
+            depth += 1
             continue
 
-        # Capture numeric values
-        if re.match(r"^[\d\.\-\,]+$", text) and len(text) < 30:
-            facts.append(f"{tag_clean}: {text}")
+        depth -= 1
+        if depth != 1:
+            continue
 
-        # Capture important labeled items
-        if tag_clean.lower() in important_tags:
-            facts.append(f"{tag_clean}: {text}")
+        # A complete top-level element: context, unit or fact
+        uri, local = _local_name(item.tag)
+        if local == "context":
+            contexts[item.get("id", "")] = _parse_context(item)
+        elif local == "unit":
+            units[item.get("id", "")] = _parse_unit(item)
+        elif item.get("contextRef") is not None:
+            prefix = prefixes.get(uri, "")
+            text = "" if item.get(_XSI_NIL) == "true" else (item.text or "").strip()
+            facts.append(
+                (
+                    f"{prefix}:{local}" if prefix else local,
+                    item.get("contextRef", ""),
+                    item.get("unitRef", ""),
+                    item.get("decimals", ""),
+                    text,
+                )
+            )
+        root.clear()
+
+    rows: Dict[str, List[Any]] = {name: [] for name in XbrlFacts.COLUMNS}
+    for concept, context_ref, unit_ref, decimals, text in facts:
+        start, end, dimensions = contexts.get(context_ref, ("", "", ""))
+        rows["concept"].append(concept)
+        rows["context"].append(context_ref)
+        rows["unit"].append(units.get(unit_ref, unit_ref))
+        rows["period_start"].append(start)
+        rows["period_end"].append(end)
+        rows["dimensions"].append(dimensions)
+        rows["decimals"].append(decimals)
+        rows["value"].append(text)
+    return XbrlFacts(rows)
+
+
+def _parse_context(elem: ET.Element) -> Tuple[str, str, str]:
+    """Return (period start, period end or instant, dimensions) of a context."""
+    start = end = ""
+    dimensions = []
+    for child in elem.iter():
+        _, local = _local_name(child.tag)
+        text = (child.text or "").strip()
+        if local == "startDate":
+            start = text
+        elif local in ("endDate", "instant"):
+            end = text
+        elif local in ("explicitMember", "typedMember"):
+            dimension = child.get("dimension", "").split(":", 1)[-1]
+            member = text.split(":", 1)[-1] or "".join(child.itertext()).strip()
+            dimensions.append(f"{dimension}={member}")
+    return start, end, ", ".join(dimensions)
+
+
+def _parse_unit(elem: ET.Element) -> str:
+    """Return a unit's measures, e.g. "INR" or "INR/shares"."""
+    numerator: List[str] = []
+    denominator: List[str] = []
+    target = numerator
+    for child in elem.iter():
+        _, local = _local_name(child.tag)
+        if local == "unitDenominator":
+            target = denominator
+        elif local == "measure":
+            target.append((child.text or "").strip().split(":", 1)[-1])
+    unit = "*".join(numerator)
+    return f"{unit}/{'*'.join(denominator)}" if denominator else unit
 
-    # Build summary
-    summary = "\n".join(facts)
+
+def parse_xbrl_file_to_text(xml_bytes: bytes) -> str:
+    """
+    Parse XBRL/XML file and extract structured text.
+
+    Facts are read with the streaming parser (see parse_xbrl_facts) and
+    rendered one per line with their period, unit and dimensions.
+
+    Args:
+        xml_bytes: Raw XML/XBRL file bytes
+
+    Returns:
+        Extracted text summary
+    """
+    summary = parse_xbrl_facts(xml_bytes).to_text()
 
     # Fallback if no facts extracted
     if not summary:
-        summary = ET.tostring(root, encoding="unicode")[:2000]
+        summary = xml_bytes[:2000].decode("utf-8", errors="ignore")
 
     return summary
 
 
-def clean_text(text: str) -> str:
+# ==================== Financial Tables ====================
+
+# A cell: 1,23,456.78 / (1,234) / -12.5 / 12% with an optional currency mark
+_AMOUNT_RE = re.compile(r"^\(?[-−]?(?:₹|Rs\.?|\$)?\d[\d,]*(?:\.\d+)?\)?%?$")
+# Empty cells are printed as dashes or "Nil"
+_EMPTY_CELL_RE = re.compile(r"^(?:-|–|—|nil|NIL|Nil)$")
+_YEAR_RE = re.compile(r"^(?:19|20)\d{2}$")
+_PERIOD_RE = re.compile(
+    r"(?:Q[1-4]|H[12]|[1-9]M)\s?FY\s?'?\d{2,4}"
+    r"|FY\s?'?\d{2,4}(?:-\d{2,4})?"
+    r"|\d{1,2}(?:st|nd|rd|th)?[ .-]?(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\.?,?[ .-]?\d{2,4}"
+    r"|(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\.?\s+\d{1,2},?\s+\d{4}"
+    r"|\d{1,2}[./-]\d{1,2}[./-]\d{2,4}"
+    r"|(?<![\d,.])(?:19|20)\d{2}(?:-\d{2})?(?![\d,.])",
+    re.IGNORECASE,
+)
+_STATEMENT_RE = re.compile(
+    r"balance sheet|profit (?:and|&) loss|income|cash flow|statement|results|financial",
+    re.IGNORECASE,
+)
+_TABLE_UNIT_RE = re.compile(
+    r"(?:₹|Rs\.?|INR|USD|\$)?\s*in\s+(crores?|lakhs?|lacs?|millions?|billions?|thousands?)",
+    re.IGNORECASE,
+)
+
+# Minimum numeric rows for a run of lines to count as a table
+TABLE_MIN_ROWS = 3
+# Lines above a table searched for its period header, title and unit
+TABLE_HEADER_LINES = 6
+
+
+def _parse_amount(cell: str) -> float:
+    """Parse a statement cell; parentheses mean negative, dashes mean empty."""
+    if _EMPTY_CELL_RE.match(cell):
+        return float("nan")
+    negative = cell.startswith("(") and cell.endswith(")")
+    cell = cell.strip("()%").replace(",", "").replace("−", "-")
+    cell = re.sub(r"^(?:₹|Rs\.?|\$)", "", cell)
+    value = float(cell)
+    return -value if negative else value
+
+
+def _split_row(line: str) -> Optional[Tuple[str, List[str]]]:
+    """Split a line into (label, trailing numeric cells), or None if it is not a row."""
+    tokens = line.split()
+    cells: List[str] = []
+    while tokens and (_AMOUNT_RE.match(tokens[-1]) or _EMPTY_CELL_RE.match(tokens[-1])):
+        cells.append(tokens.pop())
+    label = " ".join(tokens)
+    if not cells or not re.search(r"[A-Za-z]", label):
+        return None
+    filled = [c for c in cells if not _EMPTY_CELL_RE.match(c)]
+    # All-dash lines are rules; all-year cells are a period header
+    if not filled or all(_YEAR_RE.match(c) for c in filled):
+        return None
+    cells.reverse()
+    return label.rstrip(" :"), cells
+
+
+class FinancialTable:
+    """
+    A statement table as typed columns.
+
+    values is a float64 array of shape (rows, periods) in the units printed
+    on the statement, with NaN for empty cells and section headings.
+    """
+
+    def __init__(
+        self,
+        labels: List[str],
+        periods: List[str],
+        values: np.ndarray,
+        title: Optional[str] = None,
+        unit: Optional[str] = None,
+        page: Optional[int] = None,
+    ) -> None:
+        self.labels = labels
+        self.periods = periods
+        self.values = values
+        self.title = title
+        self.unit = unit
+        self.page = page
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def row(self, label: str) -> Optional[np.ndarray]:
+        """
+        Return the values of a row by label.
+
+        Args:
+            label: Row label (case-insensitive; exact match preferred over prefix)
+
+        Returns:
+            One value per period, or None if no row matches
+        """
+        wanted = label.lower()
+        lowered = [l.lower() for l in self.labels]
+        for candidates in (
+            [i for i, l in enumerate(lowered) if l == wanted],
+            [i for i, l in enumerate(lowered) if l.startswith(wanted)],
+        ):
+            if candidates:
+                return self.values[candidates[0]]
+        return None
+
+    def ratio(self, numerator: str, denominator: str) -> Optional[np.ndarray]:
+        """
+        Compute a per-period ratio of two rows, e.g. ratio("Net profit", "Revenue").
+
+        Returns:
+            numerator / denominator per period (NaN where undefined), or None
+            if either row is missing
+        """
+        top = self.row(numerator)
+        bottom = self.row(denominator)
+        if top is None or bottom is None:
+            return None
+        with np.errstate(divide="ignore", invalid="ignore"):
+            result = top / bottom
+        result[~np.isfinite(result)] = np.nan
+        return result
+
+    def to_dataframe(self):
+        """Return the table as a pandas DataFrame indexed by row label."""
+        import pandas as pd
+
+        return pd.DataFrame(self.values, index=self.labels, columns=self.periods)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return a JSON-serializable form (NaN becomes None)."""
+        return {
+            "title": self.title,
+            "unit": self.unit,
+            "page": self.page,
+            "periods": self.periods,
+            "labels": self.labels,
+            "values": [
+                [None if np.isnan(v) else float(v) for v in row] for row in self.values
+            ],
+        }
+
+    def to_text(self) -> str:
+        """Render as a pipe-separated table."""
+        lines = []
+        if self.title:
+            lines.append(self.title + (f" ({self.unit})" if self.unit else ""))
+        lines.append(" | ".join(["Particulars", *self.periods]))
+        for label, row in zip(self.labels, self.values):
+            cells = ["" if np.isnan(v) else f"{v:.15g}" for v in row]
+            lines.append(" | ".join([label, *cells]))
+        return "\n".join(lines)
+
+
+def _build_table(
+    header: List[str], rows: List[Tuple[str, List[str]]], page: Optional[int]
+) -> FinancialTable:
+    """Turn a run of parsed rows (and the lines above it) into a table."""
+    counts = [len(cells) for _, cells in rows if cells]
+    width = max(set(counts), key=counts.count)
+
+    # Lines below the last full row (page numbers, footnotes) are not part of it
+    while len(rows) > 1 and len(rows[-1][1]) < width:
+        rows = rows[:-1]
+
+    periods: List[str] = []
+    title = unit = None
+    for line in reversed(header):
+        if not periods:
+            found = _PERIOD_RE.findall(line)
+            if len(found) >= width:
+                periods = [p.strip() for p in found[-width:]]
+                continue
+        unit_match = _TABLE_UNIT_RE.search(line)
+        if unit is None and unit_match:
+            unit = unit_match.group(1).lower()
+        elif title is None and _STATEMENT_RE.search(line):
+            title = line
+    if not periods:
+        periods = [f"Column {i + 1}" for i in range(width)]
+
+    labels: List[str] = []
+    values = np.full((len(rows), width), np.nan, dtype=np.float64)
+    for r, (label, cells) in enumerate(rows):
+        # Extra leading cells are note references; missing cells are trailing
+        for c, cell in enumerate(cells[-width:]):
+            try:
+                values[r, c] = _parse_amount(cell)
+            except ValueError:
+                pass
+        labels.append(label)
+    return FinancialTable(labels, periods, values, title=title, unit=unit, page=page)
+
+
+def extract_tables_from_text(text: str, page: Optional[int] = None) -> List[FinancialTable]:
     """
-    Clean extracted text by removing excess whitespace and normalizing.
+    Detect statement tables in extracted page text.
+
+    A table is a run of at least TABLE_MIN_ROWS lines that end in numeric
+    cells (a single text-only line inside a run is kept as a section
+    heading row). Periods, title and unit are read from the lines above.
 
     Args:
-        text: Raw extracted text
+        text: Raw page text (before clean_text, which drops line breaks)
+        page: Page number recorded on the tables
 
     Returns:
-        Cleaned text
+        Tables in reading order
     """
-    if not text:
-        return ""
+    lines = [line.strip() for line in text.splitlines()]
+    tables: List[FinancialTable] = []
+    i = 0
+    while i < len(lines):
+        if _split_row(lines[i]) is None:
+            i += 1
+            continue
 
-    # Normalize whitespace
-    text = re.sub(r"\s+", " ", text)
+        start = i
+        rows: List[Tuple[str, List[str]]] = []
+        while i < len(lines):
+            parsed = _split_row(lines[i])
+            if parsed is not None:
+                rows.append(parsed)
+                i += 1
+                continue
+            following = _split_row(lines[i + 1]) if i + 1 < len(lines) else None
+            if lines[i] and following is not None and len(rows) > 0:
+                rows.append((lines[i].rstrip(" :"), []))
+                i += 1
+                continue
+            break
+
+        if sum(1 for _, cells in rows if cells) >= TABLE_MIN_ROWS:
+            header = [l for l in lines[max(0, start - TABLE_HEADER_LINES) : start] if l]
+            tables.append(_build_table(header, rows, page))
+    return tables
+
+
+def extract_tables_from_pages(pages: Iterable[Tuple[int, str]]) -> List[FinancialTable]:
+    """
+    Detect statement tables across extracted pages.
 
-    # Remove control characters
-    text = re.sub(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f-\x9f]", "", text)
+    Args:
+        pages: (page number, text) pairs, e.g. from extract_pdf_pages
+
+    Returns:
+        Tables in document order
+    """
+    tables: List[FinancialTable] = []
+    for page, text in pages:
+        tables.extend(extract_tables_from_text(text, page))
+    return tables
 
-    return text.strip()
+
+def extract_pdf_tables(pdf_bytes: bytes) -> List[FinancialTable]:
+    """
+    Extract statement tables from PDF bytes.
+
+    Args:
+        pdf_bytes: Raw PDF file bytes
+
+    Returns:
+        Tables in document order
+    """
+    return extract_tables_from_pages(extract_pdf_pages(pdf_bytes))
@@ -0,0 +1,662 @@
+"""
+SageAlpha.ai LLM Gateway
+Pooled, rate-limited and retrying access to the chat completion API
+
+Every chat completion in a process goes through one gateway:
+
+- one pooled HTTP client, so keep-alive connections are reused
+- a concurrency cap, so bursts queue here instead of piling up at Azure
+- per-deployment token buckets for requests and tokens per minute; a
+  request reserves its prompt tokens plus max_tokens, as Azure counts them,
+  and a 429 pauses the deployment for its retry-after
+- retries with exponential backoff honoring retry-after(-ms), inside an
+  overall deadline that stays below the Gunicorn worker timeout
+- hedging: a request still running after the recent p95 latency for the
+  same deployment and max_tokens is raced against a second copy, and the
+  first answer wins
+- coalescing: identical concurrent non-streaming requests share one call
+
+LLMGateway.create mirrors client.chat.completions.create (and is exposed
+under that name), and acreate is the asyncio version. Set LLM_BASE_URL to
+point the OpenAI client at another server, such as stub_llm_server.py.
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures import wait
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+from openai import (
+    APIConnectionError,
+    APITimeoutError,
+    AsyncAzureOpenAI,
+    AsyncOpenAI,
+    AzureOpenAI,
+    InternalServerError,
+    OpenAI,
+    RateLimitError,
+)
+
+from singleflight import SingleFlight, request_key
+from tokenizer import count_tokens
+
+# ==================== Configuration ====================
+# Concurrent requests per process; further requests wait for a free slot
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+
+# Requests and tokens per minute per deployment and process (0 = unlimited);
+# divide the deployment's quota by the number of worker processes
+LLM_RPM = int(os.getenv("LLM_RPM", "0"))
+LLM_TPM = int(os.getenv("LLM_TPM", "0"))
+
+# Seconds per HTTP attempt
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+
+# Seconds for a whole call including queueing, throttling and retries
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "100"))
+
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+
+# Latency percentile after which a second copy of a request is sent (0 = never)
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+
+# A request is never hedged before this many seconds
+LLM_HEDGE_MIN_SECONDS = float(os.getenv("LLM_HEDGE_MIN_SECONDS", "2"))
+
+# Identical concurrent (non-streaming) requests share one completion
+LLM_COALESCE = os.getenv("LLM_COALESCE", "true").lower() in ("1", "true", "yes")
+
+# OpenAI-compatible server to use instead of api.openai.com (OpenAI mode)
+LLM_BASE_URL = os.getenv("LLM_BASE_URL")
+
+# Completion tokens reserved when a request sets no max_tokens
+_DEFAULT_COMPLETION_TOKENS = 1024
+
+# Latency samples kept per (deployment, max_tokens), and needed before hedging
+_LATENCY_WINDOW = 200
+_HEDGE_MIN_SAMPLES = 20
+
+_RETRYABLE = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+
+
+class GatewayTimeout(Exception):
+    """The call could not get a slot, rate-limit budget or answer before its deadline."""
+
+
+def estimate_tokens(messages: Optional[List[Dict[str, Any]]], max_tokens: Optional[int]) -> int:
+    """Tokens a request counts against TPM: prompt plus the completion budget."""
+    prompt = sum(count_tokens(str(m.get("content") or "")) + 4 for m in messages or [])
+    return prompt + (max_tokens or _DEFAULT_COMPLETION_TOKENS)
+
+
+def retry_delay(error: Exception, attempt: int) -> float:
+    """Honor the server's retry-after header, else back off exponentially."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return min(30.0, 2.0**attempt) * random.uniform(0.5, 1.5)
+
+
+class TokenBucket:
+    """Bucket refilled continuously at per_minute; reservations may overdraw it."""
+
+    def __init__(self, per_minute: float) -> None:
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Take amount and return the seconds until it is covered."""
+        self._refill(now)
+        self.level -= min(amount, self.capacity)
+        return max(0.0, -self.level / self.rate)
+
+    def available(self, amount: float, now: float) -> bool:
+        self._refill(now)
+        return self.level >= min(amount, self.capacity)
+
+    def refund(self, amount: float) -> None:
+        self.level = min(self.capacity, self.level + min(amount, self.capacity))
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute budget of one deployment."""
+
+    def __init__(self, rpm: int, tpm: int) -> None:
+        """
+        Args:
+            rpm: Requests per minute (0 = unlimited)
+            tpm: Tokens per minute (0 = unlimited)
+        """
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+
+    def _charges(self, tokens: int) -> List[Tuple[TokenBucket, float]]:
+        charges = []
+        if self.requests is not None:
+            charges.append((self.requests, 1))
+        if self.tokens is not None:
+            charges.append((self.tokens, tokens))
+        return charges
+
+    def reserve(self, tokens: int) -> float:
+        """Reserve one request of `tokens` and return the seconds to wait before sending it."""
+        now = time.monotonic()
+        with self._lock:
+            wait_for = max(0.0, self._paused_until - now)
+            for bucket, amount in self._charges(tokens):
+                wait_for = max(wait_for, bucket.reserve(amount, now))
+            return wait_for
+
+    def try_reserve(self, tokens: int) -> bool:
+        """Reserve a request only if it can be sent right away."""
+        now = time.monotonic()
+        with self._lock:
+            charges = self._charges(tokens)
+            if now < self._paused_until or not all(
+                bucket.available(amount, now) for bucket, amount in charges
+            ):
+                return False
+            for bucket, amount in charges:
+                bucket.reserve(amount, now)
+            return True
+
+    def refund(self, tokens: int) -> None:
+        """Return a reservation that was never sent."""
+        with self._lock:
+            for bucket, amount in self._charges(tokens):
+                bucket.refund(amount)
+
+    def pause(self, seconds: float) -> None:
+        """Hold every request to this deployment (after a 429)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class _SlotStream:
+    """A completion stream that holds a concurrency slot until it is consumed or closed."""
+
+    def __init__(self, stream: Any, release: Any) -> None:
+        self._stream = stream
+        self._release = release
+        self._released = False
+
+    def __iter__(self) -> Iterator[Any]:
+        try:
+            yield from self._stream
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        self._release()
+        close = getattr(self._stream, "close", None)
+        if close is not None:
+            close()
+
+    def __del__(self) -> None:
+        self.close()
+
+
+class _AsyncSlotStream:
+    """Async counterpart of _SlotStream."""
+
+    def __init__(self, stream: Any, release: Any) -> None:
+        self._stream = stream
+        self._release = release
+        self._released = False
+
+    async def __aiter__(self) -> AsyncIterator[Any]:
+        try:
+            async for chunk in self._stream:
+                yield chunk
+        finally:
+            await self.aclose()
+
+    async def aclose(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        self._release()
+        close = getattr(self._stream, "close", None)
+        if close is not None:
+            await close()
+
+
+class LLMGateway:
+    """
+    Chat completion client with pooling, rate limits, retries and hedging.
+
+    Sync callers share one connection pool and concurrency cap. Each
+    asyncio event loop gets its own pooled async client and cap. Hedge
+    losers are cancelled in async calls; in sync calls they finish in the
+    background and their result is discarded.
+    """
+
+    def __init__(
+        self,
+        provider: str,
+        api_key: str,
+        endpoint: Optional[str] = None,
+        api_version: Optional[str] = None,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        rpm: int = LLM_RPM,
+        tpm: int = LLM_TPM,
+        timeout: float = LLM_TIMEOUT,
+        deadline: float = LLM_DEADLINE,
+        max_retries: int = LLM_MAX_RETRIES,
+        hedge_percentile: float = LLM_HEDGE_PERCENTILE,
+        hedge_min_seconds: float = LLM_HEDGE_MIN_SECONDS,
+        coalesce: bool = LLM_COALESCE,
+    ) -> None:
+        """
+        Create the pooled client.
+
+        Args:
+            provider: "azure" or "openai"
+            api_key: API key
+            endpoint: Azure endpoint, or base URL of an OpenAI-compatible server
+            api_version: Azure API version
+            max_concurrency: Requests in flight at once (hedges included)
+            rpm: Requests per minute per deployment (0 = unlimited)
+            tpm: Tokens per minute per deployment (0 = unlimited)
+            timeout: Seconds per HTTP attempt
+            deadline: Seconds per call including waits and retries
+            max_retries: Retries after the first attempt
+            hedge_percentile: Latency percentile that triggers a hedge (0 = off)
+            hedge_min_seconds: Minimum seconds before hedging
+            coalesce: Share one call among identical concurrent requests
+        """
+        self.provider = provider
+        self.api_key = api_key
+        self.endpoint = endpoint
+        self.api_version = api_version
+        self.max_concurrency = max(1, max_concurrency)
+        self.rpm = rpm
+        self.tpm = tpm
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_seconds = hedge_min_seconds
+        self.coalesce = coalesce
+        self._flight = SingleFlight("llm")
+
+        self._limits = httpx.Limits(
+            max_connections=self.max_concurrency,
+            max_keepalive_connections=self.max_concurrency,
+        )
+        self._http = httpx.Client(limits=self._limits, timeout=timeout)
+        self.client = self._make_client(self._http, asynchronous=False)
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrency * 2, thread_name_prefix="llm-gateway"
+        )
+        # Event loop -> (async client, concurrency cap)
+        self._async_clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+        self._lock = threading.Lock()
+        self._limiters: Dict[str, RateLimiter] = {}
+        self._latencies: Dict[Tuple[str, Optional[int]], Deque[float]] = {}
+        self._stats = {
+            "requests": 0,
+            "retries": 0,
+            "rate_limited": 0,
+            "hedged": 0,
+            "hedge_wins": 0,
+            "failures": 0,
+            "throttled_seconds": 0.0,
+        }
+
+        # Drop-in for client.chat.completions.create
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def _make_client(self, http_client: Any, asynchronous: bool) -> Any:
+        """Build an SDK client on a shared HTTP client (the gateway does the retrying)."""
+        common = {
+            "api_key": self.api_key,
+            "http_client": http_client,
+            "max_retries": 0,
+            "timeout": self.timeout,
+        }
+        if self.provider == "azure":
+            cls = AsyncAzureOpenAI if asynchronous else AzureOpenAI
+            return cls(azure_endpoint=self.endpoint, api_version=self.api_version, **common)
+        cls = AsyncOpenAI if asynchronous else OpenAI
+        return cls(base_url=self.endpoint or None, **common)
+
+    # ==================== Bookkeeping ====================
+
+    def _count(self, name: str, amount: float = 1) -> None:
+        with self._lock:
+            self._stats[name] += amount
+
+    def _limiter(self, model: str) -> RateLimiter:
+        with self._lock:
+            limiter = self._limiters.get(model)
+            if limiter is None:
+                limiter = self._limiters[model] = RateLimiter(self.rpm, self.tpm)
+            return limiter
+
+    def _record_latency(self, key: Tuple[str, Optional[int]], seconds: float) -> None:
+        with self._lock:
+            samples = self._latencies.get(key)
+            if samples is None:
+                samples = self._latencies[key] = deque(maxlen=_LATENCY_WINDOW)
+            samples.append(seconds)
+
+    def _hedge_delay(self, key: Tuple[str, Optional[int]]) -> Optional[float]:
+        """Seconds after which to hedge, or None without enough history."""
+        if self.hedge_percentile <= 0:
+            return None
+        with self._lock:
+            samples = sorted(self._latencies.get(key, ()))
+        if len(samples) < _HEDGE_MIN_SAMPLES:
+            return None
+        index = min(len(samples) - 1, int(len(samples) * self.hedge_percentile / 100))
+        return max(self.hedge_min_seconds, samples[index])
+
+    def _backoff(
+        self, error: Exception, attempt: int, model: str, limiter: RateLimiter, deadline: float
+    ) -> float:
+        """Return the delay before the next attempt, or re-raise when out of retries or time."""
+        delay = retry_delay(error, attempt)
+        if isinstance(error, RateLimitError):
+            self._count("rate_limited")
+            limiter.pause(delay)
+        if attempt >= self.max_retries or time.monotonic() + delay > deadline:
+            self._count("failures")
+            raise error
+        self._count("retries")
+        print(f"[llm] {type(error).__name__} from {model}, retrying in {delay:.1f}s")
+        return delay
+
+    def _reserve(self, limiter: RateLimiter, tokens: int, model: str, deadline: float) -> float:
+        """Reserve rate-limit budget; return the wait, or raise if it passes the deadline."""
+        wait_for = limiter.reserve(tokens)
+        if wait_for > 0:
+            if time.monotonic() + wait_for > deadline:
+                limiter.refund(tokens)
+                self._count("failures")
+                raise GatewayTimeout(f"Rate limit for {model} would outlast the call deadline")
+            self._count("throttled_seconds", wait_for)
+        return wait_for
+
+    def _remaining(self, deadline: float) -> float:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise GatewayTimeout("LLM call deadline exceeded")
+        return remaining
+
+    # ==================== Sync API ====================
+
+    def create(self, **kwargs: Any) -> Any:
+        """
+        Create a chat completion (same arguments as chat.completions.create).
+
+        Returns:
+            The SDK response (shared with identical concurrent requests), or
+            an iterable of chunks when stream=True (only opening the stream
+            is retried)
+
+        Raises:
+            GatewayTimeout: No slot, budget or answer before the deadline
+            openai.APIError: The last error once retries are exhausted
+        """
+        if self.coalesce and not kwargs.get("stream"):
+            return self._flight.do(request_key(kwargs), self._create, **kwargs)
+        return self._create(**kwargs)
+
+    def _create(self, **kwargs: Any) -> Any:
+        model = kwargs["model"]
+        deadline = time.monotonic() + self.deadline
+        tokens = estimate_tokens(kwargs.get("messages"), kwargs.get("max_tokens"))
+        limiter = self._limiter(model)
+        key = (model, kwargs.get("max_tokens"))
+        self._count("requests")
+
+        attempt = 0
+        while True:
+            time.sleep(self._reserve(limiter, tokens, model, deadline))
+            try:
+                if kwargs.get("stream"):
+                    return self._open_stream(kwargs, deadline)
+                return self._hedged(kwargs, key, limiter, tokens, deadline)
+            except _RETRYABLE as e:
+                time.sleep(self._backoff(e, attempt, model, limiter, deadline))
+            attempt += 1
+
+    def _acquire_slot(self, deadline: float) -> None:
+        if not self._slots.acquire(timeout=self._remaining(deadline)):
+            self._count("failures")
+            raise GatewayTimeout(f"No free LLM slot ({self.max_concurrency} in flight)")
+
+    def _call(
+        self,
+        kwargs: Dict[str, Any],
+        key: Tuple[str, Optional[int]],
+        deadline: float,
+        has_slot: bool = False,
+    ) -> Any:
+        """One HTTP attempt, holding a concurrency slot."""
+        if not has_slot:
+            self._acquire_slot(deadline)
+        try:
+            started = time.monotonic()
+            response = self.client.chat.completions.create(
+                timeout=min(self.timeout, self._remaining(deadline)), **kwargs
+            )
+            self._record_latency(key, time.monotonic() - started)
+            return response
+        finally:
+            self._slots.release()
+
+    def _open_stream(self, kwargs: Dict[str, Any], deadline: float) -> _SlotStream:
+        self._acquire_slot(deadline)
+        try:
+            stream = self.client.chat.completions.create(
+                timeout=min(self.timeout, self._remaining(deadline)), **kwargs
+            )
+        except BaseException:
+            self._slots.release()
+            raise
+        return _SlotStream(stream, self._slots.release)
+
+    def _hedged(
+        self,
+        kwargs: Dict[str, Any],
+        key: Tuple[str, Optional[int]],
+        limiter: RateLimiter,
+        tokens: int,
+        deadline: float,
+    ) -> Any:
+        """Run one attempt, racing a second copy if it outlives the hedge delay."""
+        hedge_after = self._hedge_delay(key)
+        if hedge_after is None:
+            return self._call(kwargs, key, deadline)
+
+        primary = self._executor.submit(self._call, kwargs, key, deadline)
+        try:
+            return primary.result(timeout=hedge_after)
+        except FutureTimeout:
+            pass
+
+        # Hedge only with budget and a free slot; never queue behind other calls
+        if not limiter.try_reserve(tokens):
+            return primary.result()
+        if not self._slots.acquire(blocking=False):
+            limiter.refund(tokens)
+            return primary.result()
+        self._count("hedged")
+        hedge = self._executor.submit(self._call, kwargs, key, deadline, True)
+
+        pending = {primary, hedge}
+        errors: Dict[Future, BaseException] = {}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                error = future.exception()
+                if error is None:
+                    if future is hedge:
+                        self._count("hedge_wins")
+                    return future.result()
+                errors[future] = error
+        raise errors[primary]
+
+    # ==================== Async API ====================
+
+    def _async_client(self) -> Tuple[Any, asyncio.Semaphore]:
+        """Return the running loop's pooled async client and concurrency cap."""
+        loop = asyncio.get_running_loop()
+        entry = self._async_clients.get(loop)
+        if entry is None:
+            http = httpx.AsyncClient(limits=self._limits, timeout=self.timeout)
+            entry = (
+                self._make_client(http, asynchronous=True),
+                asyncio.Semaphore(self.max_concurrency),
+            )
+            self._async_clients[loop] = entry
+        return entry
+
+    async def acreate(self, **kwargs: Any) -> Any:
+        """
+        Create a chat completion from asyncio code.
+
+        Same arguments, limits, retries, hedging and coalescing as
+        create(); streams are returned as async iterables.
+        """
+        if self.coalesce and not kwargs.get("stream"):
+            return await self._flight.ado(request_key(kwargs), self._acreate, **kwargs)
+        return await self._acreate(**kwargs)
+
+    async def _acreate(self, **kwargs: Any) -> Any:
+        client, slots = self._async_client()
+        model = kwargs["model"]
+        deadline = time.monotonic() + self.deadline
+        tokens = estimate_tokens(kwargs.get("messages"), kwargs.get("max_tokens"))
+        limiter = self._limiter(model)
+        key = (model, kwargs.get("max_tokens"))
+        self._count("requests")
+
+        attempt = 0
+        while True:
+            await asyncio.sleep(self._reserve(limiter, tokens, model, deadline))
+            try:
+                if kwargs.get("stream"):
+                    await self._aacquire(slots, deadline)
+                    try:
+                        stream = await client.chat.completions.create(
+                            timeout=min(self.timeout, self._remaining(deadline)), **kwargs
+                        )
+                    except BaseException:
+                        slots.release()
+                        raise
+                    return _AsyncSlotStream(stream, slots.release)
+                return await self._ahedged(client, slots, kwargs, key, limiter, tokens, deadline)
+            except _RETRYABLE as e:
+                await asyncio.sleep(self._backoff(e, attempt, model, limiter, deadline))
+            attempt += 1
+
+    async def _aacquire(self, slots: asyncio.Semaphore, deadline: float) -> None:
+        try:
+            await asyncio.wait_for(slots.acquire(), self._remaining(deadline))
+        except asyncio.TimeoutError:
+            self._count("failures")
+            raise GatewayTimeout(f"No free LLM slot ({self.max_concurrency} in flight)") from None
+
+    async def _acall(
+        self,
+        client: Any,
+        slots: asyncio.Semaphore,
+        kwargs: Dict[str, Any],
+        key: Tuple[str, Optional[int]],
+        deadline: float,
+        has_slot: bool = False,
+    ) -> Any:
+        if not has_slot:
+            await self._aacquire(slots, deadline)
+        try:
+            started = time.monotonic()
+            response = await client.chat.completions.create(
+                timeout=min(self.timeout, self._remaining(deadline)), **kwargs
+            )
+            self._record_latency(key, time.monotonic() - started)
+            return response
+        finally:
+            slots.release()
+
+    async def _ahedged(
+        self,
+        client: Any,
+        slots: asyncio.Semaphore,
+        kwargs: Dict[str, Any],
+        key: Tuple[str, Optional[int]],
+        limiter: RateLimiter,
+        tokens: int,
+        deadline: float,
+    ) -> Any:
+        hedge_after = self._hedge_delay(key)
+        if hedge_after is None:
+            return await self._acall(client, slots, kwargs, key, deadline)
+
+        primary = asyncio.ensure_future(self._acall(client, slots, kwargs, key, deadline))
+        done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+        if done or slots.locked() or not limiter.try_reserve(tokens):
+            return await primary
+        await slots.acquire()
+        self._count("hedged")
+        hedge = asyncio.ensure_future(self._acall(client, slots, kwargs, key, deadline, True))
+
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self._count("hedge_wins")
+                        return task.result()
+            # Both failed: report the original request's error
+            return primary.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    # ==================== Lifecycle ====================
+
+    def stats(self) -> Dict[str, Any]:
+        """Return request, retry, throttling, hedging and coalescing counters for this process."""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["coalesced"] = self._flight.stats()["coalesced"]
+        stats["throttled_seconds"] = round(stats["throttled_seconds"], 3)
+        return stats
+
+    def close(self) -> None:
+        """Close the sync connection pool and the hedging threads."""
+        self._executor.shutdown(wait=False)
+        self._http.close()
@@ -0,0 +1,98 @@
+"""
+SageAlpha.ai Text Normalization
+Whitespace, control-character and markdown cleanup with precompiled patterns
+
+Patterns are compiled once at import. clean_text drops control characters
+with one regex and collapses whitespace with str.split (no whitespace regex);
+strip_markdown matches every markdown construct with a single alternation
+instead of one re.sub pass per construct.
+Run bench_normalize.py to measure throughput on a real filing.
+"""
+
+import re
+
+# C0/C1 control characters that are not whitespace (whitespace controls such
+# as \t, \n, \x0b, \x1c-\x1f and \x85 are collapsed to a space instead)
+_CONTROL_RE = re.compile(
+    "[%s]+"
+    % "".join(
+        re.escape(chr(c))
+        for c in (*range(0x00, 0x20), *range(0x7F, 0xA0))
+        if not chr(c).isspace()
+    )
+)
+
+# One alternation for every markdown construct; the inline groups keep their
+# text, everything else is removed (blank-line runs become one blank line)
+_MARKDOWN_RE = re.compile(
+    # Every construct starts with one of these; rejecting other characters
+    # up front keeps the scan fast on plain text
+    r"(?=[`#*_+\n-])(?:"
+    r"(?s:```.*?```)"  # fenced code block
+    r"|^#{1,6}\s*"  # heading marker
+    r"|(?<=\n)[-*_]{3,}\n"  # horizontal rule
+    r"|^[-*+]\s+"  # list bullet
+    r"|(\n{3,})"  # blank-line run
+    r"|\*\*(.*?)\*\*"  # bold
+    r"|\*(.*?)\*"  # italic
+    r"|__(.*?)__"  # bold
+    r"|_(.*?)_"  # italic
+    r")",
+    re.MULTILINE,
+)
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+# Emphasis alone, re-applied to the text kept from an emphasized span so
+# nested emphasis ("**bold _italic_**") is stripped as well
+_EMPHASIS_RE = re.compile(r"\*\*(.*?)\*\*|\*(.*?)\*|__(.*?)__|_(.*?)_")
+
+
+def clean_text(text: str) -> str:
+    """
+    Clean extracted text by removing excess whitespace and normalizing.
+
+    Args:
+        text: Raw extracted text
+
+    Returns:
+        Text without control characters, with whitespace runs collapsed
+        to single spaces
+    """
+    if not text:
+        return ""
+    return " ".join(_CONTROL_RE.sub("", text).split())
+
+
+def _strip_emphasis(text: str) -> str:
+    if "*" not in text and "_" not in text:
+        return text
+    return _EMPHASIS_RE.sub(lambda m: _strip_emphasis(m.group(m.lastindex)), text)
+
+
+def _markdown_replacement(match: "re.Match[str]") -> str:
+    group = match.lastindex
+    if group is None:
+        return ""
+    if group == 1:
+        return "\n\n"
+    return _strip_emphasis(match.group(group))
+
+
+def strip_markdown(text: str) -> str:
+    """
+    Remove markdown formatting from text.
+
+    Args:
+        text: Markdown text (e.g. an LLM response)
+
+    Returns:
+        Plain text with code blocks, heading markers, bullets, rules and
+        emphasis markers removed
+    """
+    if not text:
+        return text
+    text = _MARKDOWN_RE.sub(_markdown_replacement, text)
+    # Removing a code block or rule can leave a new run of blank lines
+    if "\n\n\n" in text:
+        text = _BLANK_LINES_RE.sub("\n\n", text)
+    return text.strip()
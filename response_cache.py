@@ -0,0 +1,450 @@
+"""
+SageAlpha.ai Response Cache
+Cached answers to repeated research questions, shared by all workers
+
+Answers are cached per request before retrieval, so a hit skips both
+search and the LLM. There are two lookup tiers:
+
+- exact: (model, completion parameters, normalized messages) hashed; the
+  messages are everything the answer depends on except the retrieved
+  context (system prompt, session memory, question)
+- semantic (opt-in, RESPONSE_CACHE_SIMILARITY > 0): the question's
+  embedding is compared with cached questions that share everything else;
+  a cosine similarity at or above the threshold reuses the cached answer
+
+The retrieved context is not part of the key, so entries expire after a
+TTL and are dropped when new filings for a company they mention are indexed.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+# ==================== Configuration ====================
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+
+# Seconds a cached answer is served (retrieved context may have changed since)
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "21600"))
+
+# Cosine similarity at which a differently worded question reuses an answer
+# (0 = exact only). Off by default: near-identical financial questions
+# ("Q2 revenue" vs "Q3 revenue") can score above 0.95
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0"))
+
+# Entries kept; the least recently used are evicted beyond this
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "5000"))
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_LEGAL_SUFFIX_RE = re.compile(
+    r"[\s,.]+(?:inc|corp|corporation|co|company|ltd|limited|plc|llc|ag|sa|nv)\.?$"
+)
+
+
+class CachedResponse(NamedTuple):
+    """A cache hit."""
+
+    answer: str
+    sources: List[Dict[str, Any]]
+    tier: str  # "exact" or "semantic"
+    similarity: float
+    age: float  # seconds since the answer was generated
+
+
+def normalize_messages(messages: Sequence[Dict[str, Any]]) -> List[Tuple[str, str]]:
+    """Collapse whitespace and case so trivially different prompts share a key."""
+    return [
+        (m.get("role", ""), _WHITESPACE_RE.sub(" ", str(m.get("content") or "")).strip().casefold())
+        for m in messages
+    ]
+
+
+def company_tag(name: str) -> str:
+    """Normalize a company name or ticker for invalidation ("CRH PLC" -> "crh")."""
+    tag = _WHITESPACE_RE.sub(" ", name.casefold()).strip()
+    return _LEGAL_SUFFIX_RE.sub("", tag).strip()
+
+
+def _digest(value: Any) -> str:
+    return hashlib.sha256(
+        json.dumps(value, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+
+
+class ResponseCache:
+    """
+    SQLite-backed response cache with an exact and a semantic tier.
+
+    The database runs in WAL mode so every Gunicorn worker shares it.
+    Question embeddings are mirrored in memory per process (new rows are
+    loaded incrementally; deletions trigger a reload).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl: int = RESPONSE_CACHE_TTL_SECONDS,
+        similarity: float = RESPONSE_CACHE_SIMILARITY,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+    ) -> None:
+        """
+        Open (or create) the cache.
+
+        Args:
+            path: SQLite database file
+            ttl: Seconds an entry is served
+            similarity: Cosine threshold of the semantic tier (0 disables it)
+            max_entries: Entries kept before least recently used ones are evicted
+        """
+        self.path = path
+        self.ttl = ttl
+        self.similarity = similarity
+        self.max_entries = max(1, max_entries)
+
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self.invalidated = 0
+
+        # (context key, dim) -> (entry keys, created times, unit vectors)
+        self._index_lock = threading.Lock()
+        self._index: Dict[Tuple[str, int], Tuple[List[str], List[float], np.ndarray]] = {}
+        self._index_rowid = 0
+        self._index_deletions = -1
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = self._conn()
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                   id INTEGER PRIMARY KEY AUTOINCREMENT,
+                   key TEXT NOT NULL UNIQUE,
+                   context_key TEXT NOT NULL,
+                   question TEXT NOT NULL,
+                   embedding BLOB,
+                   answer TEXT NOT NULL,
+                   sources TEXT NOT NULL,
+                   latency REAL NOT NULL,
+                   created REAL NOT NULL,
+                   last_access REAL NOT NULL
+               )"""
+        )
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS response_companies (
+                   key TEXT NOT NULL,
+                   company TEXT NOT NULL
+               )"""
+        )
+        # Bumped on every delete so other processes reload their embeddings
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_response_companies_company "
+            "ON response_companies (company)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_response_companies_key ON response_companies (key)"
+        )
+        conn.execute("INSERT OR IGNORE INTO counters (name, value) VALUES ('deletions', 0)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        """Return this thread's connection."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def keys(
+        model: str,
+        messages: Sequence[Dict[str, Any]],
+        params: Optional[Dict[str, Any]] = None,
+        scope: Optional[str] = None,
+    ) -> Tuple[str, str]:
+        """
+        Return (entry key, context key) for a request.
+
+        The context key covers everything except the final (question)
+        message; semantic matches must share it.
+        """
+        normalized = normalize_messages(messages)
+        context_key = _digest([model, params or {}, scope, normalized[:-1]])
+        return _digest([context_key, normalized[-1:]]), context_key
+
+    def get(
+        self,
+        model: str,
+        messages: Sequence[Dict[str, Any]],
+        params: Optional[Dict[str, Any]] = None,
+        scope: Optional[str] = None,
+        embedding: Optional[np.ndarray] = None,
+    ) -> Optional[CachedResponse]:
+        """
+        Look up a cached answer.
+
+        Args:
+            model: Model or deployment name
+            messages: Messages without retrieved context, question last
+            params: Completion parameters that change the answer
+            scope: Retrieval scope (e.g. a session with its own uploads)
+            embedding: Question embedding for the semantic tier
+
+        Returns:
+            The cached answer, or None on a miss
+        """
+        started = time.perf_counter()
+        key, context_key = self.keys(model, messages, params, scope)
+        conn = self._conn()
+        oldest = time.time() - self.ttl
+
+        tier, score = "exact", 1.0
+        row = conn.execute(
+            "SELECT key, answer, sources, latency, created FROM responses "
+            "WHERE key = ? AND created >= ?",
+            (key, oldest),
+        ).fetchone()
+
+        if row is None and embedding is not None and self.similarity > 0:
+            match = self._nearest(context_key, embedding, oldest)
+            if match is not None:
+                row = conn.execute(
+                    "SELECT key, answer, sources, latency, created FROM responses "
+                    "WHERE key = ? AND created >= ?",
+                    (match[0], oldest),
+                ).fetchone()
+                tier, score = "semantic", match[1]
+
+        if row is None:
+            with self._stats_lock:
+                self.misses += 1
+            return None
+
+        entry_key, answer, sources, latency, created = row
+        now = time.time()
+        conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, entry_key))
+        conn.commit()
+
+        with self._stats_lock:
+            if tier == "exact":
+                self.exact_hits += 1
+            else:
+                self.semantic_hits += 1
+            self.saved_seconds += max(latency - (time.perf_counter() - started), 0.0)
+        return CachedResponse(answer, json.loads(sources), tier, score, now - created)
+
+    def put(
+        self,
+        model: str,
+        messages: Sequence[Dict[str, Any]],
+        answer: str,
+        sources: Optional[List[Dict[str, Any]]] = None,
+        latency: float = 0.0,
+        params: Optional[Dict[str, Any]] = None,
+        scope: Optional[str] = None,
+        embedding: Optional[np.ndarray] = None,
+        companies: Iterable[str] = (),
+    ) -> None:
+        """
+        Store an answer.
+
+        Args:
+            model, messages, params, scope, embedding: As passed to get()
+            answer: Completion text
+            sources: Retrieved sources returned with the answer
+            latency: Seconds retrieval and completion took (saved by each hit)
+            companies: Company names or tickers the answer is about
+        """
+        key, context_key = self.keys(model, messages, params, scope)
+        blob = None
+        if embedding is not None:
+            vector = np.asarray(embedding, dtype=np.float32).ravel()
+            blob = (vector / (np.linalg.norm(vector) + 1e-10)).tobytes()
+        question = normalize_messages(messages[-1:])[0][1] if messages else ""
+        now = time.time()
+
+        conn = self._conn()
+        conn.execute("DELETE FROM response_companies WHERE key = ?", (key,))
+        conn.execute(
+            """INSERT OR REPLACE INTO responses
+                   (key, context_key, question, embedding, answer, sources,
+                    latency, created, last_access)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (key, context_key, question, blob, answer, json.dumps(sources or []),
+             latency, now, now),
+        )
+        tags = {company_tag(c) for c in companies if c}
+        conn.executemany(
+            "INSERT INTO response_companies (key, company) VALUES (?, ?)",
+            [(key, tag) for tag in tags if tag],
+        )
+        conn.commit()
+        self._evict()
+
+    def _evict(self) -> None:
+        """Drop expired entries and the least recently used beyond max_entries."""
+        conn = self._conn()
+        count = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        # Evict a tenth at once so this runs rarely
+        excess = count - int(self.max_entries * 0.9)
+        keys = [
+            k
+            for (k,) in conn.execute(
+                "SELECT key FROM responses WHERE created < ? "
+                "UNION SELECT key FROM (SELECT key FROM responses "
+                "ORDER BY last_access LIMIT ?)",
+                (time.time() - self.ttl, excess),
+            )
+        ]
+        self._delete(keys)
+
+    def _delete(self, keys: List[str]) -> int:
+        """Delete entries and bump the deletion counter."""
+        if not keys:
+            return 0
+        conn = self._conn()
+        for start in range(0, len(keys), 500):
+            batch = keys[start : start + 500]
+            placeholders = ",".join("?" * len(batch))
+            conn.execute(f"DELETE FROM responses WHERE key IN ({placeholders})", batch)
+            conn.execute(f"DELETE FROM response_companies WHERE key IN ({placeholders})", batch)
+        conn.execute("UPDATE counters SET value = value + 1 WHERE name = 'deletions'")
+        conn.commit()
+        return len(keys)
+
+    def invalidate(self, text: str) -> int:
+        """
+        Drop answers about any company named in a text (a company name, a
+        ticker or a filing's file name).
+
+        Args:
+            text: Text that may mention companies
+
+        Returns:
+            Number of entries removed
+        """
+        haystack = " " + re.sub(r"[\W_]+", " ", text.casefold()) + " "
+        conn = self._conn()
+        tags = [
+            tag
+            for (tag,) in conn.execute("SELECT DISTINCT company FROM response_companies")
+            if len(tag) > 1 and f" {re.sub(r'[^a-z0-9]+', ' ', tag).strip()} " in haystack
+        ]
+        if not tags:
+            return 0
+        placeholders = ",".join("?" * len(tags))
+        keys = [
+            k
+            for (k,) in conn.execute(
+                f"SELECT DISTINCT key FROM response_companies WHERE company IN ({placeholders})",
+                tags,
+            )
+        ]
+        removed = self._delete(keys)
+        with self._stats_lock:
+            self.invalidated += removed
+        if removed:
+            print(f"[ResponseCache] Invalidated {removed} answers about {', '.join(tags)}")
+        return removed
+
+    def clear(self) -> int:
+        """Drop every entry (e.g. after the search index was rebuilt)."""
+        keys = [k for (k,) in self._conn().execute("SELECT key FROM responses")]
+        removed = self._delete(keys)
+        with self._stats_lock:
+            self.invalidated += removed
+        return removed
+
+    def _nearest(
+        self, context_key: str, embedding: np.ndarray, oldest: float
+    ) -> Optional[Tuple[str, float]]:
+        """Return (key, similarity) of the closest live question at or above the threshold."""
+        query = np.asarray(embedding, dtype=np.float32).ravel()
+        query = query / (np.linalg.norm(query) + 1e-10)
+        with self._index_lock:
+            self._refresh_index()
+            entry = self._index.get((context_key, query.shape[0]))
+            if entry is None:
+                return None
+            keys, created, matrix = entry
+            scores = matrix @ query
+            scores[np.asarray(created) < oldest] = -1.0
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity:
+            return None
+        return keys[best], float(scores[best])
+
+    def _refresh_index(self) -> None:
+        """Load rows added since the last refresh (everything after a deletion)."""
+        conn = self._conn()
+        deletions = conn.execute(
+            "SELECT value FROM counters WHERE name = 'deletions'"
+        ).fetchone()[0]
+        if deletions != self._index_deletions:
+            self._index, self._index_rowid = {}, 0
+            self._index_deletions = deletions
+
+        rows = conn.execute(
+            "SELECT id, key, context_key, created, embedding FROM responses "
+            "WHERE id > ? AND embedding IS NOT NULL ORDER BY id",
+            (self._index_rowid,),
+        ).fetchall()
+        if not rows:
+            return
+
+        # INSERT OR REPLACE gives a re-cached question a new id: drop the old row
+        replaced = {key for _, key, _, _, _ in rows}
+        added: Dict[Tuple[str, int], List[Tuple[str, float, np.ndarray]]] = {}
+        for _, key, context_key, created, blob in rows:
+            vector = np.frombuffer(blob, dtype=np.float32)
+            added.setdefault((context_key, vector.shape[0]), []).append((key, created, vector))
+
+        for index_key, entries in added.items():
+            keys, created, matrix = self._index.get(
+                index_key, ([], [], np.zeros((0, index_key[1]), np.float32))
+            )
+            keep = [i for i, k in enumerate(keys) if k not in replaced]
+            self._index[index_key] = (
+                [keys[i] for i in keep] + [e[0] for e in entries],
+                [created[i] for i in keep] + [e[1] for e in entries],
+                np.vstack([matrix[keep], *[e[2] for e in entries]]),
+            )
+        self._index_rowid = rows[-1][0]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit, miss and latency counters for this process."""
+        with self._stats_lock:
+            hits = self.exact_hits + self.semantic_hits
+            lookups = hits + self.misses
+            return {
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_ratio": (hits / lookups) if lookups else 0.0,
+                "saved_seconds": round(self.saved_seconds, 3),
+                "invalidated": self.invalidated,
+            }
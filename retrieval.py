@@ -0,0 +1,226 @@
+"""
+SageAlpha.ai Retrieval Orchestrator
+Concurrent retrieval from several sources, merged with reciprocal-rank fusion
+
+Each source (Azure Cognitive Search, the shared local vector store, a
+session's uploads) is queried on its own thread with its own deadline.
+A source that misses its deadline or fails is left out of the merge, so
+retrieval takes as long as the slowest source within budget rather than
+the sum of all sources.
+
+Rankings are merged with reciprocal-rank fusion: a document scores
+sum(weight / (RRF_K + rank)) over the sources that returned it. Raw scores
+are not comparable across sources (BM25 vs cosine), so each result also
+gets a normalized score in [0, 1]: cosine similarity clipped to [0, 1] for
+vector sources, and the score relative to the best hit for keyword sources.
+A relative score says nothing about absolute relevance, so the relevance
+cutoff (filter_relevant) only applies to results no such source returned.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+# ==================== Configuration ====================
+# Seconds each source may take before retrieval goes on without it
+RETRIEVAL_AZURE_TIMEOUT = float(os.getenv("RETRIEVAL_AZURE_TIMEOUT", "3"))
+RETRIEVAL_LOCAL_TIMEOUT = float(os.getenv("RETRIEVAL_LOCAL_TIMEOUT", "1.5"))
+RETRIEVAL_SESSION_TIMEOUT = float(os.getenv("RETRIEVAL_SESSION_TIMEOUT", "1.5"))
+
+# Reciprocal-rank fusion constant (larger = flatter rank weighting)
+RRF_K = int(os.getenv("RETRIEVAL_RRF_K", "60"))
+
+# Candidates fetched per source for each result returned
+RETRIEVAL_FETCH_FACTOR = int(os.getenv("RETRIEVAL_FETCH_FACTOR", "2"))
+
+# Threads shared by all retrievals (sources that overrun keep one busy)
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", "16"))
+
+# Minimum cosine similarity for a vector-only result to be used as context
+RELEVANCE_THRESHOLD = float(os.getenv("RETRIEVAL_RELEVANCE_THRESHOLD", "0.35"))
+
+SearchFn = Callable[[str, int], List[Dict[str, Any]]]
+
+
+class RetrievalSource(NamedTuple):
+    """A ranked source: search(query, k) returns results best first."""
+
+    name: str
+    search: SearchFn
+    timeout: float
+    weight: float = 1.0
+    scores: str = "cosine"  # "cosine" (absolute) or "relative" (e.g. BM25)
+
+
+def normalize_scores(scores: List[float], kind: str) -> List[float]:
+    """
+    Map one source's raw scores to [0, 1].
+
+    Args:
+        scores: Raw scores, best first
+        kind: "cosine" clips similarities; "relative" divides by the best score
+
+    Returns:
+        Normalized scores in input order
+    """
+    if kind == "relative":
+        best = max(scores, default=0.0)
+        if best <= 0:
+            return [0.0] * len(scores)
+        return [max(0.0, s / best) for s in scores]
+    return [min(1.0, max(0.0, s)) for s in scores]
+
+
+def reciprocal_rank_fusion(
+    rankings: Dict[str, List[Dict[str, Any]]],
+    sources: Dict[str, RetrievalSource],
+    k: int,
+    rrf_k: int = RRF_K,
+) -> List[Dict[str, Any]]:
+    """
+    Merge per-source rankings.
+
+    Args:
+        rankings: Source name -> results (doc_id, text, meta, score), best first
+        sources: Source name -> definition (weight and score kind)
+        k: Number of merged results
+        rrf_k: Fusion constant
+
+    Returns:
+        Results ordered by fused score, each with score (normalized, best
+        over its sources), rrf_score, the names of the sources that
+        returned it and whether any of them scores relatively
+    """
+    fused: Dict[str, Dict[str, Any]] = {}
+    for name, results in rankings.items():
+        source = sources[name]
+        normalized = normalize_scores(
+            [float(r.get("score", 0.0)) for r in results], source.scores
+        )
+        for rank, (result, score) in enumerate(zip(results, normalized), start=1):
+            key = result.get("doc_id") or result.get("text", "")
+            entry = fused.get(key)
+            if entry is None:
+                entry = fused[key] = {
+                    **result,
+                    "score": 0.0,
+                    "rrf_score": 0.0,
+                    "sources": [],
+                    "relative": False,
+                }
+            entry["rrf_score"] += source.weight / (rrf_k + rank)
+            entry["score"] = max(entry["score"], score)
+            entry["sources"].append(name)
+            if source.scores == "relative":
+                entry["relative"] = True
+    return sorted(fused.values(), key=lambda e: e["rrf_score"], reverse=True)[:k]
+
+
+def filter_relevant(
+    results: List[Dict[str, Any]], threshold: float = RELEVANCE_THRESHOLD
+) -> List[Dict[str, Any]]:
+    """
+    Drop results below the relevance threshold.
+
+    The threshold is a cosine similarity, so it is not applied to fused
+    results a relative-scored source returned: a relative score only ranks
+    a hit against that source's best one.
+
+    Args:
+        results: Search or fused results, best first
+        threshold: Minimum score
+
+    Returns:
+        The relevant results, in input order
+    """
+    return [r for r in results if r.get("relative") or r.get("score", 0.0) >= threshold]
+
+
+class Retriever:
+    """
+    Fans a query out to retrieval sources on a shared thread pool.
+
+    Keeps per-source counters (calls, timeouts, errors, latency) for
+    monitoring which source holds retrieval back.
+    """
+
+    def __init__(self, workers: int = RETRIEVAL_WORKERS, rrf_k: int = RRF_K) -> None:
+        """
+        Args:
+            workers: Threads shared by all retrievals
+            rrf_k: Reciprocal-rank fusion constant
+        """
+        self.rrf_k = rrf_k
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="retrieval")
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def _record(self, name: str, outcome: str, seconds: Optional[float] = None) -> None:
+        with self._lock:
+            stats = self._stats.setdefault(
+                name, {"calls": 0, "timeouts": 0, "errors": 0, "total_seconds": 0.0}
+            )
+            stats[outcome] += 1
+            if seconds is not None:
+                stats["total_seconds"] += seconds
+
+    def _timed(self, source: RetrievalSource, query: str, k: int) -> List[Dict[str, Any]]:
+        started = time.monotonic()
+        results = source.search(query, k)
+        self._record(source.name, "calls", time.monotonic() - started)
+        return results
+
+    def retrieve(
+        self, query: str, sources: List[RetrievalSource], k: int = 5
+    ) -> List[Dict[str, Any]]:
+        """
+        Query every source concurrently and merge what arrives in time.
+
+        Args:
+            query: Query text
+            sources: Sources to query
+            k: Number of merged results
+
+        Returns:
+            Fused results (see reciprocal_rank_fusion); empty if every
+            source failed or timed out
+        """
+        if not query or not sources:
+            return []
+        started = time.monotonic()
+        fetch_k = max(k, k * RETRIEVAL_FETCH_FACTOR)
+        futures = {s.name: self._executor.submit(self._timed, s, query, fetch_k) for s in sources}
+
+        rankings: Dict[str, List[Dict[str, Any]]] = {}
+        for source in sorted(sources, key=lambda s: s.timeout):
+            future = futures[source.name]
+            remaining = started + source.timeout - time.monotonic()
+            try:
+                rankings[source.name] = future.result(timeout=max(0.0, remaining))
+            except FutureTimeout:
+                # Left running; its result is discarded
+                self._record(source.name, "timeouts")
+                print(f"[retrieval] {source.name} missed its {source.timeout:g}s deadline")
+            except Exception as e:
+                self._record(source.name, "errors")
+                print(f"[retrieval] {source.name} failed: {e!r}")
+
+        return reciprocal_rank_fusion(
+            rankings, {s.name: s for s in sources}, k, self.rrf_k
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """Return per-source counters and mean latency for this process."""
+        with self._lock:
+            return {
+                name: {
+                    "calls": int(s["calls"]),
+                    "timeouts": int(s["timeouts"]),
+                    "errors": int(s["errors"]),
+                    "avg_ms": round(1000 * s["total_seconds"] / s["calls"], 1) if s["calls"] else None,
+                }
+                for name, s in self._stats.items()
+            }
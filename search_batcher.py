@@ -0,0 +1,160 @@
+"""
+SageAlpha.ai Search Micro-Batching
+Groups concurrent vector searches into one VectorStore.search_many call
+
+Each search is a matrix-vector product over the store; concurrent requests
+(several users, or the sources of one retrieval) each pay a full pass over
+the mapped rows. The batcher holds the first search of a group for a few
+milliseconds, collects the searches that arrive meanwhile with the same
+k / scope / filter, and scores them with a single matrix-matrix product.
+
+The first caller of a group runs the batch on its own thread; the others
+wait on futures. A window of 0 disables batching.
+"""
+
+import os
+import threading
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from singleflight import request_key
+
+# ==================== Configuration ====================
+# Milliseconds the first search of a batch waits for others to join
+SEARCH_BATCH_WINDOW_MS = float(os.getenv("SEARCH_BATCH_WINDOW_MS", "2"))
+
+# Queries scored per batch
+SEARCH_BATCH_MAX = int(os.getenv("SEARCH_BATCH_MAX", "32"))
+
+
+class _Batch:
+    """Searches collected under one batch key."""
+
+    def __init__(self) -> None:
+        self.queries: List[str] = []
+        self.vectors: List[Optional[np.ndarray]] = []
+        self.futures: List[Future] = []
+
+
+class SearchBatcher:
+    """Batches concurrent VectorStore searches that share k, scope and filter."""
+
+    def __init__(
+        self,
+        store: Any,
+        window_ms: float = SEARCH_BATCH_WINDOW_MS,
+        max_batch: int = SEARCH_BATCH_MAX,
+    ) -> None:
+        """
+        Args:
+            store: VectorStore to search
+            window_ms: Milliseconds a batch stays open
+            max_batch: Queries per batch (a full batch runs at once)
+        """
+        self.store = store
+        self.window = max(0.0, window_ms) / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._lock = threading.Lock()
+        self._open: Dict[str, _Batch] = {}
+        self._full: Dict[str, threading.Event] = {}
+        self.searches = 0
+        self.batches = 0
+
+    def search(
+        self,
+        query: str,
+        k: int = 5,
+        scope: Optional[str] = None,
+        filter: Optional[Dict[str, Any]] = None,
+        query_vector: Optional[np.ndarray] = None,
+        include_temporary: bool = True,
+    ) -> List[Dict[str, Any]]:
+        """
+        Search like VectorStore.search, sharing the scoring pass with
+        concurrent searches of the same k, scope, filter and
+        include_temporary.
+
+        Returns:
+            Search results (doc_id, text, meta, score), best first
+        """
+        if self.window == 0:
+            return self.store.search(
+                query,
+                k=k,
+                scope=scope,
+                filter=filter,
+                query_vector=query_vector,
+                include_temporary=include_temporary,
+            )
+
+        key = request_key(k, scope, filter, include_temporary)
+        future: Future = Future()
+        with self._lock:
+            self.searches += 1
+            batch = self._open.get(key)
+            leader = batch is None
+            if leader:
+                batch = self._open[key] = _Batch()
+                full = self._full[key] = threading.Event()
+            batch.queries.append(query)
+            batch.vectors.append(query_vector)
+            batch.futures.append(future)
+            if len(batch.queries) >= self.max_batch:
+                # Close the batch now so later searches start a new one
+                del self._open[key]
+                self._full.pop(key).set()
+
+        if not leader:
+            return future.result()
+
+        full.wait(self.window)
+        with self._lock:
+            if self._open.get(key) is batch:
+                del self._open[key]
+                del self._full[key]
+            self.batches += 1
+        self._run(batch, k, scope, filter, include_temporary)
+        return future.result()
+
+    def _run(
+        self,
+        batch: _Batch,
+        k: int,
+        scope: Optional[str],
+        filter: Optional[Dict[str, Any]],
+        include_temporary: bool,
+    ) -> None:
+        """Score a closed batch and resolve its futures."""
+        try:
+            missing = [i for i, v in enumerate(batch.vectors) if v is None]
+            vectors = list(batch.vectors)
+            if missing:
+                embedded = self.store.embed([batch.queries[i] for i in missing])
+                for i, vec in zip(missing, embedded):
+                    vectors[i] = vec
+            q = np.vstack([np.asarray(v, dtype=np.float32).reshape(1, -1) for v in vectors])
+            results = self.store.search_many(
+                batch.queries,
+                k=k,
+                scope=scope,
+                filter=filter,
+                query_vectors=q,
+                include_temporary=include_temporary,
+            )
+        except BaseException as e:
+            for future in batch.futures:
+                future.set_exception(e)
+            return
+        for future, result in zip(batch.futures, results):
+            future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return search and batch counters for this process."""
+        with self._lock:
+            return {
+                "searches": self.searches,
+                "batches": self.batches,
+                "avg_batch": round(self.searches / self.batches, 2) if self.batches else None,
+            }
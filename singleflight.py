@@ -0,0 +1,141 @@
+"""
+SageAlpha.ai Request Coalescing
+Single-flight execution of identical concurrent calls
+
+When several requests need the same expensive result at the same time
+(a shared report link, a burst of identical questions), only the first
+caller runs the call; the others wait on its future and share the result
+or the exception. Nothing is cached once the call finishes.
+
+Shared results are the same object for every caller and must not be
+mutated.
+"""
+
+import asyncio
+import hashlib
+import json
+import re
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def _normalize(value: Any, casefold: bool) -> Any:
+    if isinstance(value, str):
+        value = _WHITESPACE_RE.sub(" ", value).strip()
+        return value.casefold() if casefold else value
+    if isinstance(value, dict):
+        return {str(k): _normalize(v, casefold) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v, casefold) for v in value]
+    return value
+
+
+def request_key(*parts: Any, casefold: bool = False) -> str:
+    """
+    Hash call arguments into a coalescing key.
+
+    Args:
+        *parts: JSON-serializable arguments (strings have whitespace collapsed)
+        casefold: Also ignore case (e.g. search queries, company names)
+
+    Returns:
+        sha256 hex digest
+    """
+    payload = json.dumps(_normalize(parts, casefold), sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """
+    Coalesces identical in-flight calls, from threads or asyncio tasks.
+
+    Thread callers share a concurrent.futures.Future; asyncio callers share
+    a task per event loop (shielded, so one caller's cancellation does not
+    cancel the others).
+    """
+
+    def __init__(self, name: str) -> None:
+        """
+        Args:
+            name: Label used in stats and logs
+        """
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+        self._tasks: Dict[Tuple[int, str], "asyncio.Task[Any]"] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Run fn(*args, **kwargs), or wait for an identical call already running.
+
+        Args:
+            key: Coalescing key (see request_key)
+            fn: Function to run
+
+        Returns:
+            fn's result, shared with concurrent callers of the same key
+        """
+        with self._lock:
+            self.calls += 1
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    async def ado(
+        self, key: str, fn: Callable[..., Awaitable[Any]], *args: Any, **kwargs: Any
+    ) -> Any:
+        """
+        Async version of do(): await fn(*args, **kwargs) once per key and loop.
+
+        Args:
+            key: Coalescing key (see request_key)
+            fn: Coroutine function to run
+        """
+        loop = asyncio.get_running_loop()
+        task_key = (id(loop), key)
+        with self._lock:
+            self.calls += 1
+            task = self._tasks.get(task_key)
+            if task is None:
+                task = self._tasks[task_key] = loop.create_task(fn(*args, **kwargs))
+                task.add_done_callback(lambda done: self._forget(task_key, done))
+            else:
+                self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, task_key: Tuple[int, str], task: "asyncio.Task[Any]") -> None:
+        with self._lock:
+            if self._tasks.get(task_key) is task:
+                del self._tasks[task_key]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return call and coalescing counters for this process."""
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls) + len(self._tasks),
+            }
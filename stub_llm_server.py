@@ -0,0 +1,182 @@
+"""
+SageAlpha.ai Stub LLM Server
+OpenAI-compatible chat completion endpoint with injectable latency and errors
+
+Usage:
+    python stub_llm_server.py [--port 8089] [--latency 0.2] [--slow-rate 0.05]
+                              [--slow-latency 5] [--throttle-rate 0.1] [--error-rate 0.05]
+
+Then run the app (or llm_gateway) against it:
+    OPENAI_API_KEY=stub LLM_BASE_URL=http://127.0.0.1:8089/v1 python app.py
+
+Answers both /v1/chat/completions and the Azure route
+/openai/deployments/<deployment>/chat/completions, with and without
+stream=true. Throttled requests get a 429 with retry-after-ms, failed ones
+a 500. GET /stats returns request counters.
+"""
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+_stats: Dict[str, int] = {"requests": 0, "throttled": 0, "errors": 0, "slow": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name: str) -> None:
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def _answer(messages: List[Dict[str, Any]]) -> str:
+    question = next(
+        (str(m.get("content") or "") for m in reversed(messages) if m.get("role") == "user"), ""
+    )
+    return f"Stub answer to: {question[:200]}"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Chat completion handler configured through class attributes."""
+
+    protocol_version = "HTTP/1.1"
+    latency = 0.2
+    slow_rate = 0.0
+    slow_latency = 5.0
+    throttle_rate = 0.0
+    error_rate = 0.0
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _send_json(
+        self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None
+    ) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        if self.path.rstrip("/") == "/stats":
+            with _stats_lock:
+                self._send_json(200, dict(_stats))
+        else:
+            self._send_json(404, {"error": {"message": "Not found"}})
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.split("?")[0].endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+        _count("requests")
+
+        roll = random.random()
+        if roll < self.throttle_rate:
+            _count("throttled")
+            self._send_json(
+                429,
+                {"error": {"code": "429", "message": "Rate limit reached (stub)"}},
+                {"retry-after-ms": "200", "retry-after": "1"},
+            )
+            return
+        if roll < self.throttle_rate + self.error_rate:
+            _count("errors")
+            self._send_json(500, {"error": {"message": "Internal error (stub)"}})
+            return
+
+        delay = self.latency
+        if random.random() < self.slow_rate:
+            _count("slow")
+            delay = self.slow_latency
+        time.sleep(delay)
+
+        answer = _answer(request.get("messages") or [])
+        model = request.get("model") or "stub-model"
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+
+        if not request.get("stream"):
+            self._send_json(
+                200,
+                {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": answer},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {
+                        "prompt_tokens": 0,
+                        "completion_tokens": len(answer.split()),
+                        "total_tokens": len(answer.split()),
+                    },
+                },
+            )
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for word in answer.split(" "):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+
+def main(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds per response")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="share of slow responses")
+    parser.add_argument("--slow-latency", type=float, default=5.0, help="seconds per slow response")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of 429 responses")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of 500 responses")
+    args = parser.parse_args(argv)
+
+    StubHandler.latency = args.latency
+    StubHandler.slow_rate = args.slow_rate
+    StubHandler.slow_latency = args.slow_latency
+    StubHandler.throttle_rate = args.throttle_rate
+    StubHandler.error_rate = args.error_rate
+
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    server.daemon_threads = True
+    print(f"Stub LLM server on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
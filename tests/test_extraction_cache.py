@@ -0,0 +1,23 @@
+from extraction_cache import ExtractionCache
+
+
+def test_complete_extraction_is_cached(tmp_path):
+    cache = ExtractionCache(str(tmp_path / "cache.db"))
+    pages = [(1, "Balance sheet"), (3, "Notes")]
+    assert list(cache.pages("abc", lambda skipped: iter(pages))) == pages
+    assert cache.get("abc") == pages
+
+
+def test_partial_extraction_is_not_cached(tmp_path):
+    cache = ExtractionCache(str(tmp_path / "cache.db"))
+
+    def extract(skipped):
+        yield 1, "Balance sheet"
+        skipped.append(2)
+
+    assert list(cache.pages("abc", extract)) == [(1, "Balance sheet")]
+    assert cache.get("abc") is None
+    # The next lookup extracts again and caches the full result
+    full = [(1, "Balance sheet"), (2, "Cash flow")]
+    assert list(cache.pages("abc", lambda skipped: iter(full))) == full
+    assert cache.get("abc") == full
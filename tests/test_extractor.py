@@ -0,0 +1,47 @@
+import io
+
+from PyPDF2 import PageObject, PdfWriter
+from PyPDF2.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+from extractor import PAGE_BLANK, PAGE_TEXT, classify_pdf_pages, extract_pdf_pages
+
+
+def _pdf(*texts):
+    """A PDF with one Helvetica page per text (None = a page with no resources)."""
+    writer = PdfWriter()
+    for text in texts:
+        page = PageObject.create_blank_page(None, 612, 792)
+        if text is None:
+            writer.add_page(page)
+            continue
+        font = DictionaryObject(
+            {
+                NameObject("/Type"): NameObject("/Font"),
+                NameObject("/Subtype"): NameObject("/Type1"),
+                NameObject("/BaseFont"): NameObject("/Helvetica"),
+            }
+        )
+        page[NameObject("/Resources")] = DictionaryObject(
+            {NameObject("/Font"): DictionaryObject({NameObject("/F1"): font})}
+        )
+        stream = DecodedStreamObject()
+        stream.set_data(f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode("latin-1"))
+        page[NameObject("/Contents")] = stream
+        writer.add_page(page)
+    buf = io.BytesIO()
+    writer.write(buf)
+    buf.seek(0)
+    return buf
+
+
+def test_short_text_pages_are_not_blank():
+    long_line = "Revenue from operations grew 12 percent year on year " * 3
+    pdf = _pdf("Annexure A", "Nil", long_line, None)
+    assert classify_pdf_pages(pdf) == [PAGE_TEXT, PAGE_TEXT, PAGE_TEXT, PAGE_BLANK]
+
+
+def test_short_text_pages_are_extracted():
+    pages = dict(extract_pdf_pages(_pdf("Annexure A", "Nil", None).getvalue(), workers=1))
+    assert "Annexure A" in pages[1]
+    assert "Nil" in pages[2]
+    assert 3 not in pages
@@ -0,0 +1,17 @@
+from normalize import clean_text, strip_markdown
+
+
+def test_strip_markdown_nested_emphasis():
+    assert strip_markdown("**bold _italic_ inside**") == "bold italic inside"
+    assert strip_markdown("_italic **bold** inside_") == "italic bold inside"
+    assert strip_markdown("__a *b* c__ and *d*") == "a b c and d"
+
+
+def test_strip_markdown_blocks():
+    text = "# Title\n\n- item one\n* item two\n\n\n\n```\ncode\n```\nEnd"
+    assert strip_markdown(text) == "Title\n\nitem one\nitem two\n\nEnd"
+
+
+def test_clean_text_collapses_whitespace_and_controls():
+    assert clean_text("  a\x00b\t\n c\x07  ") == "ab c"
+    assert clean_text("") == ""
@@ -0,0 +1,45 @@
+import importlib
+
+from retrieval import RetrievalSource, filter_relevant, reciprocal_rank_fusion
+
+
+def _sources():
+    search = lambda query, k: []  # noqa: E731
+    return {
+        "azure": RetrievalSource("azure", search, 1.0, scores="relative"),
+        "vectors": RetrievalSource("vectors", search, 1.0),
+    }
+
+
+def _rankings():
+    return {
+        "azure": [
+            {"doc_id": "a1", "text": "Revenue grew 12%", "meta": {}, "score": 20.0},
+            {"doc_id": "a2", "text": "Net debt fell", "meta": {}, "score": 4.0},
+        ],
+        "vectors": [
+            {"doc_id": "v1", "text": "Dividend policy", "meta": {}, "score": 0.62},
+            {"doc_id": "v2", "text": "Unrelated memo", "meta": {}, "score": 0.1},
+        ],
+    }
+
+
+def test_filter_relevant_keeps_relative_hits():
+    fused = reciprocal_rank_fusion(_rankings(), _sources(), k=10)
+    kept = {r["doc_id"] for r in filter_relevant(fused)}
+    # a2 is 20% of Azure's best hit, which says nothing about its relevance
+    assert kept == {"a1", "a2", "v1"}
+
+
+def test_build_hybrid_messages_uses_fused_hits(tmp_path, monkeypatch):
+    # app creates its stores relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(importlib.import_module("db_sqlite"), "DB_PATH", str(tmp_path / "app.db"))
+    app = importlib.import_module("app")
+
+    fused = reciprocal_rank_fusion(_rankings(), _sources(), k=10)
+    context = app.build_hybrid_messages("How is the company doing?", fused)[-2]["content"]
+    assert "Revenue grew 12%" in context
+    assert "Net debt fell" in context
+    assert "Dividend policy" in context
+    assert "Unrelated memo" not in context
@@ -0,0 +1,190 @@
+import zlib
+
+import numpy as np
+import pytest
+
+import vector_store
+from vector_store import VectorStore
+
+DIM = 32
+
+
+def _embed(texts):
+    """Deterministic gaussian embeddings (stable across processes, unlike hash())."""
+    out = []
+    for text in texts:
+        v = np.random.default_rng(zlib.crc32(text.encode("utf-8"))).standard_normal(DIM)
+        out.append((v / np.linalg.norm(v)).astype(np.float32))
+    return np.vstack(out)
+
+
+@pytest.fixture(autouse=True)
+def small_store(monkeypatch):
+    monkeypatch.setenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT", "none")
+    monkeypatch.setattr(VectorStore, "_local_embed", lambda self, texts: _embed(texts))
+    # Seal every few rows; maintenance only runs when a test asks for it
+    monkeypatch.setattr(vector_store, "SEGMENT_MAX_ROWS", 8)
+    monkeypatch.setattr(vector_store, "COMPACT_SEGMENT_THRESHOLD", 10**6)
+    monkeypatch.setattr(vector_store, "DEDUP_ENABLED", False)
+
+
+def _docs(n, prefix="doc", **meta):
+    return [
+        {"doc_id": f"{prefix}{i}", "text": f"{prefix} text {i}", "meta": dict(meta)}
+        for i in range(n)
+    ]
+
+
+def _top(store, text, **kwargs):
+    results = store.search(text, k=1, **kwargs)
+    return results[0]["doc_id"] if results else None
+
+
+def test_round_trip_across_seal_and_compaction(tmp_path):
+    store = VectorStore(str(tmp_path))
+    store.add_documents(_docs(30), batch_size=4, deduplicate=False)
+    store.add_document("single", "single text", {"source": "a.pdf"})
+    assert len(store._segments) > 2
+
+    reopened = VectorStore(str(tmp_path))
+    assert reopened.doc_ids == store.doc_ids
+    assert _top(reopened, "doc text 17") == "doc17"
+
+    store.compact()
+    assert len(store._segments) == 2
+    assert _top(store, "doc text 3") == "doc3"
+
+    reopened = VectorStore(str(tmp_path))
+    assert reopened.get_document_count() == 31
+    assert reopened.doc_ids == store.doc_ids
+    assert reopened.metas[-1] == {"source": "a.pdf"}
+    assert np.allclose(reopened.embeddings, store.embeddings)
+    for i in (0, 9, 29):
+        assert _top(reopened, f"doc text {i}") == f"doc{i}"
+
+
+def test_vacuum_then_write_from_another_instance(tmp_path):
+    first = VectorStore(str(tmp_path))
+    second = VectorStore(str(tmp_path))
+    first.add_documents(_docs(10), batch_size=4, deduplicate=False)
+    first.add_temporary_document("temp", "temp text", {}, scope="r1")
+    second.add_temporary_document("mine", "mine text", {}, scope="r2")
+    first.clear_temporary_documents("r1")
+    first.vacuum()
+
+    # The second instance last saw the old generation; its write reloads
+    # the store and carries its live temporary document over
+    second.add_document("late", "late text", {})
+    assert _top(second, "mine text", scope="r2") == "mine"
+    assert _top(second, "doc text 4") == "doc4"
+
+    reopened = VectorStore(str(tmp_path))
+    live = [d for d, dead in zip(reopened.doc_ids, reopened._dead) if not dead]
+    assert live == [f"doc{i}" for i in range(10)] + ["late"]
+    assert _top(reopened, "late text") == "late"
+    assert _top(reopened, "mine text") != "mine"
+
+    # The vacuuming instance picks the new rows up on its next write
+    first.add_document("next", "next text", {})
+    assert first.doc_ids == reopened.doc_ids + ["next"]
+    assert _top(first, "late text") == "late"
+
+    second.clear_temporary_documents("r2")
+    assert _top(second, "mine text", scope="r2") != "mine"
+
+
+def test_filter_shared_versus_session(tmp_path):
+    store = VectorStore(str(tmp_path))
+    store.add_documents(_docs(6, "shared"), deduplicate=False)
+    store.add_documents(_docs(6, "s1-", session_id="s1"), deduplicate=False)
+    store.add_documents(_docs(6, "s2-", session_id="s2"), deduplicate=False)
+
+    shared = store.search("s1- text 2", k=20, filter={"session_id": None})
+    assert {r["doc_id"] for r in shared} == {f"shared{i}" for i in range(6)}
+
+    scoped = store.search("s1- text 2", k=20, filter={"session_id": "s1"})
+    assert {r["doc_id"] for r in scoped} == {f"s1-{i}" for i in range(6)}
+    assert scoped[0]["doc_id"] == "s1-2"
+
+    both = store.search("s1- text 2", k=20, filter={"session_id": ["s1", None]})
+    assert {r["doc_id"] for r in both} == {r["doc_id"] for r in shared + scoped}
+
+    assert store.has_documents({"session_id": "s2"})
+    assert not store.has_documents({"session_id": "s3"})
+
+
+def test_temporary_documents_are_isolated_by_scope(tmp_path):
+    store = VectorStore(str(tmp_path))
+    store.add_documents(_docs(5), deduplicate=False)
+    store.add_temporary_document("t1", "temp one", {}, scope="r1")
+    store.add_temporary_document("t2", "temp two", {}, scope="r2")
+    assert store.temporary_doc_ids == {"t1", "t2"}
+
+    def visible(**kwargs):
+        return {r["doc_id"] for r in store.search("temp one", k=20, **kwargs)}
+
+    assert {"t1", "t2"} <= visible()
+    assert "t1" in visible(scope="r1") and "t2" not in visible(scope="r1")
+    assert "t2" in visible(scope="r2") and "t1" not in visible(scope="r2")
+    assert not {"t1", "t2"} & visible(include_temporary=False)
+    assert store.search("temp one", k=1, scope="r1")[0]["text"] == "temp one"
+
+    store.clear_temporary_documents("r1")
+    assert store.temporary_doc_ids == {"t2"}
+    assert "t1" not in visible()
+    assert "t2" in visible(scope="r2")
+
+    # Only text-less placeholders reach the disk
+    reopened = VectorStore(str(tmp_path))
+    assert not {"t1", "t2"} & {r["doc_id"] for r in reopened.search("temp two", k=20)}
+
+    store.clear_temporary_documents()
+    assert store.temporary_doc_ids == set()
+    assert visible() == {f"doc{i}" for i in range(5)}
+
+
+def _clustered_corpus(rows, clusters=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, DIM))
+    data = centers[rng.integers(clusters, size=rows)] + 0.5 * rng.standard_normal((rows, DIM))
+    data /= np.linalg.norm(data, axis=1, keepdims=True)
+    queries = centers[rng.integers(clusters, size=20)] + 0.5 * rng.standard_normal((20, DIM))
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return data.astype(np.float32), queries.astype(np.float32)
+
+
+def _recall(store, queries, exact, k):
+    found = 0
+    for query, truth in zip(queries, exact):
+        got = {r["doc_id"] for r in store.search("", k=k, query_vector=query)}
+        found += len(got & truth)
+    return found / (k * len(queries))
+
+
+@pytest.mark.parametrize("index_type,quantization", [("ivf", "none"), ("flat", "int8")])
+def test_recall_against_exact_scan(tmp_path, monkeypatch, index_type, quantization):
+    monkeypatch.setattr(vector_store, "SEGMENT_MAX_ROWS", 256)
+    data, queries = _clustered_corpus(2000)
+    vectors = {f"doc {i}": v for i, v in enumerate(data)}
+    monkeypatch.setattr(
+        VectorStore, "_local_embed", lambda self, texts: np.vstack([vectors[t] for t in texts])
+    )
+
+    store = VectorStore(str(tmp_path), index_type=index_type, nprobe=32, quantization=quantization)
+    store.add_documents(
+        ({"doc_id": str(i), "text": f"doc {i}", "meta": {}} for i in range(len(data))),
+        batch_size=200,
+        deduplicate=False,
+    )
+    if index_type == "ivf":
+        # Enable the index only now so no background build races this one
+        monkeypatch.setattr(vector_store, "ANN_MIN_ROWS", 100)
+        store.build_ann_index()
+        assert store._snapshot.ann.nlist > store.nprobe
+    else:
+        assert any(codes.dtype == np.int8 for codes, _ in store._snapshot.coarse)
+
+    k = 10
+    sims = queries @ data.T
+    exact = [{str(i) for i in np.argsort(-row)[:k]} for row in sims]
+    assert _recall(store, queries, exact, k) >= 0.9
@@ -0,0 +1,47 @@
+"""
+SageAlpha.ai Token Counting
+Token counts for sizing embedding and LLM requests
+"""
+
+import os
+from functools import lru_cache
+from typing import Any, Optional
+
+try:
+    import tiktoken
+except ImportError:  # Optional: fall back to a character heuristic
+    tiktoken = None
+
+# Encoding used by Azure OpenAI embedding and GPT-4 class deployments
+TOKEN_ENCODING = os.getenv("TOKEN_ENCODING", "cl100k_base")
+
+
+@lru_cache(maxsize=1)
+def get_encoding() -> Optional[Any]:
+    """Return the tiktoken encoding, or None if tiktoken is unavailable."""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(TOKEN_ENCODING)
+    except Exception as e:
+        # tiktoken downloads its BPE files on first use; offline hosts fail here
+        print(f"[tokenizer] tiktoken unavailable, using heuristic: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Count tokens in text.
+
+    Args:
+        text: Input text
+
+    Returns:
+        Exact token count with tiktoken, otherwise ~4 characters per token
+    """
+    if not text:
+        return 0
+    encoding = get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
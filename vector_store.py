@@ -1,18 +1,170 @@
 """
 SageAlpha.ai Vector Store
 Local vector store with Azure OpenAI embeddings support
+
+On-disk layout (segmented, append-only):
+    manifest.json      - format version, embedding dim and ordered segment list
+    seg_NNNNNN.f32     - raw float32 rows, one embedding per document
+    seg_NNNNNN.jsonl   - one {"doc_id", "text", "meta"} record per row
+
+New documents are appended to the last (active) segment, so a write costs
+O(chunk) bytes instead of rewriting the whole store. Full segments are sealed
+and merged by a background compaction once enough of them accumulate. The
+legacy embeddings.npy / metadata.json layout is migrated on first load.
+
+Sealed segments are memory-mapped read-only, so Gunicorn workers share the
+same page-cache pages and startup does not copy the matrix into RAM. Only the
+active segment is held in an in-RAM delta until it is sealed.
+
+Temporary documents (per-request PDF context) are written as text-less
+placeholder rows and hidden by a tombstone mask once cleared; dead rows are
+reclaimed lazily by a background vacuum.
+
+Large stores are searched through an IVF index (ann_index.py) persisted as
+ivf_index.npz next to the segments; small stores use exact search.
+
+With VECTOR_STORE_QUANTIZATION set, each sealed segment also gets a scalar
+quantized copy (seg_NNNNNN.f16, or seg_NNNNNN.i8 plus per-row scales in
+seg_NNNNNN.i8s). Search scans the quantized copy and re-scores a shortlist
+against the float32 rows, so only those rows are paged in from disk.
+
+Metadata fields listed in VECTOR_STORE_FILTER_FIELDS are kept in in-memory
+inverted indexes (value -> row ids), so a filtered search only scores the
+rows that match the filter.
+
+Concurrency: writers are serialized by a lock and publish an immutable
+_Snapshot when they finish; searches read the latest snapshot without
+locking. Row lists are only ever appended to (readers never look past the
+snapshot's row count) and everything else a snapshot references is replaced
+rather than mutated.
+
+Several processes (Gunicorn workers, Celery workers) may write to the same
+directory. Every disk write holds an exclusive flock on store.lock and first
+catches up with the rows and segments other processes wrote, so appends land
+after theirs and the manifest is never replaced by a stale copy. Each process
+sees other processes' rows from its next write on. Platforms without fcntl
+(Windows) get no cross-process lock and must use a single writer process.
 """
 
+import contextlib
 import json
 import os
-from typing import Any, Dict, List, Optional
+import random
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
 
 import numpy as np
 from dotenv import load_dotenv
-from openai import AzureOpenAI
+from openai import (
+    APIConnectionError,
+    APITimeoutError,
+    AzureOpenAI,
+    InternalServerError,
+    RateLimitError,
+)
+
+from ann_index import IVFIndex
+from dedup import DEDUP_ENABLED, ChunkDeduplicator
+from embedding_cache import EMBEDDING_CACHE_ENABLED, EmbeddingCache
+from tokenizer import count_tokens
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
 
 load_dotenv()
 
+# ==================== Storage Configuration ====================
+STORE_FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+
+# Advisory lock file serializing writers across processes
+LOCK_FILE = "store.lock"
+
+# Rows per segment before it is sealed and a new active segment is started
+SEGMENT_MAX_ROWS = int(os.getenv("VECTOR_STORE_SEGMENT_ROWS", "4096"))
+
+# Number of sealed segments that triggers a background compaction
+COMPACT_SEGMENT_THRESHOLD = int(os.getenv("VECTOR_STORE_COMPACT_SEGMENTS", "8"))
+
+# Fraction of tombstoned rows that triggers a background vacuum
+VACUUM_DEAD_FRACTION = float(os.getenv("VECTOR_STORE_VACUUM_FRACTION", "0.25"))
+VACUUM_MIN_ROWS = 256
+
+# Rows copied per batch when a vacuum rewrites the store
+REWRITE_BATCH_ROWS = 65536
+
+# ==================== Embedding Request Configuration ====================
+# Limits used to pack texts into a single embeddings request
+EMBED_MAX_INPUTS = int(os.getenv("VECTOR_STORE_EMBED_MAX_INPUTS", "256"))
+EMBED_MAX_TOKENS = int(os.getenv("VECTOR_STORE_EMBED_MAX_TOKENS", "100000"))
+
+# Embedding requests in flight at once for a bulk add
+EMBED_CONCURRENCY = int(os.getenv("VECTOR_STORE_EMBED_CONCURRENCY", "4"))
+
+# Retries for throttled (429) or transient embedding failures
+EMBED_MAX_RETRIES = int(os.getenv("VECTOR_STORE_EMBED_MAX_RETRIES", "6"))
+
+# ==================== ANN Configuration ====================
+ANN_FILE = "ivf_index.npz"
+
+# "ivf" for approximate search on large stores, "flat" for exact search only
+INDEX_TYPE = os.getenv("VECTOR_STORE_INDEX", "ivf").strip().lower()
+
+# Stores smaller than this are always searched exactly
+ANN_MIN_ROWS = int(os.getenv("VECTOR_STORE_ANN_MIN_ROWS", "20000"))
+
+# Inverted lists scanned per query (higher = better recall, slower)
+ANN_NPROBE = int(os.getenv("VECTOR_STORE_NPROBE", "16"))
+
+# Inverted list count (0 = about 4 * sqrt(rows), retrained as the store grows)
+ANN_NLIST = int(os.getenv("VECTOR_STORE_NLIST", "0"))
+
+# ==================== Quantization Configuration ====================
+# "none", "fp16" or "int8" (per-row scale) copy of sealed segments for search
+QUANTIZATION = os.getenv("VECTOR_STORE_QUANTIZATION", "none").strip().lower()
+QUANTIZATION_MODES = ("none", "fp16", "int8")
+
+# Candidates re-scored in float32 per result (shortlist = k * factor)
+RERANK_FACTOR = int(os.getenv("VECTOR_STORE_RERANK_FACTOR", "4"))
+
+# Rows dequantized at a time during the coarse scan
+QUANTIZED_SCAN_ROWS = 4096
+
+# ==================== Filter Configuration ====================
+# Metadata fields with an inverted index for search(filter=...)
+FILTER_FIELDS = tuple(
+    f.strip()
+    for f in os.getenv(
+        "VECTOR_STORE_FILTER_FIELDS", "session_id,source,filename,company"
+    ).split(",")
+    if f.strip()
+)
+
+# Filters matching more than this fraction of rows scan the whole store with
+# the other rows masked instead of gathering the matches
+FILTER_SCAN_FRACTION = 0.5
+
+
+class _Snapshot(NamedTuple):
+    """Consistent, read-only view of the store used by searches."""
+
+    count: int
+    blocks: List[np.ndarray]
+    coarse: List[Tuple[np.ndarray, Optional[np.ndarray]]]
+    doc_ids: List[str]
+    texts: List[str]
+    metas: List[Dict[str, Any]]
+    dead: np.ndarray
+    dead_count: int
+    temp_rows: Dict[Optional[str], List[int]]
+    postings: Dict[str, Dict[Any, List[int]]]
+    ann: Optional[IVFIndex]
+
 
 class VectorStore:
     """
@@ -20,16 +172,30 @@ class VectorStore:
     local dummy embeddings (development).
     """
 
-    def __init__(self, store_dir: str = "vector_store_data") -> None:
+    def __init__(
+        self,
+        store_dir: str = "vector_store_data",
+        index_type: Optional[str] = None,
+        nprobe: Optional[int] = None,
+        quantization: Optional[str] = None,
+    ) -> None:
         """
         Initialize the vector store.
 
         Args:
             store_dir: Directory to store embeddings and metadata
+            index_type: "ivf" or "flat" (defaults to VECTOR_STORE_INDEX)
+            nprobe: Default IVF lists scanned per query
+            quantization: "none", "fp16" or "int8"
+                (defaults to VECTOR_STORE_QUANTIZATION)
         """
         self.store_dir = store_dir
         os.makedirs(self.store_dir, exist_ok=True)
 
+        self.manifest_path = os.path.join(self.store_dir, MANIFEST_FILE)
+        self.lock_path = os.path.join(self.store_dir, LOCK_FILE)
+
+        # Legacy single-file layout (read only, for migration)
         self.emb_path = os.path.join(self.store_dir, "embeddings.npy")
         self.meta_path = os.path.join(self.store_dir, "metadata.json")
 
@@ -53,55 +219,994 @@ class VectorStore:
         # Initialize client if not local mode
         self.client: Optional[AzureOpenAI] = None
         if not self.local_mode:
+            # Retries are handled per batch in _embed_request
             self.client = AzureOpenAI(
                 azure_endpoint=self.azure_endpoint,
                 api_key=self.azure_api_key,
                 api_version=self.azure_api_version,
+                max_retries=0,
             )
         else:
             print("[VectorStore] LOCAL MODE ENABLED — Azure embeddings disabled.")
 
+        # Persistent embedding cache shared by all workers (Azure mode only)
+        self.embedding_cache: Optional[EmbeddingCache] = None
+        if not self.local_mode and EMBEDDING_CACHE_ENABLED:
+            try:
+                self.embedding_cache = EmbeddingCache(
+                    os.getenv("EMBEDDING_CACHE_PATH")
+                    or os.path.join(self.store_dir, "embedding_cache.sqlite3"),
+                    deployment=self.embedding_deployment,
+                )
+            except Exception as e:
+                print(f"[VectorStore] Embedding cache disabled: {e}")
+
+        # Near-duplicate index for bulk ingestion (boilerplate is linked, not embedded)
+        self.deduplicator: Optional[ChunkDeduplicator] = None
+        if DEDUP_ENABLED:
+            try:
+                self.deduplicator = ChunkDeduplicator(
+                    os.getenv("DEDUP_PATH") or os.path.join(self.store_dir, "dedup.sqlite3")
+                )
+            except Exception as e:
+                print(f"[VectorStore] Near-duplicate detection disabled: {e}")
+
         # Document storage
         self.doc_ids: List[str] = []
         self.texts: List[str] = []
         self.metas: List[Dict[str, Any]] = []
-        self.embeddings: Optional[np.ndarray] = None
-        self.temporary_doc_ids: set = set()
+
+        # Tombstones (dead rows are skipped by search until vacuumed) and
+        # live temporary rows keyed by the request scope that added them
+        self._dead = np.zeros(0, dtype=bool)
+        self._dead_count = 0
+        self._temp_rows: Dict[Optional[str], List[int]] = {}
+
+        # Inverted indexes over FILTER_FIELDS: field -> value -> ascending
+        # row ids (rows without the field are listed under None)
+        self._postings: Dict[str, Dict[Any, List[int]]] = {}
+
+        # Embedding matrix: memory-mapped sealed segments plus an in-RAM delta
+        # for the active segment, grown geometrically so appends are amortized
+        self.dim: Optional[int] = None
+        self._sealed: List[np.ndarray] = []
+        self._sealed_rows = 0
+        self._delta_buf: Optional[np.ndarray] = None
+        self._delta_count = 0
+
+        # Segment bookkeeping (the last segment is the active append target)
+        self._segments: List[str] = []
+        self._active_rows = 0
+        self._next_segment = 1
+        self._generation = 0
+        self._lock = threading.RLock()
+        self._lock_depth = 0
+        self._compaction_thread: Optional[threading.Thread] = None
+
+        # Approximate nearest-neighbour index over row ids
+        self.index_type = (index_type or INDEX_TYPE).lower()
+        self.nprobe = nprobe or ANN_NPROBE
+        self.ann_path = os.path.join(self.store_dir, ANN_FILE)
+        self._ann: Optional[IVFIndex] = None
+        self._ann_thread: Optional[threading.Thread] = None
+
+        # Quantized copies of the sealed segments (None entries when disabled)
+        self.quantization = (quantization or QUANTIZATION).lower()
+        if self.quantization not in QUANTIZATION_MODES:
+            print(f"[VectorStore] Unknown quantization '{self.quantization}', using none")
+            self.quantization = "none"
+        self._sealed_q: List[Optional[Tuple[np.ndarray, Optional[np.ndarray]]]] = []
+
+        # Latest published view for lock-free readers
+        self._snapshot = self._make_snapshot()
 
         self._load()
 
+    @property
+    def embeddings(self) -> Optional[np.ndarray]:
+        """
+        Embedding matrix of all stored documents (rows aligned with doc_ids).
+
+        This materializes a copy of the mapped segments; search and
+        persistence iterate over the blocks instead.
+        """
+        blocks = self._snapshot.blocks
+        if not blocks:
+            return None
+        return np.concatenate(blocks) if len(blocks) > 1 else np.array(blocks[0])
+
+    @property
+    def temporary_doc_ids(self) -> set:
+        """Doc ids of temporary documents that have not been cleared yet."""
+        snap = self._snapshot
+        return {snap.doc_ids[row] for rows in snap.temp_rows.values() for row in rows}
+
+    def _make_snapshot(self) -> _Snapshot:
+        """Capture the current state as a snapshot (caller holds the lock)."""
+        blocks = self._blocks()
+        return _Snapshot(
+            count=sum(len(block) for block in blocks),
+            blocks=blocks,
+            coarse=self._coarse_blocks(),
+            doc_ids=self.doc_ids,
+            texts=self.texts,
+            metas=self.metas,
+            dead=self._dead,
+            dead_count=self._dead_count,
+            temp_rows=self._temp_rows,
+            postings=self._postings,
+            ann=self._ann,
+        )
+
+    def _publish(self) -> None:
+        """Make the current state visible to searches (caller holds the lock)."""
+        self._snapshot = self._make_snapshot()
+
+    def _blocks(self) -> List[np.ndarray]:
+        """Return the row blocks of the matrix in document order."""
+        blocks = list(self._sealed)
+        if self._delta_count:
+            blocks.append(self._delta_buf[: self._delta_count])
+        return blocks
+
+    def _coarse_blocks(self) -> List[Tuple[np.ndarray, Optional[np.ndarray]]]:
+        """
+        Return the (codes, per-row scale) blocks scanned by the coarse pass.
+
+        Aligned with _blocks(); segments without a quantized copy and the
+        delta are returned as float32 with no scale.
+        """
+        blocks = [
+            quantized if quantized is not None else (block, None)
+            for block, quantized in zip(self._sealed, self._sealed_q)
+        ]
+        if self._delta_count:
+            blocks.append((self._delta_buf[: self._delta_count], None))
+        return blocks
+
+    # ==================== Persistence ====================
+
     def _load(self) -> None:
-        """Load existing embeddings and metadata from disk."""
+        """Load the segmented store, migrating the legacy layout if needed."""
+        with self._writing():
+            # Entering _writing() already read the segments listed in the manifest
+            if not os.path.exists(self.manifest_path):
+                self._migrate_legacy()
+            if self._ann is None:
+                self._load_ann()
+            self._publish()
+
+        self._maybe_schedule_ann_build()
+        self._maybe_schedule_compaction()
+        print(f"[VectorStore] Loaded {self.get_document_count()} documents")
+
+    @contextlib.contextmanager
+    def _writing(self) -> Iterator[None]:
+        """
+        Hold the store lock and the cross-process file lock for a disk write.
+
+        The outermost entry also syncs with what other processes wrote, so
+        the caller appends after their rows and rewrites an up-to-date
+        manifest.
+        """
+        with self._lock:
+            if self._lock_depth:
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                return
+
+            # Opened per acquisition: a descriptor inherited across fork()
+            # would share the lock with the parent
+            lock_file = open(self.lock_path, "a+b")
+            try:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                self._lock_depth = 1
+                try:
+                    self._sync_from_disk()
+                    yield
+                finally:
+                    self._lock_depth = 0
+            finally:
+                lock_file.close()
+
+    def _read_manifest(self) -> Optional[Dict[str, Any]]:
+        """Read manifest.json, or None if the store has not been written yet."""
+        if not os.path.exists(self.manifest_path):
+            return None
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _sync_from_disk(self) -> None:
+        """
+        Catch up with segments and rows written by other processes.
+
+        Within a generation rows are only appended (compaction merges sealed
+        segments without reordering them), so the rows this process holds
+        are a prefix of the rows on disk: the sealed segment list is taken
+        from the manifest and only rows past that prefix are read. A new
+        generation means another process rewrote the store, which is then
+        reloaded (see _reload). Caller holds the file lock.
+        """
+        manifest = self._read_manifest()
+        if manifest is None:
+            return
+
+        segments = list(manifest.get("segments", []))
+        generation = int(manifest.get("generation", 0))
+        self._next_segment = max(self._next_segment, int(manifest.get("next_segment", 1)))
+        if generation != self._generation:
+            self._reload(generation)
+            return
+        if not segments:
+            return
+        self.dim = self.dim or manifest.get("dim")
+        if segments == self._segments and (
+            self._segment_rows(segments[-1]) == self._active_rows
+        ):
+            return
+
+        count = len(self.doc_ids)
+        known = dict(zip(self._segments[:-1], zip(self._sealed, self._sealed_q)))
+        sealed: List[np.ndarray] = []
+        sealed_q: List[Optional[Tuple[np.ndarray, Optional[np.ndarray]]]] = []
+        records: List[Dict[str, Any]] = []
+        rows = 0
+        for name in segments[:-1]:
+            if name in known:
+                block, quantized = known[name]
+            else:
+                block = self._map_segment(name, self._segment_rows(name))
+                quantized = self._map_quantized(name, block)
+            if rows + len(block) > count:
+                records.extend(self._read_records(name)[max(count - rows, 0) :])
+            sealed.append(block)
+            sealed_q.append(quantized)
+            rows += len(block)
+
+        active = segments[-1]
+        emb, active_records = self._read_segment(active, repair=True)
+        if rows + len(active_records) < count:
+            # The disk lost rows this process holds; start over from disk
+            print("[VectorStore] Store shrank on disk, reloading")
+            self._reload(generation)
+            return
+        records.extend(active_records[max(count - rows, 0) :])
+
+        if not self._segments or active != self._segments[-1]:
+            self._delta_buf = None
+            self._delta_count = 0
+        self._sealed = sealed
+        self._sealed_q = sealed_q
+        self._sealed_rows = rows
+        self._segments = segments
+        self._active_rows = len(active_records)
+        self._grow_delta(emb[self._delta_count :])
+        self._append_records(records)
+
+        if self._ann is not None and records:
+            self._ann.add(self._gather_rows(np.arange(count, len(self.doc_ids))))
+        self._publish()
+
+    def _reload(self, generation: int) -> None:
+        """
+        Rebuild the in-memory rows from disk (after another process rewrote
+        the store), keeping this process's live temporary documents.
+
+        Other processes see temporary rows only as tombstoned placeholders,
+        so a rewrite elsewhere drops them from disk; they are re-appended
+        with their scopes so in-flight requests keep their context.
+        """
+        carried = [
+            (
+                scope,
+                self._gather_rows(np.asarray(rows, dtype=np.int64)),
+                [
+                    {"doc_id": self.doc_ids[row], "text": self.texts[row], "meta": self.metas[row]}
+                    for row in rows
+                ],
+            )
+            for scope, rows in self._temp_rows.items()
+            if rows
+        ]
+
+        self._reset_rows()
+        self._generation = generation
+        self._sync_from_disk()
+        self._load_ann()
+
+        for scope, emb, records in carried:
+            start = len(self.doc_ids)
+            rows = list(range(start, start + len(records)))
+            self._temp_rows = {
+                **self._temp_rows,
+                scope: [*self._temp_rows.get(scope, []), *rows],
+            }
+            self._add_rows(
+                emb, records, [self._placeholder_record(r["doc_id"]) for r in records]
+            )
+        self._publish()
+
+    def _reset_rows(self) -> None:
+        """Drop every in-memory row and segment (before a reload from disk)."""
+        self.doc_ids = []
+        self.texts = []
+        self.metas = []
+        self._dead = np.zeros(0, dtype=bool)
+        self._dead_count = 0
+        self._temp_rows = {}
+        self._postings = {}
+        self._sealed = []
+        self._sealed_q = []
+        self._sealed_rows = 0
+        self._delta_buf = None
+        self._delta_count = 0
+        self._segments = []
+        self._active_rows = 0
+        self._ann = None
+
+    def _segment_rows(self, name: str) -> int:
+        """Number of complete embedding rows in a segment's file."""
+        emb_path, _ = self._segment_paths(name)
+        if not self.dim or not os.path.exists(emb_path):
+            return 0
+        return os.path.getsize(emb_path) // (self.dim * 4)
+
+    def _migrate_legacy(self) -> None:
+        """Import embeddings.npy / metadata.json into the segmented layout."""
+        records: List[Dict[str, Any]] = []
         if os.path.exists(self.meta_path):
             with open(self.meta_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                for d in data:
-                    self.doc_ids.append(d["doc_id"])
-                    self.texts.append(d["text"])
-                    self.metas.append(d["meta"])
+                records = json.load(f)
 
+        emb = None
         if os.path.exists(self.emb_path):
-            self.embeddings = np.load(self.emb_path)
-        else:
-            self.embeddings = None
+            emb = np.load(self.emb_path).astype(np.float32)
+
+        if not records or emb is None or emb.ndim != 2 or emb.shape[0] == 0:
+            return
 
-        print(f"[VectorStore] Loaded {len(self.doc_ids)} documents")
+        n = min(len(records), emb.shape[0])
+        emb, records = emb[:n], records[:n]
 
-    def _save(self) -> None:
-        """Save embeddings and metadata to disk."""
-        data = []
-        for i, doc_id in enumerate(self.doc_ids):
-            data.append(
-                {"doc_id": doc_id, "text": self.texts[i], "meta": self.metas[i]}
+        self.dim = int(emb.shape[1])
+        name = self._new_segment_name()
+        self._write_segment(name, [emb], records)
+        self._seal_segment(name, records)
+        self._segments = [name, self._new_segment_name()]
+        self._active_rows = 0
+        self._write_manifest()
+        print(f"[VectorStore] Migrated {n} documents to segmented storage")
+
+    def _segment_paths(self, name: str) -> Tuple[str, str]:
+        """Return the (embeddings, metadata) file paths of a segment."""
+        base = os.path.join(self.store_dir, name)
+        return base + ".f32", base + ".jsonl"
+
+    def _new_segment_name(self) -> str:
+        """Allocate a new, never-reused segment name."""
+        name = f"seg_{self._next_segment:06d}"
+        self._next_segment += 1
+        return name
+
+    def _write_manifest(self) -> None:
+        """Atomically replace the manifest with the current segment list."""
+        data = {
+            "format": STORE_FORMAT_VERSION,
+            "dim": self.dim,
+            "next_segment": self._next_segment,
+            "generation": self._generation,
+            "segments": list(self._segments),
+        }
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _read_records(self, name: str) -> List[Dict[str, Any]]:
+        """Read the metadata records of a sealed segment."""
+        _, meta_path = self._segment_paths(name)
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+
+    def _map_segment(self, name: str, rows: int) -> np.ndarray:
+        """Memory-map the first rows of a sealed segment read-only."""
+        if rows == 0:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        emb_path, _ = self._segment_paths(name)
+        return np.memmap(emb_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+
+    def _quantized_paths(self, name: str) -> Tuple[str, str]:
+        """Return the (codes, scales) sidecar paths of a segment."""
+        base = os.path.join(self.store_dir, name)
+        if self.quantization == "fp16":
+            return base + ".f16", ""
+        return base + ".i8", base + ".i8s"
+
+    @staticmethod
+    def _quantize(
+        emb: np.ndarray, mode: str
+    ) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        Scalar-quantize embedding rows.
+
+        Args:
+            emb: float32 rows
+            mode: "fp16" or "int8"
+
+        Returns:
+            Tuple of (codes, per-row scales or None for fp16)
+        """
+        if mode == "fp16":
+            return emb.astype(np.float16), None
+        scale = np.abs(emb).max(axis=1) / 127.0
+        scale[scale == 0] = 1.0
+        codes = np.rint(emb / scale[:, None]).clip(-127, 127).astype(np.int8)
+        return codes, scale.astype(np.float32)
+
+    def _map_quantized(
+        self, name: str, block: np.ndarray
+    ) -> Optional[Tuple[np.ndarray, Optional[np.ndarray]]]:
+        """
+        Memory-map the quantized copy of a sealed segment, building it first
+        if it is missing or does not match the segment.
+
+        Args:
+            name: Segment name
+            block: The segment's mapped float32 rows
+
+        Returns:
+            Tuple of (codes, per-row scales), or None when quantization is off
+        """
+        rows = len(block)
+        if self.quantization == "none" or rows == 0:
+            return None
+
+        codes_path, scale_path = self._quantized_paths(name)
+        itemsize = 2 if self.quantization == "fp16" else 1
+        valid = os.path.exists(codes_path) and (
+            os.path.getsize(codes_path) == rows * self.dim * itemsize
+        )
+        if scale_path:
+            valid = valid and os.path.exists(scale_path) and (
+                os.path.getsize(scale_path) == rows * 4
             )
 
-        with open(self.meta_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2)
+        if not valid:
+            scales = []
+            with open(codes_path + ".tmp", "wb") as f:
+                for start in range(0, rows, REWRITE_BATCH_ROWS):
+                    codes, scale = self._quantize(
+                        np.asarray(block[start : start + REWRITE_BATCH_ROWS]),
+                        self.quantization,
+                    )
+                    f.write(codes.tobytes())
+                    if scale is not None:
+                        scales.append(scale)
+            if scale_path:
+                with open(scale_path + ".tmp", "wb") as f:
+                    f.write(np.concatenate(scales).tobytes())
+                os.replace(scale_path + ".tmp", scale_path)
+            os.replace(codes_path + ".tmp", codes_path)
+
+        dtype = np.float16 if self.quantization == "fp16" else np.int8
+        codes = np.memmap(codes_path, dtype=dtype, mode="r", shape=(rows, self.dim))
+        scale = np.fromfile(scale_path, dtype=np.float32) if scale_path else None
+        return codes, scale
+
+    def _read_segment(
+        self, name: str, repair: bool = False
+    ) -> Tuple[np.ndarray, List[Dict[str, Any]]]:
+        """
+        Read a segment from disk.
 
-        if self.embeddings is None:
-            np.save(self.emb_path, np.zeros((0, 0)))
+        Rows and records are trimmed to the length of the shorter file, which
+        discards a torn trailing write. With repair=True the files are also
+        truncated so later appends stay aligned.
+
+        Args:
+            name: Segment name
+            repair: Truncate the segment files to their consistent prefix
+
+        Returns:
+            Tuple of (embedding rows, metadata records)
+        """
+        emb_path, meta_path = self._segment_paths(name)
+
+        records: List[Dict[str, Any]] = []
+        offsets = [0]
+        if os.path.exists(meta_path):
+            with open(meta_path, "rb") as f:
+                for raw in f:
+                    if not raw.endswith(b"\n"):
+                        break
+                    records.append(json.loads(raw))
+                    offsets.append(offsets[-1] + len(raw))
+
+        dim = self.dim or 0
+        if dim and os.path.exists(emb_path):
+            flat = np.fromfile(emb_path, dtype=np.float32)
+            emb = flat[: (flat.size // dim) * dim].reshape(-1, dim)
+        else:
+            emb = np.zeros((0, dim), dtype=np.float32)
+
+        n = min(len(records), emb.shape[0])
+        if repair and dim:
+            if os.path.exists(emb_path) and os.path.getsize(emb_path) != n * dim * 4:
+                os.truncate(emb_path, n * dim * 4)
+            if os.path.exists(meta_path) and os.path.getsize(meta_path) != offsets[n]:
+                os.truncate(meta_path, offsets[n])
+
+        return emb[:n], records[:n]
+
+    def _write_segment(
+        self, name: str, blocks: Iterable[np.ndarray], records: List[Dict[str, Any]]
+    ) -> None:
+        """Write a complete segment, making each file visible atomically."""
+        emb_path, meta_path = self._segment_paths(name)
+
+        with open(emb_path + ".tmp", "wb") as f:
+            for block in blocks:
+                f.write(np.ascontiguousarray(block, dtype=np.float32).tobytes())
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+
+        os.replace(emb_path + ".tmp", emb_path)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    def _remove_segment_files(self, names: List[str]) -> None:
+        """Delete the files of segments no longer referenced by the manifest."""
+        for name in names:
+            base = os.path.join(self.store_dir, name)
+            sidecars = [base + ext for ext in (".f16", ".i8", ".i8s")]
+            for path in [*self._segment_paths(name), *sidecars]:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    # Windows refuses to delete files that are still mapped
+                    print(f"[VectorStore] Could not remove {path}: {e}")
+
+    def _append_to_active(
+        self, emb: np.ndarray, records: List[Dict[str, Any]]
+    ) -> None:
+        """Append rows to the active segment, sealing it when full."""
+        manifest_dirty = False
+        if not self._segments or self._active_rows >= SEGMENT_MAX_ROWS:
+            if self._segments:
+                self._seal_active()
+            self._segments.append(self._new_segment_name())
+            self._active_rows = 0
+            manifest_dirty = True
+
+        emb_path, meta_path = self._segment_paths(self._segments[-1])
+        with open(emb_path, "ab") as f:
+            f.write(np.ascontiguousarray(emb, dtype=np.float32).tobytes())
+        with open(meta_path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(r) + "\n" for r in records))
+        self._active_rows += len(records)
+
+        if manifest_dirty or not os.path.exists(self.manifest_path):
+            self._write_manifest()
+            self._maybe_schedule_compaction()
+
+    def _seal_active(self) -> None:
+        """Map the full active segment and release its in-RAM delta rows."""
+        rows = self._delta_count
+        self._sealed.append(self._map_segment(self._segments[-1], rows))
+        self._sealed_q.append(self._map_quantized(self._segments[-1], self._sealed[-1]))
+        self._sealed_rows += rows
+        self._delta_buf = None
+        self._delta_count = 0
+
+    def _seal_segment(self, name: str, records: List[Dict[str, Any]]) -> None:
+        """Map a sealed segment from disk and register its records."""
+        self._sealed.append(self._map_segment(name, len(records)))
+        self._sealed_q.append(self._map_quantized(name, self._sealed[-1]))
+        self._sealed_rows += len(records)
+        self._append_records(records)
+
+    def _rewrite_store(self) -> None:
+        """Rewrite the live rows as a single fresh sealed segment."""
+        old_segments = list(self._segments)
+        count = len(self.doc_ids)
+        live = np.flatnonzero(~self._dead[:count])
+        temp_rows = {row for rows in self._temp_rows.values() for row in rows}
+        records = [self._disk_record(row, row in temp_rows) for row in live]
+
+        name = self._new_segment_name()
+        blocks = self._blocks()
+        self._write_segment(
+            name,
+            (
+                self._gather_rows(live[i : i + REWRITE_BATCH_ROWS], blocks)
+                for i in range(0, len(live), REWRITE_BATCH_ROWS)
+            ),
+            records,
+        )
+
+        # Renumber rows; pending temporary rows keep their scope
+        new_row = np.full(count, -1, dtype=np.int64)
+        new_row[live] = np.arange(len(live))
+        self._temp_rows = {
+            scope: [int(new_row[row]) for row in rows]
+            for scope, rows in self._temp_rows.items()
+        }
+        self.doc_ids = [self.doc_ids[row] for row in live]
+        self.texts = [self.texts[row] for row in live]
+        self.metas = [self.metas[row] for row in live]
+        self._postings = {}
+        self._index_metas(0, self.metas)
+        self._dead = np.zeros(len(live), dtype=bool)
+        self._dead_count = 0
+
+        self._sealed = [self._map_segment(name, len(live))]
+        self._sealed_q = [self._map_quantized(name, self._sealed[0])]
+        self._sealed_rows = len(live)
+        self._delta_buf = None
+        self._delta_count = 0
+        self._segments = [name, self._new_segment_name()]
+        self._active_rows = 0
+
+        # Row ids changed, so the ANN index no longer applies
+        self._generation += 1
+        self._ann = None
+        if os.path.exists(self.ann_path):
+            os.remove(self.ann_path)
+
+        self._write_manifest()
+        self._publish()
+        self._remove_segment_files(old_segments)
+        self._maybe_schedule_ann_build()
+
+    def _disk_record(self, row: int, temporary: bool = False) -> Dict[str, Any]:
+        """Return the on-disk record of a row (text-less for temporary rows)."""
+        if temporary:
+            return self._placeholder_record(self.doc_ids[row])
+        return {"doc_id": self.doc_ids[row], "text": self.texts[row], "meta": self.metas[row]}
+
+    def vacuum(self) -> None:
+        """Reclaim tombstoned rows by rewriting the store without them."""
+        with self._writing():
+            if self._dead_count:
+                dead = self._dead_count
+                self._rewrite_store()
+                print(f"[VectorStore] Vacuumed {dead} dead rows")
+
+    # ==================== Compaction ====================
+
+    def _maybe_schedule_compaction(self) -> None:
+        """
+        Start background maintenance: a vacuum once enough rows are
+        tombstoned, otherwise a compaction once enough segments are sealed.
+        """
+        if self._compaction_thread is not None and self._compaction_thread.is_alive():
+            return
+
+        sealed = self._segments[:-1]
+        vacuum_rows = max(VACUUM_MIN_ROWS, VACUUM_DEAD_FRACTION * len(self.doc_ids))
+        if self._dead_count and self._dead_count >= vacuum_rows:
+            target, args = self.vacuum, ()
+        elif len(sealed) >= COMPACT_SEGMENT_THRESHOLD:
+            target, args = self.compact, (sealed,)
         else:
-            np.save(self.emb_path, self.embeddings)
+            return
+
+        self._compaction_thread = threading.Thread(
+            target=target,
+            args=args,
+            name="vector-store-compaction",
+            daemon=True,
+        )
+        self._compaction_thread.start()
+
+    def compact(self, segments: Optional[List[str]] = None) -> None:
+        """
+        Merge sealed segments into a single segment.
+
+        Sealed segments are immutable, so their files are concatenated without
+        holding the store lock; only the name reservation and the manifest
+        swap are serialized with writers.
+
+        Args:
+            segments: Contiguous run of sealed segments to merge
+                (defaults to all sealed segments)
+        """
+        with self._writing():
+            sealed = self._segments[:-1]
+            if segments is None:
+                segments = sealed
+            if len(segments) < 2 or not self._is_contiguous(segments, sealed):
+                return
+            merged = self._new_segment_name()
+            # Publish next_segment so other processes never reuse the name
+            self._write_manifest()
+
+        merged_emb, merged_meta = self._segment_paths(merged)
+        with open(merged_emb + ".tmp", "wb") as out_emb, open(
+            merged_meta + ".tmp", "wb"
+        ) as out_meta:
+            for name in segments:
+                emb_path, meta_path = self._segment_paths(name)
+                with open(emb_path, "rb") as f:
+                    shutil.copyfileobj(f, out_emb)
+                with open(meta_path, "rb") as f:
+                    shutil.copyfileobj(f, out_meta)
+        os.replace(merged_emb + ".tmp", merged_emb)
+        os.replace(merged_meta + ".tmp", merged_meta)
+
+        # Build the merged quantized copy before taking the lock as well
+        rows = os.path.getsize(merged_emb) // (self.dim * 4)
+        merged_block = self._map_segment(merged, rows)
+        merged_q = self._map_quantized(merged, merged_block)
+
+        with self._writing():
+            # The store may have been rewritten (or compacted by another
+            # process) while merging
+            if not self._is_contiguous(segments, self._segments[:-1]):
+                self._remove_segment_files([merged])
+                return
+            start = self._segments.index(segments[0])
+            self._sealed[start : start + len(segments)] = [merged_block]
+            self._sealed_q[start : start + len(segments)] = [merged_q]
+            self._segments[start : start + len(segments)] = [merged]
+            self._write_manifest()
+            self._save_ann()
+            self._publish()
+
+        self._remove_segment_files(segments)
+        print(f"[VectorStore] Compacted {len(segments)} segments into {merged}")
+
+    # ==================== ANN Index ====================
+
+    def _load_ann(self) -> None:
+        """Load the persisted IVF index and index rows added since it was saved."""
+        if self.index_type != "ivf" or not os.path.exists(self.ann_path):
+            return
+
+        try:
+            index, extra = IVFIndex.load(self.ann_path)
+        except Exception as e:
+            print(f"[VectorStore] Ignoring unreadable ANN index: {e}")
+            return
+
+        count = len(self.doc_ids)
+        if (
+            extra.get("generation") != self._generation
+            or index.dim != self.dim
+            or index.ntotal > count
+        ):
+            return
+
+        index.nprobe = self.nprobe
+        index.add(self._gather_rows(np.arange(index.ntotal, count)))
+        self._ann = index
+
+    def _save_ann(self) -> None:
+        """Persist the IVF index, tagged with the store generation."""
+        if self._ann is not None:
+            self._ann.save(self.ann_path, generation=self._generation)
+
+    def _maybe_schedule_ann_build(self) -> None:
+        """Build the IVF index in the background once the store is large enough."""
+        if self.index_type != "ivf" or len(self.doc_ids) < ANN_MIN_ROWS:
+            return
+        if self._ann_thread is not None and self._ann_thread.is_alive():
+            return
+        # Retrain only when the list count should roughly double
+        if self._ann is not None and (
+            ANN_NLIST or IVFIndex.default_nlist(len(self.doc_ids)) < 2 * self._ann.nlist
+        ):
+            return
+
+        self._ann_thread = threading.Thread(
+            target=self.build_ann_index, name="vector-store-ann-build", daemon=True
+        )
+        self._ann_thread.start()
+
+    def build_ann_index(self) -> None:
+        """
+        (Re)build the IVF index from the current rows.
+
+        Training runs on a snapshot without holding the store lock; rows
+        appended meanwhile are indexed before the new index is swapped in.
+        """
+        with self._lock:
+            generation = self._generation
+            blocks = self._blocks()
+        count = sum(len(block) for block in blocks)
+        if count == 0:
+            return
+
+        nlist = ANN_NLIST or IVFIndex.default_nlist(count)
+        index = IVFIndex(self.dim, nlist, self.nprobe)
+
+        rng = np.random.default_rng(0)
+        sample_size = min(count, nlist * 64)
+        sample = np.sort(rng.choice(count, sample_size, replace=False))
+        index.train(self._gather_rows(sample, blocks))
+        for block in blocks:
+            index.add(block)
+
+        with self._writing():
+            if generation != self._generation:
+                return
+            index.add(self._gather_rows(np.arange(index.ntotal, len(self.doc_ids))))
+            self._ann = index
+            self._save_ann()
+            self._publish()
+        print(f"[VectorStore] Built IVF index ({index.nlist} lists, {index.ntotal} rows)")
+
+    def _gather_rows(
+        self, rows: np.ndarray, blocks: Optional[List[np.ndarray]] = None
+    ) -> np.ndarray:
+        """
+        Copy the embedding rows with the given ids out of the block list.
+
+        Args:
+            rows: Global row ids (sorted ids give sequential mmap reads)
+            blocks: Block snapshot to read from (defaults to the current one)
+
+        Returns:
+            Array of shape (len(rows), dim)
+        """
+        if blocks is None:
+            blocks = self._blocks()
+        out = np.empty((len(rows), self.dim or 0), dtype=np.float32)
+
+        start = 0
+        for block in blocks:
+            end = start + len(block)
+            mask = (rows >= start) & (rows < end)
+            if mask.any():
+                out[mask] = block[rows[mask] - start]
+            start = end
+        return out
+
+    @staticmethod
+    def _is_contiguous(run: List[str], segments: List[str]) -> bool:
+        """Check that run appears as a contiguous slice of segments."""
+        if not run or run[0] not in segments:
+            return False
+        start = segments.index(run[0])
+        return segments[start : start + len(run)] == run
+
+    # ==================== In-Memory Rows ====================
+
+    def _add_rows(
+        self,
+        emb: np.ndarray,
+        records: List[Dict[str, Any]],
+        disk_records: Optional[List[Dict[str, Any]]] = None,
+    ) -> None:
+        """
+        Persist rows to the active segment and append them to the delta.
+
+        Args:
+            emb: Embedding rows
+            records: In-memory records
+            disk_records: Records to persist instead (defaults to records)
+        """
+        self._check_dim(emb)
+        self._append_to_active(emb, disk_records or records)
+        self._append_delta(emb, records)
+
+        if self._ann is not None:
+            self._ann.add(emb)
+        self._publish()
+        self._maybe_schedule_ann_build()
+
+    def _append_delta(
+        self, emb: np.ndarray, records: List[Dict[str, Any]]
+    ) -> None:
+        """Append embedding rows and their records to the in-RAM delta."""
+        if not records:
+            return
+        self._check_dim(emb)
+        self._grow_delta(emb)
+        self._append_records(records)
+
+    def _grow_delta(self, emb: np.ndarray) -> None:
+        """Append embedding rows to the in-RAM delta buffer."""
+        n = len(emb)
+        if n == 0:
+            return
+
+        if self._delta_buf is None:
+            self._delta_buf = np.empty((max(n, 64), self.dim), dtype=np.float32)
+        elif self._delta_count + n > self._delta_buf.shape[0]:
+            capacity = max(self._delta_count + n, 2 * self._delta_buf.shape[0])
+            grown = np.empty((capacity, self.dim), dtype=np.float32)
+            grown[: self._delta_count] = self._delta_buf[: self._delta_count]
+            self._delta_buf = grown
+
+        self._delta_buf[self._delta_count : self._delta_count + n] = emb
+        self._delta_count += n
+
+    def _check_dim(self, emb: np.ndarray) -> None:
+        """Fix the store dimension on first use and reject mismatched rows."""
+        if self.dim is None:
+            self.dim = int(emb.shape[1])
+        elif emb.shape[1] != self.dim:
+            raise ValueError(
+                f"Embedding dimension {emb.shape[1]} does not match store dimension {self.dim}"
+            )
+
+    def _append_records(self, records: List[Dict[str, Any]]) -> None:
+        """
+        Append document records to the id/text/meta lists.
+
+        Temporary placeholders read back from disk belong to requests that
+        no longer exist, so they are tombstoned immediately.
+        """
+        start = len(self.doc_ids)
+        if start + len(records) > len(self._dead):
+            grown = np.zeros(max(start + len(records), 2 * len(self._dead)), dtype=bool)
+            grown[: len(self._dead)] = self._dead
+            self._dead = grown
+
+        for i, record in enumerate(records):
+            self.doc_ids.append(record["doc_id"])
+            self.texts.append(record["text"])
+            self.metas.append(record["meta"])
+            if record.get("temporary"):
+                self._dead[start + i] = True
+                self._dead_count += 1
+        self._index_metas(start, [record["meta"] for record in records])
+
+    def _index_metas(self, start: int, metas: List[Dict[str, Any]]) -> None:
+        """Add rows starting at start to the metadata inverted indexes."""
+        for field in FILTER_FIELDS:
+            postings = self._postings.setdefault(field, {})
+            for i, meta in enumerate(metas):
+                value = meta.get(field)
+                if isinstance(value, (list, dict)):
+                    continue
+                postings.setdefault(value, []).append(start + i)
+
+    @staticmethod
+    def _filter_rows(snap: _Snapshot, where: Dict[str, Any]) -> np.ndarray:
+        """
+        Resolve a metadata filter to the matching row ids.
+
+        Args:
+            snap: Snapshot being searched
+            where: Field -> value, or a list of accepted values; None matches
+                rows without the field. Fields outside FILTER_FIELDS fall
+                back to a scan of the metadata.
+
+        Returns:
+            Sorted array of matching row ids
+        """
+        rows: Optional[np.ndarray] = None
+        for field, wanted in where.items():
+            values = list(wanted) if isinstance(wanted, (list, tuple, set)) else [wanted]
+            if field in snap.postings:
+                postings = snap.postings[field]
+                parts = [np.asarray(postings.get(v, []), dtype=np.int64) for v in values]
+                if len(parts) == 1:
+                    matched = parts[0]
+                else:
+                    matched = np.unique(np.concatenate(parts or [np.empty(0, dtype=np.int64)]))
+            else:
+                matched = np.array(
+                    [
+                        row
+                        for row in range(snap.count)
+                        if snap.metas[row].get(field) in values
+                    ],
+                    dtype=np.int64,
+                )
+            matched = matched[matched < snap.count]
+            rows = matched if rows is None else np.intersect1d(rows, matched, assume_unique=True)
+        return rows if rows is not None else np.arange(snap.count)
+
+    # ==================== Embeddings ====================
 
     def embed(self, texts: str | List[str]) -> np.ndarray:
         """
@@ -120,18 +1225,120 @@ class VectorStore:
         if self.local_mode:
             return self._local_embed(texts)
 
-        # Production mode: Azure OpenAI embeddings
-        resp = self.client.embeddings.create(
-            model=self.embedding_deployment, input=texts
+        # Production mode: serve what we can from the cache, embed each
+        # distinct missing text once and remember the results
+        cached: List[Optional[np.ndarray]] = [None] * len(texts)
+        if self.embedding_cache is not None:
+            try:
+                cached = self.embedding_cache.get_many(texts, dim=self.dim)
+            except Exception as e:
+                print(f"[VectorStore] Embedding cache lookup failed: {e}")
+
+        missing = list(dict.fromkeys(t for t, v in zip(texts, cached) if v is None))
+        fresh: Dict[str, np.ndarray] = {}
+        if missing:
+            emb = self._embed_remote(missing)
+            fresh = dict(zip(missing, emb))
+            if self.embedding_cache is not None:
+                try:
+                    self.embedding_cache.put_many(missing, emb)
+                except Exception as e:
+                    print(f"[VectorStore] Embedding cache write failed: {e}")
+
+        return np.vstack(
+            [v if v is not None else fresh[t] for t, v in zip(texts, cached)]
         )
 
-        out = []
-        for item in resp.data:
-            v = np.array(item.embedding, dtype="float32")
-            v /= np.linalg.norm(v) + 1e-10
-            out.append(v)
+    def _embed_remote(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed texts with Azure OpenAI.
 
-        return np.vstack(out)
+        Texts are packed into requests and sent concurrently when there is
+        more than one.
+        """
+        batches = self._pack_batches(texts)
+        if len(batches) == 1:
+            return self._embed_request(batches[0])
+
+        with ThreadPoolExecutor(
+            max_workers=min(EMBED_CONCURRENCY, len(batches)),
+            thread_name_prefix="embed",
+        ) as pool:
+            return np.vstack(list(pool.map(self._embed_request, batches)))
+
+    @staticmethod
+    def _pack_batches(texts: List[str]) -> List[List[str]]:
+        """
+        Pack texts into request-sized batches, preserving order.
+
+        A batch is closed when it reaches EMBED_MAX_INPUTS texts or adding
+        the next text would exceed EMBED_MAX_TOKENS.
+        """
+        batches: List[List[str]] = []
+        current: List[str] = []
+        tokens = 0
+        for text in texts:
+            n = count_tokens(text)
+            if current and (
+                len(current) >= EMBED_MAX_INPUTS or tokens + n > EMBED_MAX_TOKENS
+            ):
+                batches.append(current)
+                current, tokens = [], 0
+            current.append(text)
+            tokens += n
+        if current:
+            batches.append(current)
+        return batches
+
+    def _embed_request(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed one batch, retrying throttled and transient failures.
+
+        Args:
+            texts: Texts that fit in one request
+
+        Returns:
+            Normalized embeddings in input order
+        """
+        for attempt in range(EMBED_MAX_RETRIES + 1):
+            try:
+                resp = self.client.embeddings.create(
+                    model=self.embedding_deployment, input=texts
+                )
+                break
+            except (
+                RateLimitError,
+                APITimeoutError,
+                APIConnectionError,
+                InternalServerError,
+            ) as e:
+                if attempt == EMBED_MAX_RETRIES:
+                    raise
+                delay = self._retry_delay(e, attempt)
+                print(
+                    f"[VectorStore] Embedding request failed ({type(e).__name__}), "
+                    f"retrying in {delay:.1f}s"
+                )
+                time.sleep(delay)
+
+        data = sorted(resp.data, key=lambda item: item.index)
+        out = np.array([item.embedding for item in data], dtype=np.float32)
+        out /= np.linalg.norm(out, axis=1, keepdims=True) + 1e-10
+        return out
+
+    @staticmethod
+    def _retry_delay(error: Exception, attempt: int) -> float:
+        """Honor the server's retry-after header, else back off exponentially."""
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None) or {}
+        try:
+            if headers.get("retry-after-ms"):
+                return float(headers["retry-after-ms"]) / 1000.0
+            if headers.get("retry-after"):
+                return float(headers["retry-after"])
+        except ValueError:
+            pass
+        return min(60.0, 2.0**attempt) * random.uniform(0.5, 1.5)
 
     def _local_embed(self, texts: List[str]) -> np.ndarray:
         """
@@ -152,6 +1359,8 @@ class VectorStore:
 
         return np.vstack(out)
 
+    # ==================== Public API ====================
+
     def add_document(
         self, doc_id: str, text: str, meta: Dict[str, Any]
     ) -> None:
@@ -164,99 +1373,409 @@ class VectorStore:
             meta: Document metadata
         """
         emb = self.embed(text)
+        record = {"doc_id": doc_id, "text": text, "meta": meta}
 
-        if self.embeddings is None:
-            self.embeddings = emb
-        else:
-            self.embeddings = np.vstack([self.embeddings, emb])
+        with self._writing():
+            self._add_rows(emb, [record])
+
+    def add_documents(
+        self,
+        documents: Iterable[Dict[str, Any]],
+        batch_size: Optional[int] = None,
+        deduplicate: bool = True,
+    ) -> int:
+        """
+        Add many documents with batched embedding.
 
-        self.doc_ids.append(doc_id)
-        self.texts.append(text)
-        self.metas.append(meta)
-        self._save()
+        Documents are consumed lazily: each batch is embedded and appended
+        (and becomes searchable) before the next one is read, so a generator
+        input keeps memory bounded.
+
+        Args:
+            documents: Dicts with doc_id, text and meta
+            batch_size: Documents per append (defaults to enough to keep
+                EMBED_CONCURRENCY full requests in flight)
+            deduplicate: Skip near-duplicates of indexed chunks visible to
+                the same session (they are linked to the indexed chunk)
+
+        Returns:
+            Number of documents added
+        """
+        batch_size = batch_size or EMBED_MAX_INPUTS * EMBED_CONCURRENCY
+        added = 0
+        records: List[Dict[str, Any]] = []
+        for d in documents:
+            records.append(
+                {"doc_id": d["doc_id"], "text": d["text"], "meta": d.get("meta") or {}}
+            )
+            if len(records) >= batch_size:
+                added += self._add_batch(records, deduplicate)
+                records = []
+        if records:
+            added += self._add_batch(records, deduplicate)
+        return added
+
+    def _add_batch(self, records: List[Dict[str, Any]], deduplicate: bool = False) -> int:
+        """Embed a batch of records and append it in one write."""
+        dedup = self.deduplicator if deduplicate else None
+        if dedup is not None:
+            records, signatures, duplicates = dedup.filter(records)
+            if duplicates:
+                print(f"[VectorStore] Skipped {len(duplicates)} near-duplicate chunks")
+
+        if records:
+            emb = self.embed([r["text"] for r in records])
+            with self._writing():
+                self._add_rows(emb, records)
+
+        # Only chunks that made it into the store become dedup targets
+        if dedup is not None:
+            dedup.register(signatures)
+            dedup.link(duplicates)
+        return len(records)
 
     def add_temporary_document(
-        self, doc_id: str, text: str, meta: Dict[str, Any]
+        self,
+        doc_id: str,
+        text: str,
+        meta: Dict[str, Any],
+        scope: Optional[str] = None,
     ) -> None:
         """
         Add a temporary document (cleared after query).
 
+        Only a text-less placeholder row is written to disk, so the document
+        does not survive a restart.
+
         Args:
             doc_id: Unique document identifier
             text: Document text content
             meta: Document metadata
+            scope: Request scope that owns the document
         """
         emb = self.embed(text)
+        record = {"doc_id": doc_id, "text": text, "meta": meta}
 
-        if self.embeddings is None:
-            self.embeddings = emb
-        else:
-            self.embeddings = np.vstack([self.embeddings, emb])
-
-        self.doc_ids.append(doc_id)
-        self.texts.append(text)
-        self.metas.append(meta)
-        self.temporary_doc_ids.add(doc_id)
-        self._save()
-
-    def clear_temporary_documents(self) -> None:
-        """Remove all temporary documents from the store."""
-        keep_ids = []
-        keep_texts = []
-        keep_metas = []
-
-        for i, doc_id in enumerate(self.doc_ids):
-            if doc_id not in self.temporary_doc_ids:
-                keep_ids.append(doc_id)
-                keep_texts.append(self.texts[i])
-                keep_metas.append(self.metas[i])
-
-        if keep_texts:
-            self.embeddings = self.embed(keep_texts)
-        else:
-            self.embeddings = None
+        with self._writing():
+            row = len(self.doc_ids)
+            # Register the row before it is published so other scopes never see it
+            previous = self._temp_rows
+            self._temp_rows = {**previous, scope: [*previous.get(scope, []), row]}
+            try:
+                self._add_rows(emb, [record], [self._placeholder_record(doc_id)])
+            except Exception:
+                self._temp_rows = previous
+                raise
+
+    @staticmethod
+    def _placeholder_record(doc_id: str) -> Dict[str, Any]:
+        """On-disk record for a temporary document."""
+        return {"doc_id": doc_id, "text": "", "meta": {}, "temporary": True}
+
+    def clear_temporary_documents(self, scope: Optional[str] = None) -> None:
+        """
+        Remove temporary documents from the store.
+
+        Rows are tombstoned in O(temporary docs) without re-embedding; the
+        space is reclaimed by a later vacuum.
+
+        Args:
+            scope: Only clear documents added with this scope
+                (defaults to all temporary documents)
+        """
+        with self._lock:
+            scopes = list(self._temp_rows) if scope is None else [scope]
+            rows = [row for key in scopes for row in self._temp_rows.get(key, [])]
+            if not rows:
+                return
 
-        self.doc_ids = keep_ids
-        self.texts = keep_texts
-        self.metas = keep_metas
-        self.temporary_doc_ids = set()
-        self._save()
+            # Copy-on-write so published snapshots keep their masks
+            dead = self._dead.copy()
+            dead[rows] = True
+            self._dead = dead
+            self._dead_count += len(rows)
+            self._temp_rows = {
+                key: value for key, value in self._temp_rows.items() if key not in scopes
+            }
+            # Texts are blanked in place; the rows are hidden from other scopes
+            for row in rows:
+                self.texts[row] = ""
+            self._publish()
+            self._maybe_schedule_compaction()
 
-    def search(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
+    def search(
+        self,
+        query: str,
+        k: int = 5,
+        nprobe: Optional[int] = None,
+        scope: Optional[str] = None,
+        filter: Optional[Dict[str, Any]] = None,
+        query_vector: Optional[np.ndarray] = None,
+        include_temporary: bool = True,
+    ) -> List[Dict[str, Any]]:
         """
         Search for similar documents.
 
         Args:
             query: Search query text
             k: Number of results to return
+            nprobe: IVF lists to scan (higher = better recall, slower)
+            scope: Request scope; temporary documents of other scopes are
+                hidden (all are visible when None)
+            filter: Metadata constraints, e.g. {"session_id": [sid, None]}
+                for one session's uploads plus shared documents; a list
+                accepts any of its values and None matches a missing field
+            query_vector: Precomputed embedding of query (skips embed())
+            include_temporary: False hides every temporary document,
+                whatever its scope
 
         Returns:
             List of search results with doc_id, text, meta, and score
         """
-        if self.embeddings is None or len(self.doc_ids) == 0:
+        return self.search_many(
+            [query],
+            k=k,
+            nprobe=nprobe,
+            scope=scope,
+            filter=filter,
+            query_vectors=None if query_vector is None else np.atleast_2d(query_vector),
+            include_temporary=include_temporary,
+        )[0]
+
+    def search_many(
+        self,
+        queries: List[str],
+        k: int = 5,
+        nprobe: Optional[int] = None,
+        scope: Optional[str] = None,
+        filter: Optional[Dict[str, Any]] = None,
+        query_vectors: Optional[np.ndarray] = None,
+        include_temporary: bool = True,
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Search for several queries at once.
+
+        All queries are embedded in one request and, on the exact path,
+        scored with a single matrix-matrix product per segment block.
+        Searches read the latest published snapshot and take no lock.
+
+        Args:
+            queries: Search query texts
+            k: Number of results to return per query
+            nprobe: IVF lists to scan (higher = better recall, slower)
+            scope: Request scope for temporary documents (see search)
+            filter: Metadata constraints (see search)
+            query_vectors: Precomputed embeddings, one row per query
+            include_temporary: False hides every temporary document (see search)
+
+        Returns:
+            One result list per query, in input order
+        """
+        queries = list(queries)
+        snap = self._snapshot
+        if not queries:
             return []
+        if snap.count == 0 or k <= 0:
+            return [[] for _ in queries]
+
+        count = snap.count
+        hidden = self._hidden_rows(snap, scope, include_temporary)
 
-        q = self.embed(query)[0]
-        sims = self.embeddings @ q
-        idx = np.argsort(-sims)[:k]
+        candidates = None
+        if filter:
+            candidates = self._filter_rows(snap, filter)
+            if len(candidates) == 0:
+                return [[] for _ in queries]
+            if len(candidates) > FILTER_SCAN_FRACTION * count:
+                # Broad filter: a masked full scan beats gathering the rows
+                excluded = np.ones(count, dtype=bool)
+                excluded[candidates] = False
+                hidden = excluded if hidden is None else hidden | excluded
+                candidates = None
 
+        q = self.embed(queries) if query_vectors is None else query_vectors
+        if candidates is not None:
+            if hidden is not None:
+                candidates = candidates[~hidden[candidates]]
+            sims = self._gather_rows(candidates, snap.blocks) @ q.T
+            return [
+                self._results(snap, candidates, sims[:, j], k)
+                for j in range(len(queries))
+            ]
+
+        return [
+            self._results(snap, rows, sims, k)
+            for rows, sims in self._score(q, snap, k, nprobe, hidden)
+        ]
+
+    @staticmethod
+    def _hidden_rows(
+        snap: _Snapshot, scope: Optional[str], include_temporary: bool = True
+    ) -> Optional[np.ndarray]:
+        """
+        Build the mask of rows a search must skip.
+
+        Args:
+            snap: Snapshot being searched
+            scope: Request scope; other scopes' temporary rows are hidden
+            include_temporary: False hides all temporary rows
+
+        Returns:
+            Boolean mask over rows, or None when every row is visible
+        """
+        others = []
+        if not include_temporary:
+            others = list(snap.temp_rows.values())
+        elif scope is not None:
+            others = [rows for key, rows in snap.temp_rows.items() if key != scope]
+        if not snap.dead_count and not any(others):
+            return None
+
+        hidden = snap.dead[: snap.count].copy()
+        for rows in others:
+            rows = np.asarray(rows, dtype=np.int64)
+            hidden[rows[rows < snap.count]] = True
+        return hidden
+
+    def _results(
+        self, snap: _Snapshot, rows: np.ndarray, sims: np.ndarray, k: int
+    ) -> List[Dict[str, Any]]:
+        """Build the top-k result dicts from scored candidate rows."""
         results = []
-        for i in idx:
+        for i in self._top_k(sims, k):
+            row = rows[i]
             results.append(
                 {
-                    "doc_id": self.doc_ids[i],
-                    "text": self.texts[i],
-                    "meta": self.metas[i],
+                    "doc_id": snap.doc_ids[row],
+                    "text": snap.texts[row],
+                    "meta": snap.metas[row],
                     "score": float(sims[i]),
                 }
             )
-
         return results
 
+    @staticmethod
+    def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+        """
+        Return the indices of the k highest scores, best first.
+
+        Uses an O(n) argpartition and only sorts the selected k.
+        """
+        if k >= len(scores):
+            return np.argsort(-scores)
+        idx = np.argpartition(-scores, k - 1)[:k]
+        return idx[np.argsort(-scores[idx])]
+
+    def _score(
+        self,
+        q: np.ndarray,
+        snap: _Snapshot,
+        k: int,
+        nprobe: Optional[int] = None,
+        hidden: Optional[np.ndarray] = None,
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Score candidate rows against a batch of query vectors.
+
+        Uses the IVF index when the store is large enough, plus any rows
+        appended after the index was built. Otherwise every row is scored:
+        with one matrix product per block, or, when segments are quantized,
+        with a coarse pass over the quantized copies followed by exact
+        float32 re-scoring of the best k * RERANK_FACTOR rows.
+
+        Args:
+            q: Query matrix of shape (queries, dim)
+            snap: Snapshot to score
+            k: Number of results wanted per query
+            nprobe: IVF lists to scan
+            hidden: Mask of rows to skip
+
+        Returns:
+            One (row ids, similarity scores) tuple per query
+        """
+        count, blocks, coarse = snap.count, snap.blocks, snap.coarse
+        ann = snap.ann
+        if ann is not None and count >= ANN_MIN_ROWS:
+            # Writers keep adding to the live index; ignore rows past the snapshot
+            tail = np.arange(min(ann.ntotal, count), count)
+            scored = []
+            for vec in q:
+                rows = np.concatenate([ann.candidates(vec, nprobe or self.nprobe), tail])
+                rows = rows[rows < count]
+                if hidden is not None:
+                    rows = rows[~hidden[rows]]
+                if len(rows) < k:
+                    break
+                rows.sort()
+                scored.append((rows, self._gather_rows(rows, blocks) @ vec))
+            else:
+                return scored
+
+        if not any(codes.dtype != np.float32 for codes, _ in coarse):
+            sims = np.concatenate([q @ block.T for block in blocks], axis=1)
+            rows = np.arange(count)
+            if hidden is None:
+                return [(rows, sims[j]) for j in range(q.shape[0])]
+            visible = ~hidden[:count]
+            return [(rows[visible], sims[j][visible]) for j in range(q.shape[0])]
+
+        sims = self._coarse_scores(q, coarse)
+        if hidden is not None:
+            sims[:, hidden[:count]] = -np.inf
+
+        scored = []
+        for j, vec in enumerate(q):
+            rows = self._top_k(sims[j], max(k, k * RERANK_FACTOR))
+            rows = np.sort(rows[np.isfinite(sims[j][rows])])
+            scored.append((rows, self._gather_rows(rows, blocks) @ vec))
+        return scored
+
+    @staticmethod
+    def _coarse_scores(
+        q: np.ndarray, coarse: List[Tuple[np.ndarray, Optional[np.ndarray]]]
+    ) -> np.ndarray:
+        """
+        Approximate similarities of every row from the quantized blocks.
+
+        Codes are dequantized QUANTIZED_SCAN_ROWS at a time so the scan never
+        materializes a full float32 copy of a segment.
+        """
+        parts = []
+        for codes, scale in coarse:
+            if codes.dtype == np.float32:
+                parts.append(q @ codes.T)
+                continue
+            for start in range(0, len(codes), QUANTIZED_SCAN_ROWS):
+                chunk = np.asarray(codes[start : start + QUANTIZED_SCAN_ROWS], dtype=np.float32)
+                sims = q @ chunk.T
+                if scale is not None:
+                    sims *= scale[start : start + QUANTIZED_SCAN_ROWS]
+                parts.append(sims)
+        return np.concatenate(parts, axis=1)
+
     def save_index(self) -> None:
-        """Explicitly save the index to disk."""
-        self._save()
+        """
+        Explicitly save the index to disk.
+
+        Documents are persisted as they are added; this only refreshes the
+        manifest and the ANN index.
+        """
+        with self._writing():
+            self._write_manifest()
+            self._save_ann()
+
+    def has_documents(self, filter: Dict[str, Any]) -> bool:
+        """
+        Check whether any live document matches a metadata filter.
+
+        Args:
+            filter: Metadata constraints (see search)
+        """
+        snap = self._snapshot
+        rows = self._filter_rows(snap, filter)
+        return bool(len(rows)) and not snap.dead[rows].all()
 
     def get_document_count(self) -> int:
         """Get the number of documents in the store."""
-        return len(self.doc_ids)
+        snap = self._snapshot
+        return snap.count - snap.dead_count